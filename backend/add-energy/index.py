@@ -5,9 +5,8 @@ Returns: HTTP response with new energy balance
 '''
 
 import json
-import os
-import psycopg2
 from typing import Dict, Any
+from db_utils import get_connection
 
 def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     method: str = event.get('httpMethod', 'GET')
@@ -45,12 +44,7 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             'isBase64Encoded': False
         }
     
-    dsn = os.environ.get('TIMEWEB_DB_URL')
-    if dsn and '?' in dsn:
-        dsn += '&sslmode=require'
-    elif dsn:
-        dsn += '?sslmode=require'
-    conn = psycopg2.connect(dsn)
+    conn = get_connection()
     cur = conn.cursor()
     
     safe_amount = str(int(amount)).replace("'", "''")
@@ -1,7 +1,7 @@
 import json
-import os
-import psycopg2
 from typing import Dict, Any
+from db_utils import get_connection
+from timeline_cache import timeline
 
 def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     '''
@@ -46,12 +46,7 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             'isBase64Encoded': False
         }
     
-    dsn = os.environ.get('TIMEWEB_DB_URL')
-    if dsn and '?' in dsn:
-        dsn += '&sslmode=require'
-    elif dsn:
-        dsn += '?sslmode=require'
-    conn = psycopg2.connect(dsn)
+    conn = get_connection()
     cur = conn.cursor()
     
     safe_message_id = str(message_id).replace("'", "''")
@@ -68,17 +63,30 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
         cur.execute(
             f"DELETE FROM message_reactions WHERE id = '{safe_existing_id}'"
         )
+        # Счётчик для ленты обновляем в той же транзакции
+        cur.execute(
+            f"UPDATE message_reaction_counts SET count = count - 1 WHERE message_id = '{safe_message_id}' AND emoji = '{safe_emoji}'"
+        )
+        cur.execute(
+            f"DELETE FROM message_reaction_counts WHERE message_id = '{safe_message_id}' AND emoji = '{safe_emoji}' AND count <= 0"
+        )
         action = 'removed'
     else:
         cur.execute(
             f"INSERT INTO message_reactions (message_id, user_id, emoji) VALUES ('{safe_message_id}', '{safe_user_id}', '{safe_emoji}')"
         )
+        cur.execute(
+            f"INSERT INTO message_reaction_counts (message_id, emoji, count) VALUES ('{safe_message_id}', '{safe_emoji}', 1) "
+            f"ON CONFLICT (message_id, emoji) DO UPDATE SET count = message_reaction_counts.count + 1"
+        )
         action = 'added'
     
     conn.commit()
     cur.close()
     conn.close()
     
+    timeline.apply_reaction(int(message_id), emoji, 1 if action == 'added' else -1)
+    
     return {
         'statusCode': 200,
         'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
@@ -1,7 +1,8 @@
 import json
 import os
-import psycopg2
 from typing import Dict, Any
+from db_utils import get_connection
+from timeline_cache import timeline
 
 def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     '''
@@ -25,12 +26,7 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             'isBase64Encoded': False
         }
     
-    dsn = os.environ.get('TIMEWEB_DB_URL')
-    if dsn and '?' in dsn:
-        dsn += '&sslmode=require'
-    elif dsn:
-        dsn += '?sslmode=require'
-    conn = psycopg2.connect(dsn)
+    conn = get_connection()
     cur = conn.cursor()
     
     if method == 'GET':
@@ -111,9 +107,36 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
         
     elif action == 'delete':
         cur.execute(f"DELETE FROM messages WHERE user_id = '{safe_target_id}'")
-        cur.execute(f"DELETE FROM message_reactions WHERE user_id = '{safe_target_id}'")
+        # Реакции пользователя на чужие сообщения снимаем и со счётчиков ленты
+        # (message_reaction_counts) — в той же транзакции, как add-reaction
+        cur.execute(f"""
+            WITH removed AS (
+                DELETE FROM message_reactions WHERE user_id = '{safe_target_id}'
+                RETURNING message_id, emoji
+            ),
+            removed_counts AS (
+                SELECT message_id, emoji, COUNT(*) AS removed
+                FROM removed
+                WHERE message_id IS NOT NULL
+                GROUP BY message_id, emoji
+            )
+            UPDATE message_reaction_counts rc
+            SET count = rc.count - r.removed
+            FROM removed_counts r
+            WHERE rc.message_id = r.message_id AND rc.emoji = r.emoji
+            RETURNING rc.message_id, rc.emoji, r.removed
+        """)
+        removed_reactions = cur.fetchall()
+        if removed_reactions:
+            cur.execute(
+                "DELETE FROM message_reaction_counts WHERE message_id = ANY(%s) AND count <= 0",
+                (list({row[0] for row in removed_reactions}),)
+            )
         cur.execute(f"DELETE FROM users WHERE id = '{safe_target_id}'")
         conn.commit()
+        timeline.remove_author(int(target_user_id))
+        for reaction_message_id, emoji, removed in removed_reactions:
+            timeline.apply_reaction(reaction_message_id, emoji, -removed)
         result = {'message': 'User deleted', 'success': True}
         
     else:
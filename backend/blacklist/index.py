@@ -5,9 +5,9 @@ Args: event - dict with httpMethod, queryStringParameters, headers
 Returns: HTTP response dict with blocked users list or action result
 """
 import json
-import os
-import psycopg2
 from typing import Dict, Any
+from db_utils import get_connection
+from block_cache import block_cache
 
 def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     method: str = event.get('httpMethod', 'GET')
@@ -37,12 +37,7 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             'isBase64Encoded': False
         }
     
-    dsn = os.environ.get('TIMEWEB_DB_URL')
-    if dsn and '?' in dsn:
-        dsn += '&sslmode=require'
-    elif dsn:
-        dsn += '?sslmode=require'
-    conn = psycopg2.connect(dsn)
+    conn = get_connection()
     
     try:
         if method == 'GET':
@@ -99,6 +94,7 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                     ON CONFLICT (user_id, blocked_user_id) DO NOTHING
                 ''')
                 conn.commit()
+            block_cache.record_block(user_id, blocked_user_id)
             
             return {
                 'statusCode': 200,
@@ -128,6 +124,7 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                     WHERE user_id = '{safe_user_id}' AND blocked_user_id = '{safe_blocked_id}'
                 ''')
                 conn.commit()
+            block_cache.record_unblock(user_id, blocked_user_id)
             
             return {
                 'statusCode': 200,
@@ -0,0 +1,234 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, FrozenSet, List, Optional, Tuple
+
+from psycopg2 import extensions
+
+# Проверка блокировки перед отправкой личного сообщения без запроса к blacklist.
+# Два уровня: Bloom-фильтр по всем парам (кто, кого) — «точно не заблокирован» без
+# обращения к чему-либо ещё, это почти все отправки; при срабатывании фильтра —
+# множество заблокированных пользователем (LRU по пользователям). blacklist меняет
+# только функция blacklist, она сразу обновляет кэш своего процесса; изменения из других
+# процессов подхватываются, когда фильтр и множества устаревают (BLOCK_CACHE_TTL).
+# BLOCK_CACHE_SIZE=0 отключает кэш, BLOCK_BLOOM_BITS=0 — только фильтр
+BLOCK_CACHE_SIZE = int(os.environ.get('BLOCK_CACHE_SIZE', '10000'))
+BLOCK_CACHE_TTL = float(os.environ.get('BLOCK_CACHE_TTL', '60'))
+BLOCK_BLOOM_BITS = int(os.environ.get('BLOCK_BLOOM_BITS', str(1 << 20)))
+BLOCK_BLOOM_HASHES = 4
+
+
+class BloomFilter:
+    """
+    Fixed-size Bloom filter over (user_id, blocked_user_id) pairs: no false negatives,
+    false positives fall through to the exact per-user sets
+    """
+
+    def __init__(self, bits: int, hashes: int = BLOCK_BLOOM_HASHES):
+        self.bits = bits
+        self.hashes = hashes
+        self._array = bytearray((bits + 7) // 8)
+        self.count = 0
+
+    def _positions(self, user_id: int, blocked_id: int):
+        # Двойное хеширование: k позиций из двух хешей пары
+        h1 = hash((user_id, blocked_id))
+        h2 = hash((blocked_id, user_id, 0x9E3779B9)) | 1
+        return [(h1 + i * h2) % self.bits for i in range(self.hashes)]
+
+    def add(self, user_id: int, blocked_id: int) -> None:
+        for pos in self._positions(user_id, blocked_id):
+            self._array[pos >> 3] |= 1 << (pos & 7)
+        self.count += 1
+
+    def __contains__(self, pair) -> bool:
+        return all(self._array[pos >> 3] & (1 << (pos & 7)) for pos in self._positions(*pair))
+
+    def fill_ratio(self) -> float:
+        return bin(int.from_bytes(self._array, 'little')).count('1') / self.bits
+
+
+class BlockCache:
+    def __init__(self, size: int = BLOCK_CACHE_SIZE, ttl: float = BLOCK_CACHE_TTL, bloom_bits: int = BLOCK_BLOOM_BITS):
+        self.size = max(0, size)
+        self.ttl = ttl
+        self.bloom_bits = max(0, bloom_bits)
+        # user_id -> (кого заблокировал, время загрузки)
+        self._sets: 'OrderedDict[int, tuple]' = OrderedDict()
+        self._bloom = None
+        self._bloom_built_at = 0.0
+        # Блокировки, записанные, пока идёт пересборка фильтра: новый фильтр собран из
+        # снимка blacklist и без них потерял бы пары, добавленные после снимка
+        self._pending_blocks: Optional[List[Tuple[int, int]]] = None
+        # Счётчик записей: множество, прочитанное до record_block/record_unblock, не кэшируется
+        self._generation = 0
+        self._lock = threading.Lock()
+        self._rebuild_lock = threading.Lock()
+        self._stats = {
+            'checks': 0, 'checks_without_query': 0, 'bloom_negative': 0, 'hits': 0, 'misses': 0,
+            'bloom_rebuilds': 0, 'invalidations': 0, 'evicted': 0,
+        }
+
+    @property
+    def enabled(self) -> bool:
+        return self.size > 0
+
+    def _cursor(self, conn: Any):
+        # Обычный курсор (кортежи) — main.py отдаёт соединения с RealDictCursor
+        return conn.cursor(cursor_factory=extensions.cursor)
+
+    def _ensure_bloom(self, conn: Any) -> bool:
+        """
+        (Re)build the filter from the whole blacklist when missing or older than ttl.
+        Only one thread rebuilds; the others keep using the current filter (or wait
+        for the first one). Returns True if the database was queried
+        """
+        if not self.bloom_bits:
+            return False
+        if self._bloom is not None and time.monotonic() - self._bloom_built_at < self.ttl:
+            return False
+        if not self._rebuild_lock.acquire(blocking=self._bloom is None):
+            return False
+        try:
+            if self._bloom is not None and time.monotonic() - self._bloom_built_at < self.ttl:
+                return False
+            with self._lock:
+                self._pending_blocks = []
+            try:
+                cur = self._cursor(conn)
+                cur.execute("SELECT user_id, blocked_user_id FROM blacklist")
+                bloom = BloomFilter(self.bloom_bits)
+                for user_id, blocked_id in cur.fetchall():
+                    bloom.add(user_id, blocked_id)
+                cur.close()
+            except Exception:
+                with self._lock:
+                    self._pending_blocks = None
+                raise
+            with self._lock:
+                for user_id, blocked_id in self._pending_blocks:
+                    bloom.add(user_id, blocked_id)
+                self._pending_blocks = None
+                self._bloom = bloom
+                self._bloom_built_at = time.monotonic()
+                self._stats['bloom_rebuilds'] += 1
+            return True
+        finally:
+            self._rebuild_lock.release()
+
+    def blocked_by(self, conn: Any, user_id: int) -> FrozenSet[int]:
+        """
+        Users blocked by user_id, from the cache or one indexed query
+        """
+        return self._blocked_by(conn, user_id)[0]
+
+    def _blocked_by(self, conn: Any, user_id: int) -> Tuple[FrozenSet[int], bool]:
+        now = time.monotonic()
+        with self._lock:
+            entry = self._sets.get(user_id)
+            if entry is not None and now - entry[1] < self.ttl:
+                self._sets.move_to_end(user_id)
+                self._stats['hits'] += 1
+                return entry[0], False
+            self._stats['misses'] += 1
+            generation = self._generation
+        cur = self._cursor(conn)
+        cur.execute("SELECT blocked_user_id FROM blacklist WHERE user_id = %s", (user_id,))
+        blocked = frozenset(row[0] for row in cur.fetchall())
+        cur.close()
+        with self._lock:
+            if generation != self._generation:
+                # За время запроса blacklist менялся — результат мог устареть, не кэшируем
+                return blocked, True
+            self._sets[user_id] = (blocked, now)
+            self._sets.move_to_end(user_id)
+            while len(self._sets) > self.size:
+                self._sets.popitem(last=False)
+                self._stats['evicted'] += 1
+        return blocked, True
+
+    def is_blocked(self, conn: Any, user_a: int, user_b: int) -> bool:
+        """
+        True if either user blocked the other
+        """
+        user_a, user_b = int(user_a), int(user_b)
+        if not self.enabled:
+            cur = self._cursor(conn)
+            cur.execute("""
+                SELECT EXISTS (
+                    SELECT 1 FROM blacklist
+                    WHERE (user_id = %s AND blocked_user_id = %s)
+                       OR (user_id = %s AND blocked_user_id = %s)
+                )
+            """, (user_a, user_b, user_b, user_a))
+            blocked = cur.fetchone()[0]
+            cur.close()
+            return blocked
+        
+        queried = self._ensure_bloom(conn)
+        bloom = self._bloom
+        if bloom is not None and (user_a, user_b) not in bloom and (user_b, user_a) not in bloom:
+            self._count_check(queried, bloom_negative=True)
+            return False
+        blocked_by_a, queried_a = self._blocked_by(conn, user_a)
+        blocked = user_b in blocked_by_a
+        if not blocked:
+            blocked_by_b, queried_b = self._blocked_by(conn, user_b)
+            blocked = user_a in blocked_by_b
+            queried_a = queried_a or queried_b
+        self._count_check(queried or queried_a)
+        return blocked
+
+    def _count_check(self, queried: bool, bloom_negative: bool = False) -> None:
+        with self._lock:
+            self._stats['checks'] += 1
+            if not queried:
+                self._stats['checks_without_query'] += 1
+            if bloom_negative:
+                self._stats['bloom_negative'] += 1
+
+    def record_block(self, user_id: int, blocked_id: int) -> None:
+        """
+        Write-through after blacklist INSERT commits
+        """
+        user_id, blocked_id = int(user_id), int(blocked_id)
+        with self._lock:
+            if self._bloom is not None:
+                self._bloom.add(user_id, blocked_id)
+            if self._pending_blocks is not None:
+                self._pending_blocks.append((user_id, blocked_id))
+            self._drop(user_id)
+
+    def record_unblock(self, user_id: int, blocked_id: int) -> None:
+        """
+        After blacklist DELETE commits. The Bloom filter keeps the pair until the next
+        rebuild — that is only a false positive resolved by the exact set
+        """
+        with self._lock:
+            self._drop(int(user_id))
+
+    def _drop(self, user_id: int) -> None:
+        self._generation += 1
+        if self._sets.pop(user_id, None) is not None:
+            self._stats['invalidations'] += 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            checks = self._stats['checks']
+            lookups = self._stats['hits'] + self._stats['misses']
+            bloom = self._bloom
+            return {
+                'enabled': self.enabled,
+                'users_cached': len(self._sets),
+                'capacity': self.size,
+                'bloom_pairs': bloom.count if bloom else 0,
+                'bloom_bits': self.bloom_bits,
+                'bloom_fill_ratio': round(bloom.fill_ratio(), 6) if bloom else 0.0,
+                'no_query_rate': round(self._stats['checks_without_query'] / checks, 4) if checks else 0.0,
+                'hit_rate': round(self._stats['hits'] / lookups, 4) if lookups else 0.0,
+                **self._stats,
+            }
+
+
+block_cache = BlockCache()
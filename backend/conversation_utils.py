@@ -0,0 +1,189 @@
+from typing import Any, Optional, Tuple
+
+# Диалоги (таблица conversations): одна строка на упорядоченную пару пользователей.
+# Ключ пары не зависит от того, кто отправитель, поэтому обе стороны переписки
+# попадают в один диапазон индекса private_messages(conversation_id, created_at, id)
+
+
+def pair_key(user_a: int, user_b: int) -> Tuple[int, int]:
+    user_a, user_b = int(user_a), int(user_b)
+    return (user_a, user_b) if user_a <= user_b else (user_b, user_a)
+
+
+def _first(row: Any, column: str = 'id') -> Any:
+    # Работает и с обычным курсором, и с RealDictCursor (main.py)
+    if row is None:
+        return None
+    return row[column] if isinstance(row, dict) else row[0]
+
+
+def find_conversation(cur: Any, user_a: int, user_b: int) -> Optional[int]:
+    """
+    Conversation id for the pair, or None if they never exchanged messages
+    """
+    cur.execute(
+        "SELECT id FROM conversations WHERE user_low_id = %s AND user_high_id = %s",
+        pair_key(user_a, user_b)
+    )
+    return _first(cur.fetchone())
+
+
+def get_or_create_conversation(cur: Any, user_a: int, user_b: int) -> int:
+    """
+    Conversation id for the pair, creating the row on the first message.
+    Runs inside the caller's transaction
+    """
+    conversation_id = find_conversation(cur, user_a, user_b)
+    if conversation_id is not None:
+        return conversation_id
+    cur.execute("""
+        INSERT INTO conversations (user_low_id, user_high_id)
+        VALUES (%s, %s)
+        ON CONFLICT (user_low_id, user_high_id) DO NOTHING
+        RETURNING id
+    """, pair_key(user_a, user_b))
+    conversation_id = _first(cur.fetchone())
+    if conversation_id is None:
+        # Параллельный запрос создал диалог между SELECT и INSERT
+        conversation_id = find_conversation(cur, user_a, user_b)
+    return conversation_id
+
+
+# conversation_summaries: строка на (пользователь, собеседник) для входящих,
+# user_unread_counters: общее число непрочитанных для значка.
+# Пишутся в транзакции, которая меняет private_messages, поэтому не расходятся
+# с перепиской; scripts/rebuild_conversation_summaries.py и
+# scripts/reconcile_unread_counters.py пересчитывают их с нуля
+
+
+def _add_unread(cur: Any, user_id: int, delta: int) -> None:
+    cur.execute("""
+        INSERT INTO user_unread_counters AS c (user_id, unread_count)
+        VALUES (%s, GREATEST(%s, 0))
+        ON CONFLICT (user_id) DO UPDATE SET
+            unread_count = GREATEST(c.unread_count + %s, 0),
+            updated_at = (CURRENT_TIMESTAMP AT TIME ZONE 'UTC')
+    """, (user_id, delta, delta))
+
+def record_message(
+    cur: Any,
+    conversation_id: int,
+    sender_id: int,
+    receiver_id: int,
+    message_id: int,
+    text: str,
+    created_at: Any
+) -> None:
+    """
+    Make the new message the last one for both sides and count it as unread
+    for the receiver. An older message committed late does not replace a newer preview,
+    and is not counted if the receiver's read watermark has already passed its id
+    """
+    sender_id, receiver_id = int(sender_id), int(receiver_id)
+    rows = [(sender_id, receiver_id, 0)]
+    if receiver_id != sender_id:
+        rows.append((receiver_id, sender_id, 1))
+    values_sql = ', '.join(['(%s, %s, %s, %s, %s, %s, %s)'] * len(rows))
+    args = []
+    for user_id, peer_id, unread in rows:
+        args += [user_id, peer_id, conversation_id, message_id, text, created_at, unread]
+    cur.execute(f"""
+        INSERT INTO conversation_summaries AS cs
+            (user_id, peer_id, conversation_id, last_message_id, last_message, last_message_at, unread_count)
+        VALUES {values_sql}
+        ON CONFLICT (user_id, peer_id) DO UPDATE SET
+            conversation_id = EXCLUDED.conversation_id,
+            last_message_id = CASE WHEN cs.last_message_at IS NULL
+                OR (EXCLUDED.last_message_at, EXCLUDED.last_message_id) > (cs.last_message_at, cs.last_message_id)
+                THEN EXCLUDED.last_message_id ELSE cs.last_message_id END,
+            last_message = CASE WHEN cs.last_message_at IS NULL
+                OR (EXCLUDED.last_message_at, EXCLUDED.last_message_id) > (cs.last_message_at, cs.last_message_id)
+                THEN EXCLUDED.last_message ELSE cs.last_message END,
+            last_message_at = GREATEST(cs.last_message_at, EXCLUDED.last_message_at),
+            unread_count = cs.unread_count + CASE
+                WHEN EXCLUDED.last_message_id > COALESCE(cs.last_read_message_id, 0)
+                THEN EXCLUDED.unread_count ELSE 0 END
+        RETURNING cs.user_id, COALESCE(cs.last_read_message_id, 0) < %s AS counted
+    """, args + [message_id])
+    # Коммиты идут не по порядку id: сообщение, закоммиченное после того, как получатель
+    # прочитал диалог дальше него, уже прочитано — общий счётчик не трогаем
+    for row in cur.fetchall():
+        user_id, counted = (row['user_id'], row['counted']) if isinstance(row, dict) else row
+        if user_id == receiver_id != sender_id and counted:
+            _add_unread(cur, receiver_id, 1)
+
+
+def forget_message(
+    cur: Any,
+    conversation_id: Optional[int],
+    receiver_id: int,
+    sender_id: int,
+    message_id: int
+) -> None:
+    """
+    Call after deleting a message: drop it from the receiver's unread count if it was
+    past their read watermark and, if it was the preview, fall back to the previous
+    message of the conversation
+    """
+    cur.execute("""
+        UPDATE conversation_summaries
+        SET unread_count = unread_count - 1
+        WHERE user_id = %s AND peer_id = %s AND unread_count > 0
+          AND COALESCE(last_read_message_id, 0) < %s
+    """, (receiver_id, sender_id, message_id))
+    if cur.rowcount:
+        _add_unread(cur, receiver_id, -1)
+    if conversation_id is None:
+        return
+    cur.execute("""
+        UPDATE conversation_summaries cs
+        SET last_message_id = l.id, last_message = l.text, last_message_at = l.created_at
+        FROM (
+            SELECT id, text, created_at FROM private_messages
+            WHERE conversation_id = %s
+            ORDER BY created_at DESC, id DESC
+            LIMIT 1
+        ) l
+        WHERE cs.conversation_id = %s AND cs.last_message_id = %s
+    """, (conversation_id, conversation_id, message_id))
+    # Сообщений в диалоге не осталось — он пропадает из входящих, как и раньше
+    cur.execute("""
+        DELETE FROM conversation_summaries
+        WHERE conversation_id = %s AND last_message_id = %s
+    """, (conversation_id, message_id))
+
+
+def mark_conversation_read(cur: Any, user_id: int, peer_id: int, last_read_message_id: int) -> bool:
+    """
+    Move the user's read watermark in the conversation with peer_id forward to
+    last_read_message_id: messages from the peer with id <= watermark are read.
+    One summary row is updated however many messages were unread; the unread count
+    is recounted only if something newer than the watermark arrived meanwhile.
+    Returns False if the watermark was already there
+    """
+    cur.execute("""
+        WITH old AS (
+            SELECT user_id, peer_id, unread_count
+            FROM conversation_summaries
+            WHERE user_id = %(user_id)s AND peer_id = %(peer_id)s
+              AND COALESCE(last_read_message_id, 0) < %(watermark)s
+            FOR UPDATE
+        )
+        UPDATE conversation_summaries cs
+        SET last_read_message_id = %(watermark)s,
+            unread_count = CASE WHEN cs.last_message_id <= %(watermark)s THEN 0 ELSE (
+                SELECT COUNT(*) FROM private_messages pm
+                WHERE pm.conversation_id = cs.conversation_id
+                  AND pm.sender_id = cs.peer_id AND pm.id > %(watermark)s
+            ) END
+        FROM old
+        WHERE cs.user_id = old.user_id AND cs.peer_id = old.peer_id
+        RETURNING old.unread_count - cs.unread_count AS marked
+    """, {'user_id': user_id, 'peer_id': peer_id, 'watermark': last_read_message_id})
+    row = cur.fetchone()
+    if row is None:
+        return False
+    marked = _first(row, 'marked')
+    if marked:
+        _add_unread(cur, user_id, -marked)
+    return True
@@ -0,0 +1,92 @@
+import base64
+import json
+from datetime import datetime
+from typing import Any, Dict, Optional, Tuple
+
+# Keyset-пагинация по (created_at, id): курсор — непрозрачная строка для клиента,
+# внутри — направление и позиция последней отданной строки
+DIRECTIONS = ('before', 'after')
+
+
+def encode_cursor(direction: str, created_at: datetime, row_id: int) -> str:
+    """
+    Pack a (created_at, id) position into an opaque url-safe token
+    """
+    payload = json.dumps([direction, created_at.isoformat(), int(row_id)], separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decode_cursor(token: str) -> Tuple[str, datetime, int]:
+    """
+    Unpack a token produced by encode_cursor. Raises ValueError if it is malformed
+    """
+    try:
+        padded = token + '=' * (-len(token) % 4)
+        direction, created_at, row_id = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+        if direction not in DIRECTIONS:
+            raise ValueError(direction)
+        return direction, datetime.fromisoformat(created_at), int(row_id)
+    except Exception as e:
+        raise ValueError(f'Invalid cursor: {token}') from e
+
+
+def parse_page_params(params: Dict[str, Any]) -> Optional[Tuple[str, Optional[datetime], int]]:
+    """
+    Read cursor / before_id / after_id query params.
+    Returns (direction, created_at or None, id) or None when the client uses plain offset.
+    created_at is None for before_id/after_id — the SQL then looks the position up by id
+    """
+    if params.get('cursor'):
+        return decode_cursor(params['cursor'])
+    for direction in DIRECTIONS:
+        value = params.get(f'{direction}_id')
+        if value:
+            try:
+                return direction, None, int(value)
+            except (TypeError, ValueError) as e:
+                raise ValueError(f'Invalid {direction}_id: {value}') from e
+    return None
+
+
+def keyset_clause(page: Tuple[str, Optional[datetime], int], table_alias: str, table: str) -> Tuple[str, list]:
+    """
+    Build the WHERE condition for a page: (created_at, id) strictly before/after the cursor row.
+    For before_id/after_id the row is looked up by id; if it is gone (deleted message,
+    since_id=0) the nearest existing row on the far side of that id stands in for it,
+    which amounts to comparing ids since they grow together with created_at
+    """
+    direction, created_at, row_id = page
+    op = '<' if direction == 'before' else '>'
+    if created_at is None:
+        # after: последняя строка с id <= row_id (нет такой — с самого начала),
+        # before: первая строка с id >= row_id (нет такой — с самого конца)
+        if direction == 'after':
+            anchor_sql = f'FROM {table} WHERE id <= %s ORDER BY id DESC LIMIT 1'
+            missing_at, missing_id = "'-infinity'", '0'
+        else:
+            anchor_sql = f'FROM {table} WHERE id >= %s ORDER BY id ASC LIMIT 1'
+            missing_at, missing_id = "'infinity'", '%s'
+        return (
+            f'({table_alias}.created_at, {table_alias}.id) {op} ('
+            f'COALESCE((SELECT created_at {anchor_sql}), {missing_at}), '
+            f'COALESCE((SELECT id {anchor_sql}), {missing_id}))',
+            [row_id, row_id] + ([row_id] if missing_id == '%s' else [])
+        )
+    return f'({table_alias}.created_at, {table_alias}.id) {op} (%s, %s)', [created_at, row_id]
+
+
+def encode_distance_cursor(distance_km: float, row_id: int) -> str:
+    """
+    Opaque token for distance-ordered pages (nearest first): position is (distance_km, id)
+    """
+    payload = json.dumps([float(distance_km), int(row_id)], separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decode_distance_cursor(token: str) -> Tuple[float, int]:
+    try:
+        padded = token + '=' * (-len(token) % 4)
+        distance_km, row_id = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+        return float(distance_km), int(row_id)
+    except Exception as e:
+        raise ValueError(f'Invalid cursor: {token}') from e
@@ -0,0 +1,327 @@
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Any, Dict, List, Optional
+
+import psycopg2
+from psycopg2 import extensions
+
+# Настройки пула (переопределяются через переменные окружения). max_size + max_overflow —
+# жёсткий предел соединений процесса: потоков обработчиков (WorkerPools.db_connection_demand)
+# больше, и сверх предела они ждут соединение до POOL_TIMEOUT, затем PoolExhausted
+POOL_MIN_SIZE = int(os.environ.get('DB_POOL_MIN_SIZE', '2'))
+POOL_MAX_SIZE = int(os.environ.get('DB_POOL_MAX_SIZE', '10'))
+POOL_MAX_OVERFLOW = int(os.environ.get('DB_POOL_MAX_OVERFLOW', '10'))
+POOL_TIMEOUT = float(os.environ.get('DB_POOL_TIMEOUT', '10'))
+POOL_MAX_LIFETIME = float(os.environ.get('DB_POOL_MAX_LIFETIME', '1800'))
+POOL_HEALTH_CHECK_INTERVAL = float(os.environ.get('DB_POOL_HEALTH_CHECK_INTERVAL', '30'))
+
+
+class PoolExhausted(Exception):
+    """Raised when no connection became available within the pool timeout"""
+
+
+def build_dsn(dsn: Optional[str] = None) -> Optional[str]:
+    """
+    Return TIMEWEB_DB_URL (or the given dsn) with sslmode=require appended
+    """
+    dsn = dsn or os.environ.get('TIMEWEB_DB_URL')
+    if not dsn or 'sslmode=' in dsn:
+        return dsn
+    return dsn + ('&' if '?' in dsn else '?') + 'sslmode=require'
+
+
+class PooledConnection:
+    """
+    Thin proxy around a psycopg2 connection borrowed from the pool.
+    Everything is delegated to the real connection except close(),
+    which returns the connection to the pool instead of closing it.
+    """
+
+    def __init__(self, pool: 'ConnectionPool', raw: Any, created_at: float):
+        self._pool = pool
+        self._raw = raw
+        self._created_at = created_at
+
+    def __getattr__(self, name: str) -> Any:
+        raw = self.__dict__.get('_raw')
+        if raw is None:
+            raise psycopg2.InterfaceError('connection already returned to pool')
+        return getattr(raw, name)
+
+    @property
+    def closed(self) -> int:
+        return 1 if self._raw is None else self._raw.closed
+
+    def close(self) -> None:
+        raw, self._raw = self._raw, None
+        if raw is not None:
+            self._pool._release(raw, self._created_at)
+
+    def __del__(self) -> None:
+        # Обработчик упал до conn.close() — всё равно возвращаем соединение в пул.
+        # Сборщик мусора может сработать в потоке, который держит блокировку пула,
+        # поэтому здесь соединение только ставится в очередь, а возвращает его getconn()
+        try:
+            raw, self._raw = self._raw, None
+            if raw is not None:
+                self._pool._release_later(raw, self._created_at)
+        except Exception:
+            pass
+
+
+class ConnectionPool:
+    """
+    Process-wide, size-bounded pool of PostgreSQL connections.
+
+    - min_size connections are opened up front and kept warm
+    - up to max_size idle connections are kept for reuse
+    - up to max_overflow extra connections may be opened under burst load;
+      they are closed on release instead of being kept idle
+    - checkout blocks up to timeout seconds when max_size + max_overflow
+      connections are in use, then raises PoolExhausted
+    - connections older than max_lifetime are recycled, and connections idle
+      longer than health_check_interval are pinged with SELECT 1 on checkout
+    """
+
+    def __init__(
+        self,
+        dsn: str,
+        min_size: int = POOL_MIN_SIZE,
+        max_size: int = POOL_MAX_SIZE,
+        max_overflow: int = POOL_MAX_OVERFLOW,
+        timeout: float = POOL_TIMEOUT,
+        max_lifetime: float = POOL_MAX_LIFETIME,
+        health_check_interval: float = POOL_HEALTH_CHECK_INTERVAL,
+        connect_kwargs: Optional[Dict[str, Any]] = None
+    ):
+        if not dsn:
+            raise ValueError('TIMEWEB_DB_URL is not set')
+        self.dsn = dsn
+        self.min_size = max(0, min(min_size, max_size))
+        self.max_size = max(1, max_size)
+        self.max_overflow = max(0, max_overflow)
+        self.timeout = timeout
+        self.max_lifetime = max_lifetime
+        self.health_check_interval = health_check_interval
+        self.connect_kwargs = connect_kwargs or {}
+
+        # Idle connections: list of (raw_conn, created_at, returned_at), LIFO
+        self._idle: List[tuple] = []
+        # Connections of proxies collected without close(): (raw_conn, created_at).
+        # deque.append is atomic, so __del__ never touches the lock
+        self._orphans: deque = deque()
+        self._in_use = 0
+        self._closed = False
+        self._cond = threading.Condition(threading.Lock())
+        self._stats = {
+            'checkouts': 0,
+            'connects': 0,
+            'recycled': 0,
+            'health_check_failures': 0,
+            'timeouts': 0,
+            'overflow_closed': 0,
+        }
+
+        for _ in range(self.min_size):
+            raw = self._connect()
+            now = time.monotonic()
+            self._idle.append((raw, now, now))
+
+    def _count(self, stat: str) -> None:
+        with self._cond:
+            self._stats[stat] += 1
+
+    def _connect(self) -> Any:
+        raw = psycopg2.connect(self.dsn, **self.connect_kwargs)
+        self._count('connects')
+        return raw
+
+    def _discard(self, raw: Any) -> None:
+        try:
+            raw.close()
+        except Exception:
+            pass
+
+    def _is_healthy(self, raw: Any) -> bool:
+        try:
+            cur = raw.cursor()
+            cur.execute('SELECT 1')
+            cur.fetchone()
+            cur.close()
+            raw.rollback()
+            return True
+        except Exception as e:
+            print(f'[DB-POOL] Health check failed: {e}')
+            self._count('health_check_failures')
+            return False
+
+    def _release_later(self, raw: Any, created_at: float) -> None:
+        self._orphans.append((raw, created_at))
+        # Будим ожидающий getconn(), если блокировка свободна; если занята — getconn()
+        # разберёт очередь сам на следующем круге
+        if self._cond.acquire(blocking=False):
+            try:
+                self._cond.notify()
+            finally:
+                self._cond.release()
+
+    def _release_orphans(self) -> None:
+        while True:
+            try:
+                raw, created_at = self._orphans.popleft()
+            except IndexError:
+                return
+            self._release(raw, created_at)
+
+    def getconn(self) -> PooledConnection:
+        deadline = time.monotonic() + self.timeout
+        while True:
+            self._release_orphans()
+            with self._cond:
+                if self._closed:
+                    raise psycopg2.InterfaceError('connection pool is closed')
+                if self._idle:
+                    raw, created_at, returned_at = self._idle.pop()
+                    self._in_use += 1
+                    break
+                if self._in_use < self.max_size + self.max_overflow:
+                    raw, created_at, returned_at = None, None, None
+                    self._in_use += 1
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._stats['timeouts'] += 1
+                    raise PoolExhausted(
+                        f'no database connection available within {self.timeout}s '
+                        f'({self._in_use} in use)'
+                    )
+                if not self._orphans:
+                    self._cond.wait(remaining)
+
+        # Соединение (пере)открываем и проверяем вне блокировки
+        try:
+            now = time.monotonic()
+            if raw is not None:
+                expired = now - created_at > self.max_lifetime
+                stale = now - returned_at > self.health_check_interval
+                if raw.closed or expired or (stale and not self._is_healthy(raw)):
+                    self._count('recycled')
+                    self._discard(raw)
+                    raw = None
+            if raw is None:
+                raw = self._connect()
+                created_at = time.monotonic()
+        except Exception:
+            with self._cond:
+                self._in_use -= 1
+                self._cond.notify()
+            raise
+
+        self._count('checkouts')
+        return PooledConnection(self, raw, created_at)
+
+    def _release(self, raw: Any, created_at: float) -> None:
+        reusable = not raw.closed
+        if reusable:
+            try:
+                status = raw.info.transaction_status
+                if status == extensions.TRANSACTION_STATUS_UNKNOWN:
+                    reusable = False
+                elif status != extensions.TRANSACTION_STATUS_IDLE:
+                    raw.rollback()
+                if reusable and raw.autocommit:
+                    raw.autocommit = False
+            except Exception:
+                reusable = False
+
+        now = time.monotonic()
+        expired = reusable and now - created_at > self.max_lifetime
+
+        with self._cond:
+            self._in_use -= 1
+            if expired:
+                self._stats['recycled'] += 1
+                reusable = False
+            if reusable and not self._closed and len(self._idle) < self.max_size:
+                self._idle.append((raw, created_at, now))
+                raw = None
+            elif reusable:
+                self._stats['overflow_closed'] += 1
+            self._cond.notify()
+
+        if raw is not None:
+            self._discard(raw)
+
+    def closeall(self) -> None:
+        self._release_orphans()
+        with self._cond:
+            self._closed = True
+            idle, self._idle = self._idle, []
+            self._cond.notify_all()
+        for raw, _, _ in idle:
+            self._discard(raw)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._cond:
+            return {
+                'idle': len(self._idle),
+                'in_use': self._in_use,
+                'max_size': self.max_size,
+                'max_overflow': self.max_overflow,
+                **self._stats,
+            }
+
+
+_pool: Optional[ConnectionPool] = None
+_pool_lock = threading.Lock()
+
+
+def init_pool(dsn: Optional[str] = None, **kwargs: Any) -> ConnectionPool:
+    """
+    Create the process-wide pool (idempotent). Called by the gateway on startup;
+    handlers get it lazily through get_connection()
+    """
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ConnectionPool(build_dsn(dsn), **kwargs)
+            print(f'[DB-POOL] Initialized: {_pool.stats()}')
+        return _pool
+
+
+def get_pool() -> ConnectionPool:
+    return _pool if _pool is not None else init_pool()
+
+
+def get_connection() -> PooledConnection:
+    """
+    Borrow a connection from the shared pool. conn.close() returns it to the pool
+    """
+    return get_pool().getconn()
+
+
+@contextmanager
+def connection():
+    """
+    with connection() as conn: ... - borrow and always give back
+    """
+    conn = get_connection()
+    try:
+        yield conn
+    finally:
+        conn.close()
+
+
+def close_pool() -> None:
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.closeall()
+            _pool = None
+
+
+def pool_stats() -> Dict[str, Any]:
+    return _pool.stats() if _pool is not None else {}
@@ -0,0 +1,165 @@
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+from psycopg2 import extensions
+
+import db_utils
+
+# Хранилище короткоживущего состояния (статус «печатает...»): значение по ключу
+# со сроком жизни. Реализация выбирается EPHEMERAL_STORE:
+#   postgres — (по умолчанию) UNLOGGED-таблица ephemeral_state (V0049): общая для всех
+#              воркеров и инстансов, один запрос по первичному ключу на операцию
+#   local    — память процесса, истечение за O(1): быстро, но видно только
+#              этому процессу — годится лишь для одного воркера шлюза (и для тестов)
+EPHEMERAL_STORE = os.environ.get('EPHEMERAL_STORE', 'postgres')
+# Просроченные строки в Postgres удаляются не чаще раза в столько секунд на процесс
+EPHEMERAL_SWEEP_INTERVAL = float(os.environ.get('EPHEMERAL_SWEEP_INTERVAL', '30'))
+
+
+class LocalStore:
+    """
+    In-process store with O(1) expiry. Entries are bucketed by ttl; within a bucket
+    (an OrderedDict, rewritten keys move to the end) deadlines grow in insertion order,
+    so expired entries are always at the front and are popped as later writes pass them.
+    get() checks the entry's own deadline. Callers use a handful of fixed ttls,
+    so the number of buckets stays constant
+    """
+
+    def __init__(self):
+        # (namespace, key) -> (value, deadline, ttl)
+        self._data: Dict[tuple, tuple] = {}
+        # ttl -> OrderedDict((namespace, key) -> deadline) in deadline order
+        self._buckets: Dict[float, OrderedDict] = {}
+        self._lock = threading.Lock()
+        self._stats = {'sets': 0, 'gets': 0, 'hits': 0, 'expired': 0}
+
+    def set(self, namespace: str, key: Any, value: Any, ttl: float) -> None:
+        now = time.monotonic()
+        item = (namespace, str(key))
+        with self._lock:
+            self._stats['sets'] += 1
+            self._unlink(item)
+            self._data[item] = (value, now + ttl, ttl)
+            self._buckets.setdefault(ttl, OrderedDict())[item] = now + ttl
+            self._expire(now)
+
+    def get(self, namespace: str, key: Any) -> Optional[Any]:
+        with self._lock:
+            self._stats['gets'] += 1
+            entry = self._data.get((namespace, str(key)))
+            if entry is None or entry[1] <= time.monotonic():
+                return None
+            self._stats['hits'] += 1
+        return entry[0]
+
+    def delete(self, namespace: str, key: Any) -> None:
+        with self._lock:
+            self._unlink((namespace, str(key)))
+
+    def _unlink(self, item: tuple) -> None:
+        entry = self._data.pop(item, None)
+        if entry is not None:
+            del self._buckets[entry[2]][item]
+
+    def _expire(self, now: float) -> None:
+        for bucket in self._buckets.values():
+            while bucket:
+                item, deadline = next(iter(bucket.items()))
+                if deadline > now:
+                    break
+                bucket.popitem(last=False)
+                del self._data[item]
+                self._stats['expired'] += 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {'backend': 'local', 'keys': len(self._data), 'ttl_buckets': len(self._buckets), **self._stats}
+
+
+class PostgresStore:
+    """
+    Store shared by every process through the ephemeral_state UNLOGGED table.
+    Deadlines use the database clock, so processes with skewed clocks agree
+    """
+
+    def __init__(self, sweep_interval: float = EPHEMERAL_SWEEP_INTERVAL):
+        self.sweep_interval = sweep_interval
+        self._swept_at = 0.0
+        self._lock = threading.Lock()
+        self._stats = {'sets': 0, 'gets': 0, 'hits': 0, 'sweeps': 0, 'swept_rows': 0, 'failures': 0}
+
+    def _count(self, stat: str, n: int = 1) -> None:
+        with self._lock:
+            self._stats[stat] += n
+
+    def _execute(self, sql: str, args: tuple, fetch: bool = False) -> Any:
+        try:
+            with db_utils.connection() as conn:
+                cur = conn.cursor(cursor_factory=extensions.cursor)
+                cur.execute(sql, args)
+                result = cur.fetchone() if fetch else cur.rowcount
+                cur.close()
+                conn.commit()
+                return result
+        except Exception:
+            self._count('failures')
+            raise
+
+    def set(self, namespace: str, key: Any, value: Any, ttl: float) -> None:
+        self._execute("""
+            INSERT INTO ephemeral_state (namespace, key, value, expires_at)
+            VALUES (%s, %s, %s, clock_timestamp() + make_interval(secs => %s))
+            ON CONFLICT (namespace, key) DO UPDATE SET
+                value = EXCLUDED.value,
+                expires_at = EXCLUDED.expires_at
+        """, (namespace, str(key), json.dumps(value), ttl))
+        self._count('sets')
+        self._maybe_sweep()
+
+    def get(self, namespace: str, key: Any) -> Optional[Any]:
+        row = self._execute("""
+            SELECT value FROM ephemeral_state
+            WHERE namespace = %s AND key = %s AND expires_at > clock_timestamp()
+        """, (namespace, str(key)), fetch=True)
+        self._count('gets')
+        if row is None:
+            return None
+        self._count('hits')
+        return json.loads(row[0])
+
+    def delete(self, namespace: str, key: Any) -> None:
+        self._execute("DELETE FROM ephemeral_state WHERE namespace = %s AND key = %s", (namespace, str(key)))
+
+    def _maybe_sweep(self) -> None:
+        # get() просроченное и так не отдаёт — чистка только не даёт таблице расти
+        now = time.monotonic()
+        with self._lock:
+            if now - self._swept_at < self.sweep_interval:
+                return
+            self._swept_at = now
+        try:
+            swept = self._execute("DELETE FROM ephemeral_state WHERE expires_at <= clock_timestamp()", ())
+        except Exception as e:
+            print(f'[EPHEMERAL] Sweep failed: {e}')
+            return
+        self._count('sweeps')
+        self._count('swept_rows', swept)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {'backend': 'postgres', 'sweep_interval': self.sweep_interval, **self._stats}
+
+
+def create_store(kind: str = EPHEMERAL_STORE):
+    if kind == 'local':
+        return LocalStore()
+    if kind != 'postgres':
+        print(f'[EPHEMERAL] Unknown EPHEMERAL_STORE={kind!r}, using postgres')
+    return PostgresStore()
+
+
+ephemeral = create_store()
@@ -0,0 +1,57 @@
+import threading
+from typing import Any, Callable, Dict, Iterable, List
+
+# Внутрипроцессная шина событий: функции публикуют «что-то изменилось» по теме
+# (например, 'messages' после send-message), ожидающие запросы просыпаются сразу,
+# а не через интервал опроса. Ожидающие сами перечитывают данные — шина несёт только номер версии.
+# emit() — адресные события для конкретных пользователей (личное сообщение, «печатает»):
+# их доставляет WebSocket-хаб шлюза, если он подписан; без хаба emit ничего не делает
+
+
+class EventBus:
+    """
+    Per-topic sequence numbers with blocking waits.
+    Take seq = current(topic) before reading, then wait(topic, seq, timeout):
+    an event published in between is never missed
+    """
+
+    def __init__(self):
+        self._cond = threading.Condition(threading.Lock())
+        self._seq: Dict[str, int] = {}
+        self._listeners: List[Callable[[List[int], Dict[str, Any]], None]] = []
+
+    def current(self, topic: str) -> int:
+        with self._cond:
+            return self._seq.get(topic, 0)
+
+    def publish(self, topic: str) -> int:
+        with self._cond:
+            seq = self._seq.get(topic, 0) + 1
+            self._seq[topic] = seq
+            self._cond.notify_all()
+            return seq
+
+    def wait(self, topic: str, seq: int, timeout: float) -> bool:
+        """
+        Block until topic moves past seq. Returns False on timeout
+        """
+        with self._cond:
+            return self._cond.wait_for(lambda: self._seq.get(topic, 0) != seq, timeout)
+
+    def add_listener(self, listener: Callable[[List[int], Dict[str, Any]], None]) -> None:
+        self._listeners.append(listener)
+
+    def emit(self, user_ids: Iterable[Any], event: Dict[str, Any]) -> None:
+        """
+        Push an event to the given users' live connections. Never raises — the write
+        that caused the event is already committed
+        """
+        ids = sorted({int(uid) for uid in user_ids if uid is not None})
+        for listener in self._listeners:
+            try:
+                listener(ids, event)
+            except Exception as e:
+                print(f'[EVENT-BUS] Listener failed: {e}')
+
+
+bus = EventBus()
@@ -0,0 +1,142 @@
+from datetime import datetime
+from typing import Any, List, Optional, Tuple
+
+from cursor_utils import keyset_clause
+from geo_utils import haversine_sql, radius_filter_sql
+
+# Альтернативный движок ленты: весь ответ get-messages (сообщения, авторы, аватары,
+# реакции, расстояние, next_cursor, has_more) собирается в Postgres одним запросом
+# и отдаётся клиенту готовым JSON-текстом — один round trip вместо трёх и без
+# сборки словарей / форматирования дат в Python
+ENGINES = ('rows', 'json')
+
+AVATAR_FALLBACK_URL = 'https://api.dicebear.com/7.x/avataaars/svg?seed='
+
+# ISO-8601 как у datetime.isoformat(): дробная часть только если есть микросекунды;
+# в created_at клиенту добавляется Z (время в UTC)
+ISO_FORMAT = 'YYYY-MM-DD"T"HH24:MI:SS'
+ISO_FORMAT_US = 'YYYY-MM-DD"T"HH24:MI:SS.US'
+
+
+def isoformat_sql(col: str) -> str:
+    """
+    SQL twin of datetime.isoformat() for a timestamp column (no offset)
+    """
+    return (
+        f"CASE WHEN date_trunc('second', {col}) = {col} "
+        f"THEN to_char({col}, '{ISO_FORMAT}') ELSE to_char({col}, '{ISO_FORMAT_US}') END"
+    )
+
+
+def float_json_sql(col: str) -> str:
+    """
+    SQL twin of json.dumps() for a float8 column: float8out already prints the shortest
+    round-trip digits like repr(), but whole values lose the .0 (json gets 0, Python 0.0)
+    """
+    return f"(({col})::text || CASE WHEN {col} = trunc({col}) THEN '.0' ELSE '' END)::json"
+
+
+def cursor_sql(direction_param: str, created_at_col: str, id_col: str) -> str:
+    """
+    SQL twin of cursor_utils.encode_cursor: base64url of ["direction","created_at",id] without padding.
+    encode(..., 'base64') wraps lines every 76 chars, translate() drops the newlines
+    """
+    payload = f"""'["' || {direction_param} || '","' || {isoformat_sql(created_at_col)} || '",' || {id_col} || ']'"""
+    return f"rtrim(translate(encode(convert_to({payload}, 'UTF8'), 'base64'), E'+/\\n', '-_'), '=')"
+
+
+def feed_json_query(
+    origin: Optional[Tuple[float, float]],
+    page: Optional[Tuple[str, Optional[datetime], int]],
+    limit: int,
+    offset: int,
+    radius_km: Optional[float],
+    cursor: Optional[str] = None,
+    use_earthdistance: bool = False
+) -> Tuple[str, List[Any]]:
+    """
+    Single statement returning the get-messages body as JSON text:
+    {"messages": [...], "next_cursor": ..., "has_more": ...}.
+    origin — координаты пользователя (None — без расстояний и без фильтра по радиусу,
+    как в построчном движке); radius_km=None — без фильтра по радиусу.
+    Параметры позиционные — порядок args совпадает с порядком %s в тексте
+    """
+    direction = page[0] if page else 'before'
+    order = 'ASC' if direction == 'after' else 'DESC'
+    args: List[Any] = []
+
+    if origin is not None:
+        distance_sql = haversine_sql('u.latitude', 'u.longitude')
+        args += [origin[0], origin[0], origin[1]]
+    else:
+        distance_sql = 'NULL::float8'
+    conditions = []
+    if page:
+        page_sql, page_args = keyset_clause(page, 'm', 'messages')
+        conditions.append(page_sql)
+        args += page_args
+    if radius_km is not None and origin is not None:
+        # Тот же индексный предфильтр, что и в построчном движке (рамка / earth_box / geohash)
+        radius_sql, radius_args = radius_filter_sql(
+            origin[0], origin[1], radius_km,
+            use_earthdistance=use_earthdistance,
+            geohash_col='u.geohash'
+        )
+        conditions.append(radius_sql)
+        args += radius_args
+    where_sql = 'WHERE ' + ' AND '.join(conditions) if conditions else ''
+    args += [limit + 1, 0 if page else offset]
+
+    # next_cursor: для after — последняя отданная строка (или тот же курсор, если новых нет),
+    # для before — последняя строка, только если есть следующая страница
+    args += [limit, direction, limit, limit, direction, cursor if direction == 'after' else None, limit]
+
+    sql = f"""
+        WITH page AS (
+            SELECT
+                m.id, m.text, m.created_at,
+                u.id AS user_id, u.username, u.primary_photo_url,
+                {distance_sql} AS distance_km
+            FROM messages m
+            JOIN users u ON m.user_id = u.id
+            {where_sql}
+            ORDER BY m.created_at {order}, m.id {order}
+            LIMIT %s OFFSET %s
+        ),
+        numbered AS (
+            SELECT p.*, round(p.distance_km::numeric, 2)::float8 AS distance_rounded,
+                   row_number() OVER (ORDER BY p.created_at {order}, p.id {order}) AS rn,
+                   count(*) OVER () AS total
+            FROM page p
+        )
+        SELECT json_build_object(
+            'messages', COALESCE((
+                SELECT json_agg(json_build_object(
+                    'id', n.id,
+                    'text', n.text,
+                    'created_at', {isoformat_sql('n.created_at')} || 'Z',
+                    'user', json_build_object(
+                        'id', n.user_id,
+                        'username', n.username,
+                        'avatar', COALESCE(n.primary_photo_url, '{AVATAR_FALLBACK_URL}' || n.username)
+                    ),
+                    'reactions', COALESCE(r.reactions, '[]'::json),
+                    'distance_km', {float_json_sql('n.distance_rounded')}
+                ) ORDER BY n.created_at, n.id)
+                FROM numbered n
+                LEFT JOIN LATERAL (
+                    SELECT json_agg(json_build_object('emoji', rc.emoji, 'count', rc.count) ORDER BY rc.emoji COLLATE "C") AS reactions
+                    FROM message_reaction_counts rc
+                    WHERE rc.message_id = n.id AND rc.count > 0
+                ) r ON TRUE
+                WHERE n.rn <= %s
+            ), '[]'::json),
+            'next_cursor', COALESCE((
+                SELECT {cursor_sql('%s::text', 'n.created_at', 'n.id')}
+                FROM numbered n
+                WHERE n.rn = LEAST(%s, n.total) AND (n.total > %s OR %s::text = 'after')
+            ), %s::text),
+            'has_more', COALESCE((SELECT n.total > %s FROM numbered n LIMIT 1), FALSE)
+        )::text
+    """
+    return sql, args
@@ -0,0 +1,238 @@
+from math import asin, cos, degrees, floor, pi, radians, sin, sqrt
+from typing import Any, List, Optional, Sequence, Tuple
+
+try:
+    import numpy as np
+except ImportError:  # numpy необязателен — без него работает чистый Python
+    np = None
+
+EARTH_RADIUS_KM = 6371.0
+
+# Запас к границам рамки на погрешность float (точки ровно на окружности)
+BOX_MARGIN_DEG = 1e-9
+
+GEOHASH_BASE32 = '0123456789bcdefghjkmnpqrstuvwxyz'
+# Точность, с которой geohash хранится в users.geohash (~5 м)
+GEOHASH_PRECISION = 9
+
+# Есть ли в базе расширение earthdistance (проверяется один раз на процесс)
+_has_earthdistance: Optional[bool] = None
+
+
+def bounding_box(lat: float, lon: float, radius_km: float) -> Tuple[float, float, Optional[float], Optional[float]]:
+    """
+    Lat/lon box that fully contains the circle of radius_km around (lat, lon).
+    Longitude bounds are None when the circle reaches a pole or the box wraps the antimeridian
+    """
+    # Угловой радиус круга; долготная полуширина — точная для сферы asin(sin(r)/cos(lat)),
+    # а не r/cos(lat): на больших широтах и радиусах последняя заметно уже круга
+    angle = radius_km / EARTH_RADIUS_KM
+    dlat = degrees(angle) + BOX_MARGIN_DEG
+    min_lat, max_lat = max(-90.0, lat - dlat), min(90.0, lat + dlat)
+    if angle >= pi / 2 - abs(radians(lat)):
+        # Круг накрывает полюс — по долготе ограничения нет
+        return min_lat, max_lat, None, None
+    dlon = degrees(asin(min(1.0, sin(angle) / cos(radians(lat))))) + BOX_MARGIN_DEG
+    if lon - dlon < -180.0 or lon + dlon > 180.0:
+        return min_lat, max_lat, None, None
+    return min_lat, max_lat, lon - dlon, lon + dlon
+
+
+def geohash_encode(lat: float, lon: float, precision: int = GEOHASH_PRECISION) -> str:
+    """
+    Standard base32 geohash of a point (bits interleaved starting with longitude)
+    """
+    lat_min, lat_max = -90.0, 90.0
+    lon_min, lon_max = -180.0, 180.0
+    chars = []
+    ch = bit = 0
+    even = True
+    while len(chars) < precision:
+        if even:
+            mid = (lon_min + lon_max) / 2
+            if lon >= mid:
+                ch, lon_min = ch * 2 + 1, mid
+            else:
+                ch, lon_max = ch * 2, mid
+        else:
+            mid = (lat_min + lat_max) / 2
+            if lat >= mid:
+                ch, lat_min = ch * 2 + 1, mid
+            else:
+                ch, lat_max = ch * 2, mid
+        even = not even
+        bit += 1
+        if bit == 5:
+            chars.append(GEOHASH_BASE32[ch])
+            ch = bit = 0
+    return ''.join(chars)
+
+
+def geohash_cell_size(precision: int) -> Tuple[float, float]:
+    """
+    (lat_span, lon_span) in degrees of a geohash cell of the given length
+    """
+    bits = 5 * precision
+    lon_bits = (bits + 1) // 2
+    lat_bits = bits // 2
+    return 180.0 / (1 << lat_bits), 360.0 / (1 << lon_bits)
+
+
+def covering_geohashes(lat: float, lon: float, radius_km: float, max_cells: int = 16) -> List[str]:
+    """
+    Smallest-precision-sufficient set of geohash prefixes (at most max_cells)
+    whose cells together cover the circle of radius_km around (lat, lon).
+    Rows whose geohash starts with one of the prefixes are the candidates
+    """
+    min_lat, max_lat, min_lon, max_lon = bounding_box(lat, lon, radius_km)
+    if min_lon is None:
+        min_lon, max_lon = -180.0, 180.0
+
+    def cell_range(lo: float, hi: float, origin: float, span: float, cells: int) -> range:
+        first = min(cells - 1, int(floor((lo - origin) / span)))
+        last = min(cells - 1, int(floor((hi - origin) / span)))
+        return range(first, last + 1)
+
+    for precision in range(GEOHASH_PRECISION, 0, -1):
+        lat_span, lon_span = geohash_cell_size(precision)
+        lat_cells = cell_range(min_lat, max_lat, -90.0, lat_span, int(round(180.0 / lat_span)))
+        lon_cells = cell_range(min_lon, max_lon, -180.0, lon_span, int(round(360.0 / lon_span)))
+        if len(lat_cells) * len(lon_cells) <= max_cells or precision == 1:
+            return sorted({
+                geohash_encode(-90.0 + (i + 0.5) * lat_span, -180.0 + (j + 0.5) * lon_span, precision)
+                for i in lat_cells
+                for j in lon_cells
+            })
+    return []
+
+
+def geohash_prefix_sql(geohash_col: str, prefixes: List[str]) -> Tuple[str, List[Any]]:
+    """
+    (col LIKE 'p1%' OR col LIKE 'p2%' ...) — each branch is a range scan on the varchar_pattern_ops index
+    """
+    if not prefixes:
+        return 'FALSE', []
+    return '(' + ' OR '.join(f'{geohash_col} LIKE %s' for _ in prefixes) + ')', [p + '%' for p in prefixes]
+
+
+def haversine_km(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    """
+    Great-circle distance in km between two points (scalar haversine)
+    """
+    lat1, lon1, lat2, lon2 = radians(lat1), radians(lon1), radians(lat2), radians(lon2)
+    a = sin((lat2 - lat1) / 2) ** 2 + cos(lat1) * cos(lat2) * sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * asin(min(1.0, sqrt(a)))
+
+
+def haversine_batch(
+    lat: float,
+    lon: float,
+    lats: Sequence[Optional[float]],
+    lons: Sequence[Optional[float]],
+    use_numpy: Optional[bool] = None
+) -> List[Optional[float]]:
+    """
+    Distances in km from (lat, lon) to every point of lats/lons in one pass.
+    Uses NumPy arrays when available, otherwise a plain loop with the cos(lat)
+    of the origin computed once. Missing coordinates (None) give None
+    """
+    if use_numpy is None:
+        use_numpy = np is not None
+    n = len(lats)
+    if n == 0:
+        return []
+
+    if use_numpy:
+        lat_arr = np.array([float('nan') if v is None else float(v) for v in lats], dtype=np.float64)
+        lon_arr = np.array([float('nan') if v is None else float(v) for v in lons], dtype=np.float64)
+        km = haversine_batch_arrays(lat, lon, lat_arr, lon_arr)
+        # NaN (нет координат) -> None
+        return [None if d != d else d for d in km.tolist()]
+
+    lat0 = radians(lat)
+    cos_lat0 = cos(lat0)
+    result: List[Optional[float]] = []
+    for p_lat, p_lon in zip(lats, lons):
+        if p_lat is None or p_lon is None:
+            result.append(None)
+            continue
+        p_lat_rad = radians(float(p_lat))
+        a = sin((p_lat_rad - lat0) / 2) ** 2 + cos_lat0 * cos(p_lat_rad) * sin(radians(float(p_lon) - lon) / 2) ** 2
+        result.append(2 * EARTH_RADIUS_KM * asin(min(1.0, sqrt(a))))
+    return result
+
+
+def haversine_batch_arrays(lat: float, lon: float, lat_arr: Any, lon_arr: Any) -> Any:
+    """
+    Same as haversine_batch for ready NumPy float64 arrays (no per-element conversion)
+    """
+    lat_rad = np.radians(lat_arr)
+    lat0 = radians(lat)
+    a = (np.sin((lat_rad - lat0) / 2) ** 2
+         + cos(lat0) * np.cos(lat_rad) * np.sin(np.radians(lon_arr - lon) / 2) ** 2)
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.minimum(1.0, np.sqrt(a)))
+
+
+def haversine_sql(lat_col: str, lon_col: str, origin_lat: str = '%s', origin_lon: str = '%s') -> str:
+    """
+    SQL expression for the great-circle distance in km from (%s lat, %s lat, %s lon) to the columns.
+    Params order: lat, lat, lon. origin_lat/origin_lon may be SQL expressions instead of placeholders
+    """
+    lat_col, lon_col = f'{lat_col}::float8', f'{lon_col}::float8'
+    distance = (
+        f'{EARTH_RADIUS_KM} * 2 * asin(least(1.0, sqrt('
+        f'power(sin(radians({lat_col} - {origin_lat}) / 2), 2) + '
+        f'cos(radians({origin_lat})) * cos(radians({lat_col})) * power(sin(radians({lon_col} - {origin_lon}) / 2), 2)'
+        f')))'
+    )
+    # least() в Postgres игнорирует NULL, поэтому без координат вышло бы ~20015 км, а не NULL
+    not_null = ' AND '.join(f'{expr} IS NOT NULL' for expr in (lat_col, lon_col, origin_lat, origin_lon) if expr != '%s')
+    return f'CASE WHEN {not_null} THEN {distance} END'
+
+
+def has_earthdistance(cur: Any) -> bool:
+    global _has_earthdistance
+    if _has_earthdistance is None:
+        try:
+            cur.execute("SELECT EXISTS (SELECT 1 FROM pg_extension WHERE extname = 'earthdistance')")
+            _has_earthdistance = bool(cur.fetchone()[0])
+        except Exception as e:
+            print(f'[GEO] earthdistance check failed: {e}')
+            _has_earthdistance = False
+    return _has_earthdistance
+
+
+def radius_filter_sql(
+    lat: float,
+    lon: float,
+    radius_km: float,
+    lat_col: str = 'u.latitude',
+    lon_col: str = 'u.longitude',
+    use_earthdistance: bool = False,
+    geohash_col: Optional[str] = None
+) -> Tuple[str, List[Any]]:
+    """
+    WHERE condition selecting rows within radius_km of (lat, lon).
+    An index-friendly prefilter (earth_box over the GiST index, geohash prefixes
+    over idx_users_geohash, or a lat/lon bounding box over idx_users_location)
+    is refined by exact haversine distance
+    """
+    clauses: List[str] = []
+    args: List[Any] = []
+    if use_earthdistance:
+        clauses.append(f'earth_box(ll_to_earth(%s, %s), %s) @> ll_to_earth({lat_col}::float8, {lon_col}::float8)')
+        args += [lat, lon, radius_km * 1000]
+    else:
+        if geohash_col:
+            prefix_sql, prefix_args = geohash_prefix_sql(geohash_col, covering_geohashes(lat, lon, radius_km))
+            clauses.append(prefix_sql)
+            args += prefix_args
+        min_lat, max_lat, min_lon, max_lon = bounding_box(lat, lon, radius_km)
+        clauses.append(f'{lat_col} BETWEEN %s AND %s')
+        args += [min_lat, max_lat]
+        if min_lon is not None:
+            clauses.append(f'{lon_col} BETWEEN %s AND %s')
+            args += [min_lon, max_lon]
+    clauses.append(f'{haversine_sql(lat_col, lon_col)} <= %s')
+    args += [lat, lat, lon, radius_km]
+    return ' AND '.join(clauses), args
@@ -6,9 +6,9 @@ Returns: HTTP response with conversations list
 
 import json
 import os
-import psycopg2
 from typing import Dict, Any
-from datetime import datetime, timedelta
+from db_utils import get_connection
+from presence_utils import ACTIVITY_SQL, PRESENCE_JOIN_SQL, presence_from_activity
 
 def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     method: str = event.get('httpMethod', 'GET')
@@ -56,68 +56,35 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             'body': json.dumps({'error': 'TIMEWEB_DB_URL не установлен или неправильный формат'})
         }
     
-    # Добавляем sslmode=require для Timeweb Cloud
-    if '?' in dsn:
-        dsn += '&sslmode=require'
-    else:
-        dsn += '?sslmode=require'
-    
-    conn = psycopg2.connect(dsn)
+    conn = get_connection()
     cur = conn.cursor()
     
-    safe_user_id = str(user_id).replace("'", "''")
+    # Сводка поддерживается private-messages: одно чтение по индексу (user_id, last_message_at)
     cur.execute(f"""
-        WITH last_messages AS (
-            SELECT 
-                CASE WHEN sender_id = '{safe_user_id}' THEN receiver_id ELSE sender_id END as other_user_id,
-                text as last_message,
-                created_at,
-                ROW_NUMBER() OVER (PARTITION BY 
-                    CASE WHEN sender_id = '{safe_user_id}' THEN receiver_id ELSE sender_id END 
-                    ORDER BY created_at DESC) as rn
-            FROM private_messages
-            WHERE sender_id = '{safe_user_id}' OR receiver_id = '{safe_user_id}'
-        ),
-        unread_counts AS (
-            SELECT receiver_id, sender_id, COUNT(*) as unread_count
-            FROM private_messages
-            WHERE receiver_id = '{safe_user_id}' AND is_read = FALSE
-            GROUP BY receiver_id, sender_id
-        )
         SELECT 
-            u.id, u.username, u.avatar_url, u.last_activity,
-            lm.last_message, lm.created_at,
-            COALESCE(uc.unread_count, 0) as unread_count
-        FROM last_messages lm
-        JOIN users u ON u.id = lm.other_user_id
-        LEFT JOIN unread_counts uc ON uc.sender_id = u.id
-        WHERE lm.rn = 1
-        ORDER BY lm.created_at DESC
-    """)
+            u.id, u.username, COALESCE(u.primary_photo_url, u.avatar_url), {ACTIVITY_SQL},
+            cs.last_message, cs.last_message_at, cs.unread_count
+        FROM conversation_summaries cs
+        JOIN users u ON u.id = cs.peer_id
+        {PRESENCE_JOIN_SQL}
+        WHERE cs.user_id = %s
+        ORDER BY cs.last_message_at DESC
+    """, (user_id,))
     
     rows = cur.fetchall()
     
+    # Онлайн/last_seen — общие правила presence_utils: активность из базы,
+    # освежённая картой heartbeat'ов шлюза (ещё не записанными в user_presence)
+    presence = presence_from_activity({row[0]: row[3] for row in rows})
+    
     conversations = []
     for row in rows:
-        last_activity = row[3]
-        is_online = False
-        last_seen = None
-        if last_activity:
-            if isinstance(last_activity, str):
-                last_activity_dt = datetime.fromisoformat(last_activity.replace('Z', '+00:00'))
-            else:
-                last_activity_dt = last_activity
-            time_diff = datetime.utcnow() - last_activity_dt.replace(tzinfo=None)
-            # Онлайн только если активность была меньше 15 секунд назад (как в WhatsApp)
-            is_online = time_diff < timedelta(seconds=15)
-            last_seen = last_activity_dt.isoformat() if last_activity_dt else None
-        
         conversations.append({
             'userId': row[0],
             'username': row[1],
             'avatarUrl': row[2],
-            'status': 'online' if is_online else 'offline',
-            'last_seen': last_seen,
+            'status': presence[row[0]]['status'],
+            'last_seen': presence[row[0]]['last_seen'],
             'lastMessage': row[4],
             'lastMessageAt': row[5].isoformat(),
             'unreadCount': row[6]
@@ -1,30 +1,84 @@
 import json
+import math
 import os
-import psycopg2
-from typing import Dict, Any
-from math import radians, cos, sin, asin, sqrt
+import time
+from typing import Dict, Any, Optional, Tuple
+from db_utils import get_connection
+from event_bus import bus
+from feed_sql import ENGINES, feed_json_query
+from cursor_utils import encode_cursor, parse_page_params, keyset_clause
+from geo_utils import radius_filter_sql, has_earthdistance, haversine_batch, haversine_km
+from timeline_cache import timeline
 
-def calculate_distance(lat1, lon1, lat2, lon2):
-    """Расчет расстояния между двумя точками в км (формула гаверсинуса)"""
-    if not all([lat1, lon1, lat2, lon2]):
-        return float('inf')
-    
-    lat1, lon1, lat2, lon2 = map(float, [lat1, lon1, lat2, lon2])
-    lat1, lon1, lat2, lon2 = map(radians, [lat1, lon1, lat2, lon2])
-    
-    dlat = lat2 - lat1
-    dlon = lon2 - lon1
-    a = sin(dlat/2)**2 + cos(lat1) * cos(lat2) * sin(dlon/2)**2
-    c = 2 * asin(sqrt(a))
-    km = 6371 * c
-    return km
+# Long-poll (since_id): сколько держать запрос, если новых сообщений нет
+LONG_POLL_TIMEOUT = 25
+LONG_POLL_MAX_TIMEOUT = 60
+
+def caller_location(cur: Any, user_id_str: Optional[str]) -> Tuple[Any, Any]:
+    if not user_id_str:
+        return None, None
+    cur.execute("SELECT latitude, longitude FROM users WHERE id = %s", (int(user_id_str),))
+    row = cur.fetchone()
+    return (row[0], row[1]) if row else (None, None)
+
+def long_poll(event: Dict[str, Any], params: Dict[str, Any]) -> Dict[str, Any]:
+    '''
+    since_id mode: messages newer than the client's last id (same as after_id).
+    If there are none yet, hold the request until send-message publishes one
+    or timeout seconds pass, then answer with whatever is there (possibly empty)
+    '''
+    try:
+        since_id = int(params['since_id'])
+        timeout = float(params.get('timeout', LONG_POLL_TIMEOUT))
+        # nan проходит сквозь min/max и роняет bus.wait
+        if not math.isfinite(timeout):
+            raise ValueError(timeout)
+        timeout = min(max(timeout, 0), LONG_POLL_MAX_TIMEOUT)
+    except ValueError:
+        return {
+            'statusCode': 400,
+            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+            'body': json.dumps({'error': 'Invalid since_id or timeout'}),
+            'isBase64Encoded': False
+        }
+    
+    page_params = {
+        k: v for k, v in params.items()
+        if k not in ('since_id', 'timeout', 'cursor', 'before_id', 'offset')
+    }
+    page_params['after_id'] = str(since_id)
+    
+    headers = event.get('headers') or {}
+    user_id_str = headers.get('X-User-Id') or headers.get('x-user-id')
+    # Координаты вызывающего читаем один раз: повторные чтения страницы в users не ходят
+    conn = get_connection()
+    try:
+        cur = conn.cursor()
+        location = caller_location(cur, user_id_str)
+        cur.close()
+    finally:
+        conn.close()
+    
+    deadline = time.monotonic() + timeout
+    while True:
+        # Версию берём до чтения: сообщение, пришедшее между чтением и ожиданием, не потеряется
+        seq = bus.current('messages')
+        response = read_feed(page_params, user_id_str, location)
+        remaining = deadline - time.monotonic()
+        if response['statusCode'] != 200 or remaining <= 0 or json.loads(response['body'])['messages']:
+            return response
+        # Ждём без соединения с базой и перечитываем только по событию шины или по истечении
+        # timeout — тогда же подхватываются сообщения, отправленные через другой процесс
+        bus.wait('messages', seq, remaining)
 
 def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     '''
     Business: Get nearby chat messages with user info and reactions based on geolocation
-    Args: event with httpMethod, queryStringParameters (limit, offset), headers (X-User-Id)
+    Args: event with httpMethod, queryStringParameters (limit, cursor | before_id | after_id, offset as fallback,
+          engine = rows | json, default from FEED_ENGINE; since_id + timeout for long-poll),
+          headers (X-User-Id)
           context with request_id
-    Returns: HTTP response with messages array filtered by distance
+    Returns: HTTP response with messages array filtered by distance and next_cursor
     '''
     method: str = event.get('httpMethod', 'GET')
     
@@ -50,50 +104,132 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
         }
     
     params = event.get('queryStringParameters') or {}
+    if params.get('since_id'):
+        return long_poll(event, params)
+    
+    headers = event.get('headers', {})
+    user_id_str = headers.get('X-User-Id') or headers.get('x-user-id')
+    return read_feed(params, user_id_str)
+
+def read_feed(params: Dict[str, Any], user_id_str: Optional[str], location: Optional[Tuple[Any, Any]] = None) -> Dict[str, Any]:
+    '''
+    One feed page. location is the caller's (lat, lon) if already known,
+    otherwise it is read from users on the same connection
+    '''
     limit = int(params.get('limit', 20))
     offset = int(params.get('offset', 0))
+    
+    # Keyset-пагинация: cursor / before_id / after_id; offset остаётся как fallback
+    try:
+        page = parse_page_params(params)
+    except ValueError as e:
+        return {
+            'statusCode': 400,
+            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+            'body': json.dumps({'error': str(e)}),
+            'isBase64Encoded': False
+        }
     max_distance_km = float(params.get('radius', 100))  # Радиус по умолчанию 100км
     
     # Если радиус >= 99999, показываем все сообщения
     show_all = max_distance_km >= 99999
     
-    headers = event.get('headers', {})
-    user_id_str = headers.get('X-User-Id') or headers.get('x-user-id')
+    engine = params.get('engine') or os.environ.get('FEED_ENGINE', 'rows')
+    if engine not in ENGINES:
+        engine = 'rows'
     
-    dsn = os.environ.get('TIMEWEB_DB_URL')
-    if dsn and '?' in dsn:
-        dsn += '&sslmode=require'
-    elif dsn:
-        dsn += '?sslmode=require'
-    conn = psycopg2.connect(dsn)
+    conn = get_connection()
     cur = conn.cursor()
     
     # Получаем координаты текущего пользователя
-    current_user_lat = None
-    current_user_lon = None
+    current_user_lat, current_user_lon = location or caller_location(cur, user_id_str)
+    
+    has_location = current_user_lat is not None and current_user_lon is not None
+    
+    # Горячая лента в памяти: если окно целиком в буфере, сообщения и реакции берём оттуда
+    timeline.refresh(conn)
+    radius_predicate = None
+    if not show_all and has_location:
+        user_lat, user_lon = float(current_user_lat), float(current_user_lon)
+        radius_predicate = lambda e: (
+            e['latitude'] is not None and e['longitude'] is not None
+            and haversine_km(user_lat, user_lon, e['latitude'], e['longitude']) <= max_distance_km
+        )
+    cached = timeline.window(page, limit, offset, radius_predicate)
+    
+    if cached is None and engine == 'json':
+        # Весь ответ собирается в базе одним запросом и уходит в body как есть
+        sql, query_args = feed_json_query(
+            (float(current_user_lat), float(current_user_lon)) if has_location else None,
+            page, limit, offset,
+            None if show_all else max_distance_km, params.get('cursor'),
+            use_earthdistance=has_location and not show_all and has_earthdistance(cur)
+        )
+        cur.execute(sql, query_args)
+        body = cur.fetchone()[0]
+        cur.close()
+        conn.close()
+        return {
+            'statusCode': 200,
+            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+            'isBase64Encoded': False,
+            'body': body
+        }
     
-    if user_id_str:
-        user_id_int = int(user_id_str)
+    # after_id/after-курсор идёт вперёд по времени, всё остальное — назад от новых к старым
+    direction = page[0] if page else 'before'
+    order = 'ASC' if direction == 'after' else 'DESC'
+    if cached is not None:
+        rows = [
+            (e['id'], e['text'], e['created_at'], e['user_id'], e['username'], e['latitude'], e['longitude'], e['photo_url'])
+            for e in cached
+        ]
+        reactions_map = {e['id']: e['reactions'] for e in cached}
+    else:
+        conditions = []
+        query_args = []
+        if page:
+            page_sql, page_args = keyset_clause(page, 'm', 'messages')
+            conditions.append(page_sql)
+            query_args += page_args
+        
+        # Фильтр по радиусу считается в базе (bounding box по индексу + точное расстояние),
+        # поэтому страница содержит ровно limit сообщений из радиуса
+        # Если show_all=True или у пользователя нет координат, не фильтруем
+        if not show_all and current_user_lat is not None and current_user_lon is not None:
+            radius_sql, radius_args = radius_filter_sql(
+                float(current_user_lat), float(current_user_lon), max_distance_km,
+                use_earthdistance=has_earthdistance(cur),
+                geohash_col='u.geohash'
+            )
+            conditions.append(radius_sql)
+            query_args += radius_args
+        
+        where_sql = 'WHERE ' + ' AND '.join(conditions) if conditions else ''
+        # Берём на одну строку больше, чтобы понять, есть ли следующая страница
+        query_args += [limit + 1, 0 if page else offset]
         cur.execute(f"""
-            SELECT latitude, longitude FROM users WHERE id = {user_id_int}
-        """)
-        user_location = cur.fetchone()
-        if user_location:
-            current_user_lat, current_user_lon = user_location
-    
-    safe_limit = str(limit).replace("'", "''")
-    safe_offset = str(offset).replace("'", "''")
-    cur.execute(f"""
-        SELECT 
-            m.id, m.text, m.created_at,
-            u.id, u.username, u.latitude, u.longitude
-        FROM messages m
-        JOIN users u ON m.user_id = u.id
-        ORDER BY m.created_at DESC
-        LIMIT {safe_limit} OFFSET {safe_offset}
-    """)
-    
-    rows = cur.fetchall()
+            SELECT 
+                m.id, m.text, m.created_at,
+                u.id, u.username, u.latitude, u.longitude, u.primary_photo_url
+            FROM messages m
+            JOIN users u ON m.user_id = u.id
+            {where_sql}
+            ORDER BY m.created_at {order}, m.id {order}
+            LIMIT %s OFFSET %s
+        """, query_args)
+        
+        rows = cur.fetchall()
+        reactions_map = None
+    
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    
+    if rows:
+        next_cursor = encode_cursor(direction, rows[-1][2], rows[-1][0]) if has_more or direction == 'after' else None
+    else:
+        # При опросе after-курсором без новых сообщений клиент продолжает с той же позиции
+        next_cursor = params.get('cursor') if direction == 'after' else None
     
     if not rows:
         cur.close()
@@ -102,48 +238,39 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             'statusCode': 200,
             'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
             'isBase64Encoded': False,
-            'body': json.dumps({'messages': []})
+            'body': json.dumps({'messages': [], 'next_cursor': next_cursor, 'has_more': False})
         }
     
-    message_ids = [row[0] for row in rows]
-    user_ids = list(set([row[3] for row in rows]))
-    
-    safe_message_ids = ','.join(str(int(mid)) for mid in message_ids)
-    cur.execute(f"""
-        SELECT message_id, emoji, COUNT(*) as count
-        FROM message_reactions
-        WHERE message_id IN ({safe_message_ids})
-        GROUP BY message_id, emoji
-    """)
-    
-    reactions_map = {}
-    for r in cur.fetchall():
-        msg_id = r[0]
-        if msg_id not in reactions_map:
-            reactions_map[msg_id] = []
-        reactions_map[msg_id].append({'emoji': r[1], 'count': r[2]})
-    
-    safe_user_ids = ','.join(str(int(uid)) for uid in user_ids)
-    cur.execute(f"""
-        SELECT DISTINCT ON (user_id) user_id, photo_url
-        FROM user_photos
-        WHERE user_id IN ({safe_user_ids})
-        ORDER BY user_id, display_order ASC, created_at DESC
-    """)
-    
-    avatars_map = {row[0]: row[1] for row in cur.fetchall()}
+    if reactions_map is None:
+        message_ids = [row[0] for row in rows]
+        
+        safe_message_ids = ','.join(str(int(mid)) for mid in message_ids)
+        cur.execute(f"""
+            SELECT message_id, emoji, count
+            FROM message_reaction_counts
+            WHERE message_id IN ({safe_message_ids}) AND count > 0
+            ORDER BY message_id, emoji COLLATE "C"
+        """)
+        
+        reactions_map = {}
+        for r in cur.fetchall():
+            msg_id = r[0]
+            if msg_id not in reactions_map:
+                reactions_map[msg_id] = []
+            reactions_map[msg_id].append({'emoji': r[1], 'count': r[2]})
+    
+    # Расстояние до автора для всей страницы одним батчем
+    distances = [None] * len(rows)
+    if current_user_lat is not None and current_user_lon is not None:
+        distances = haversine_batch(
+            float(current_user_lat), float(current_user_lon),
+            [row[5] for row in rows], [row[6] for row in rows]
+        )
     
     messages = []
-    for row in rows:
-        msg_id, text, created_at, user_id, username, msg_lat, msg_lon = row
-        user_avatar = avatars_map.get(user_id, f'https://api.dicebear.com/7.x/avataaars/svg?seed={username}')
-        
-        # Фильтруем по расстоянию, если у пользователя установлены координаты
-        # Если show_all=True, пропускаем фильтрацию
-        if not show_all and current_user_lat and current_user_lon:
-            distance = calculate_distance(current_user_lat, current_user_lon, msg_lat, msg_lon)
-            if distance > max_distance_km:
-                continue  # Пропускаем слишком далёкие сообщения
+    for row, distance_km in zip(rows, distances):
+        msg_id, text, created_at, user_id, username, msg_lat, msg_lon, photo_url = row
+        user_avatar = photo_url or f'https://api.dicebear.com/7.x/avataaars/svg?seed={username}'
         
         # Ensure UTC timezone indicator (Z) for JS compatibility
         from datetime import timezone
@@ -160,10 +287,13 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                 'username': username,
                 'avatar': user_avatar
             },
-            'reactions': reactions_map.get(msg_id, [])
+            'reactions': reactions_map.get(msg_id, []),
+            'distance_km': round(distance_km, 2) if distance_km is not None else None
         })
     
-    messages.reverse()
+    # Клиент всегда получает сообщения в хронологическом порядке
+    if direction != 'after':
+        messages.reverse()
     
     cur.close()
     conn.close()
@@ -172,5 +302,5 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
         'statusCode': 200,
         'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
         'isBase64Encoded': False,
-        'body': json.dumps({'messages': messages})
+        'body': json.dumps({'messages': messages, 'next_cursor': next_cursor, 'has_more': has_more})
     }
\ No newline at end of file
@@ -1,16 +1,98 @@
 import json
-import os
-import psycopg2
-from typing import Dict, Any
+import re
+from typing import Dict, Any, List
+from db_utils import get_connection
+from presence_utils import ACTIVITY_SQL, PRESENCE_JOIN_SQL, presence_from_activity
+
+# Поля карточки профиля в порядке ответа: имя -> выражение SQL.
+# status/last_seen считаются по активности (presence_utils), is_admin наружу не отдаётся
+FIELD_SQL = {
+    'phone': 'u.phone',
+    'username': 'u.username',
+    'avatar': 'COALESCE(u.primary_photo_url, u.avatar_url)',
+    'energy': 'u.energy',
+    'is_admin': None,
+    'is_banned': 'u.is_banned',
+    'bio': 'u.bio',
+    'status': None,
+    'last_seen': None,
+    'custom_status': 'u.status',
+    'latitude': 'u.latitude',
+    'longitude': 'u.longitude',
+    'city': 'u.city',
+}
+PRESENCE_FIELDS = {'status', 'last_seen'}
+# Пачка карточек не требует авторизации — телефон в ней не отдаётся ни по умолчанию,
+# ни по fields=, иначе ids=... превращается в выгрузку номеров по 100 за запрос
+PRIVATE_FIELDS = {'phone'}
+BATCH_FIELDS = [f for f in FIELD_SQL if f not in PRIVATE_FIELDS]
+TEXT_FIELDS = {'phone', 'username', 'avatar', 'bio', 'custom_status', 'city'}
+# Списки (лента, подписки, диалоги) запрашивают видимых пользователей одной пачкой
+MAX_IDS = 100
+
+
+def clean_string(s: Any) -> str:
+    if not s:
+        return ''
+    # Remove control characters except tab, newline, carriage return
+    return re.sub(r'[\x00-\x08\x0B\x0C\x0E-\x1F\x7F]', '', str(s))
+
+
+def format_field(field: str, value: Any) -> Any:
+    if field in TEXT_FIELDS:
+        return clean_string(value)
+    if field in ('latitude', 'longitude'):
+        return float(value) if value is not None else None
+    if field == 'is_banned':
+        return value if value is not None else False
+    return value
+
+
+def fetch_cards(cur: Any, user_ids: List[int], fields: List[str]) -> Dict[int, Dict[str, Any]]:
+    """
+    Profile cards of the given users with only the requested fields, one query.
+    Missing users are absent from the result
+    """
+    columns = [f for f in fields if FIELD_SQL.get(f)]
+    with_presence = any(f in PRESENCE_FIELDS for f in fields)
+    select_sql = ', '.join(['u.id'] + [FIELD_SQL[f] for f in columns] + ([ACTIVITY_SQL] if with_presence else []))
+    join_sql = PRESENCE_JOIN_SQL if with_presence else ''
+    cur.execute(f"SELECT {select_sql} FROM users u {join_sql} WHERE u.id = ANY(%s)", (user_ids,))
+    rows = cur.fetchall()
+    
+    presence = presence_from_activity({row[0]: row[-1] for row in rows}) if with_presence else {}
+    cards = {}
+    for row in rows:
+        values = dict(zip(columns, row[1:]))
+        card = {'id': row[0]}
+        for field in fields:
+            if field in PRESENCE_FIELDS:
+                card[field] = presence[row[0]][field]
+            elif field == 'is_admin':
+                card[field] = False
+            else:
+                card[field] = format_field(field, values[field])
+        cards[row[0]] = card
+    return cards
+
+
+def parse_fields(raw: Any) -> List[str]:
+    if not raw:
+        return list(BATCH_FIELDS)
+    requested = {part.strip() for part in str(raw).split(',') if part.strip()}
+    unknown = requested - set(BATCH_FIELDS) - {'id'}
+    if unknown:
+        raise ValueError(f"Unknown fields: {', '.join(sorted(unknown))}")
+    return [f for f in BATCH_FIELDS if f in requested]
+
 
 def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     '''
-    Business: Get user data by ID with geolocation and city
-    Args: event with httpMethod, queryStringParameters (user_id)
+    Business: Get user data by ID (or profile cards of several users) with geolocation and city
+    Args: event with httpMethod, queryStringParameters (user_id, or ids=1,2,3 with optional fields=username,avatar,status)
           context with request_id
-    Returns: HTTP response with user data including latitude, longitude, city
+    Returns: HTTP response with user data, or {users: {id: card}} for ids
     '''
-    print('[GET-USER v5] Handler called - rollback to working version')
     method: str = event.get('httpMethod', 'GET')
     
     if method == 'OPTIONS':
@@ -34,12 +116,13 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             'isBase64Encoded': False
         }
     
-    # Получаем user_id из query параметров или из заголовка X-User-Id
+    # Получаем user_id из query параметров или из заголовка X-User-Id; ids — пачка карточек
     params = event.get('queryStringParameters') or {}
     headers = event.get('headers') or {}
+    batch = 'ids' in params
     user_id = params.get('user_id') or headers.get('X-User-Id') or headers.get('x-user-id')
     
-    if not user_id:
+    if not batch and not user_id:
         return {
             'statusCode': 400,
             'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
@@ -47,25 +130,24 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             'isBase64Encoded': False
         }
     
-    dsn = os.environ.get('TIMEWEB_DB_URL')
-    # Показываем только host и database name (без пароля)
-    dsn_safe = dsn.split('@')[1] if dsn and '@' in dsn else 'NO_DSN'
-    print(f'[GET-USER] DSN exists: {bool(dsn)}, connecting to: {dsn_safe}')
-    if dsn and '?' in dsn:
-        dsn += '&sslmode=require'
-    elif dsn:
-        dsn += '?sslmode=require'
-    
-    conn = psycopg2.connect(dsn)
-    cur = conn.cursor()
+    try:
+        fields = parse_fields(params.get('fields')) if batch else list(FIELD_SQL)
+    except ValueError as e:
+        return {
+            'statusCode': 400,
+            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+            'body': json.dumps({'error': str(e)}),
+            'isBase64Encoded': False
+        }
     
-    # Use simple query protocol - user_id is already validated as integer
     try:
-        # Convert to int to ensure it's safe
-        user_id_int = int(user_id)
+        if batch:
+            user_ids = list(dict.fromkeys(
+                int(part) for part in str(params.get('ids') or '').split(',') if part.strip()
+            ))
+        else:
+            user_ids = [int(user_id)]
     except (ValueError, TypeError):
-        cur.close()
-        conn.close()
         return {
             'statusCode': 400,
             'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
@@ -73,36 +155,32 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             'isBase64Encoded': False
         }
     
-    # Try with status and city columns first, fallback if they don't exist
+    if batch and not 0 < len(user_ids) <= MAX_IDS:
+        return {
+            'statusCode': 400,
+            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+            'body': json.dumps({'error': f'ids must list 1-{MAX_IDS} user ids'}),
+            'isBase64Encoded': False
+        }
+    
+    conn = get_connection()
     try:
-        cur.execute(
-            f"SELECT id, phone, username, avatar_url, energy, is_banned, bio, last_activity, latitude, longitude, city, status FROM users WHERE id = {user_id_int}"
-        )
-        row = cur.fetchone()
-        has_city = True
-        has_status = True
-    except Exception as e:
-        print(f'[GET-USER] Error with city/status columns: {e}, reconnecting for fallback')
-        # Close failed connection and create new one
-        try:
-            cur.close()
-            conn.close()
-        except:
-            pass
-        # Reconnect
-        conn = psycopg2.connect(dsn)
         cur = conn.cursor()
-        cur.execute(
-            f"SELECT id, phone, username, avatar_url, energy, is_banned, bio, last_activity, latitude, longitude FROM users WHERE id = {user_id_int}"
-        )
-        row = cur.fetchone()
-        has_city = False
-        has_status = False
+        cards = fetch_cards(cur, user_ids, fields)
+        cur.close()
+        conn.rollback()
+    finally:
+        conn.close()
     
-    cur.close()
-    conn.close()
+    if batch:
+        return {
+            'statusCode': 200,
+            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+            'body': json.dumps({'users': {str(uid): cards[uid] for uid in user_ids if uid in cards}}),
+            'isBase64Encoded': False
+        }
     
-    if not row:
+    if not cards:
         return {
             'statusCode': 404,
             'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
@@ -110,75 +188,9 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             'isBase64Encoded': False
         }
     
-    # Helper function to clean strings from control characters
-    def clean_string(s):
-        if not s:
-            return ''
-        # Remove control characters except tab, newline, carriage return
-        import re
-        return re.sub(r'[\x00-\x08\x0B\x0C\x0E-\x1F\x7F]', '', str(s))
-    
-    # Extract custom user status (текстовый статус типа "привет настроение так то")
-    user_custom_status = ''
-    if has_status and len(row) > 11 and row[11]:
-        user_custom_status = str(row[11])
-    
-    # Compute online/offline status based on last_activity
-    from datetime import datetime, timedelta, timezone
-    last_activity = row[7]  # last_activity column
-    is_online = False
-    last_seen = None
-    if last_activity:
-        print(f'[GET-USER] Raw last_activity from DB: {repr(last_activity)}, type: {type(last_activity)}')
-        # Ensure last_activity is timezone-aware (UTC)
-        if isinstance(last_activity, str):
-            last_activity = datetime.fromisoformat(last_activity.replace('Z', '+00:00'))
-        elif last_activity.tzinfo is None:
-            # Database returns naive datetime - assume it's UTC
-            last_activity = last_activity.replace(tzinfo=timezone.utc)
-        print(f'[GET-USER] Parsed last_activity: {last_activity}, tzinfo: {last_activity.tzinfo}')
-        # Always use UTC for comparison
-        now = datetime.now(timezone.utc)
-        print(f'[GET-USER] Current now (UTC): {now}, tzinfo: {now.tzinfo}')
-        time_diff = now - last_activity
-        print(f'[GET-USER] Time diff: {time_diff}, total_seconds: {time_diff.total_seconds()}')
-        # Онлайн только если активность была меньше 15 секунд назад (как в WhatsApp)
-        is_online = time_diff < timedelta(seconds=15)
-        print(f'[GET-USER] is_online={is_online} (threshold: 15 sec)')
-        # Сохраняем время последней активности для отображения
-        last_seen = last_activity.isoformat() if last_activity else None
-    
-    result_data = {
-        'id': row[0],
-        'phone': clean_string(row[1]),
-        'username': clean_string(row[2]),
-        'avatar': clean_string(row[3]) if row[3] else '',
-        'energy': row[4],
-        'is_admin': False,
-        'is_banned': row[5] if row[5] is not None else False,
-        'bio': clean_string(row[6]) if row[6] else '',
-        'status': 'online' if is_online else 'offline',
-        'last_seen': last_seen,
-        'custom_status': clean_string(user_custom_status),
-        'latitude': float(row[8]) if len(row) > 8 and row[8] is not None else None,
-        'longitude': float(row[9]) if len(row) > 9 and row[9] is not None else None,
-        'city': clean_string(row[10]) if has_city and len(row) > 10 and row[10] else ''
-    }
-    
-    # Debug: log raw data before JSON encoding
-    print(f'[GET-USER] Raw result_data: {repr(result_data)}')
-    
-    try:
-        body_json = json.dumps(result_data)
-        print(f'[GET-USER] JSON body length: {len(body_json)}')
-    except Exception as e:
-        print(f'[GET-USER] JSON encode error: {e}')
-        print(f'[GET-USER] Problematic data: {result_data}')
-        raise
-    
     return {
         'statusCode': 200,
         'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-        'body': body_json,
+        'body': json.dumps(cards[user_ids[0]]),
         'isBase64Encoded': False
-    }
\ No newline at end of file
+    }
@@ -1,10 +1,10 @@
 import json
 import os
-import psycopg2
 import hashlib
 import jwt
 from datetime import datetime, timedelta
 from typing import Dict, Any
+from db_utils import get_connection
 
 def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     '''
@@ -49,14 +49,7 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             'isBase64Encoded': False
         }
     
-    dsn = os.environ.get('TIMEWEB_DB_URL')
-    print(f'[DEBUG] Original DSN: {dsn[:50] if dsn else "None"}')
-    if dsn and '?' in dsn:
-        dsn += '&sslmode=require'
-    elif dsn:
-        dsn += '?sslmode=require'
-    print(f'[DEBUG] Modified DSN: {dsn[:50] if dsn else "None"}')
-    conn = psycopg2.connect(dsn)
+    conn = get_connection()
     cur = conn.cursor()
     
     safe_phone = phone.replace("'", "''")
@@ -0,0 +1,145 @@
+import json
+from typing import Dict, Any
+from db_utils import get_connection
+from jwt_utils import get_user_id_from_request
+from cursor_utils import encode_distance_cursor, decode_distance_cursor
+from geo_utils import radius_filter_sql, haversine_sql, has_earthdistance
+from presence_utils import ACTIVITY_SQL, PRESENCE_JOIN_SQL, presence_from_activity
+
+# Радиусы (км), по которым расширяется поиск, пока не наберётся limit соседей:
+# каждый шаг — индексный запрос по окрестности, а не проход по всей таблице users
+SEARCH_RADII_KM = [1, 5, 25, 100, 500, 2000, 20000]
+DEFAULT_LIMIT = 20
+MAX_LIMIT = 100
+
+def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
+    '''
+    Business: Find users nearest to the caller's saved location (k nearest neighbours)
+    Args: event with httpMethod, headers (Authorization or X-User-Id),
+          queryStringParameters (limit, radius as max distance in km, cursor)
+    Returns: HTTP response with users sorted by distance and next_cursor
+    '''
+    method: str = event.get('httpMethod', 'GET')
+    
+    if method == 'OPTIONS':
+        return {
+            'statusCode': 200,
+            'headers': {
+                'Access-Control-Allow-Origin': '*',
+                'Access-Control-Allow-Methods': 'GET, OPTIONS',
+                'Access-Control-Allow-Headers': 'Content-Type, X-User-Id, Authorization',
+                'Access-Control-Max-Age': '86400'
+            },
+            'body': '',
+            'isBase64Encoded': False
+        }
+    
+    if method != 'GET':
+        return {
+            'statusCode': 405,
+            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+            'body': json.dumps({'error': 'Method not allowed'}),
+            'isBase64Encoded': False
+        }
+    
+    user_id_str = get_user_id_from_request(event)
+    if not user_id_str:
+        return {
+            'statusCode': 401,
+            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+            'body': json.dumps({'error': 'Unauthorized'}),
+            'isBase64Encoded': False
+        }
+    
+    params = event.get('queryStringParameters') or {}
+    try:
+        user_id = int(user_id_str)
+        limit = max(1, min(int(params.get('limit', DEFAULT_LIMIT)), MAX_LIMIT))
+        max_radius_km = min(float(params.get('radius', SEARCH_RADII_KM[-1])), SEARCH_RADII_KM[-1])
+        after = decode_distance_cursor(params['cursor']) if params.get('cursor') else None
+    except ValueError as e:
+        return {
+            'statusCode': 400,
+            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+            'body': json.dumps({'error': f'Invalid parameters: {e}'}),
+            'isBase64Encoded': False
+        }
+    
+    conn = get_connection()
+    cur = conn.cursor()
+    
+    cur.execute("SELECT latitude, longitude FROM users WHERE id = %s", (user_id,))
+    location = cur.fetchone()
+    if not location or location[0] is None or location[1] is None:
+        cur.close()
+        conn.close()
+        return {
+            'statusCode': 400,
+            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+            'body': json.dumps({'error': 'Location is not set'}),
+            'isBase64Encoded': False
+        }
+    
+    lat, lon = float(location[0]), float(location[1])
+    use_earthdistance = has_earthdistance(cur)
+    
+    # Страница после курсора лежит не ближе его расстояния: меньшие радиусы заведомо пусты
+    min_radius_km = after[0] if after else 0
+    radii = [r for r in SEARCH_RADII_KM if min_radius_km <= r < max_radius_km] + [max_radius_km]
+    rows = []
+    for radius_km in radii:
+        radius_sql, query_args = radius_filter_sql(
+            lat, lon, radius_km,
+            use_earthdistance=use_earthdistance,
+            geohash_col='u.geohash'
+        )
+        cursor_sql = ''
+        if after:
+            cursor_sql = 'WHERE (distance_km, id) > (%s, %s)'
+            query_args += list(after)
+        cur.execute(f"""
+            SELECT id, username, avatar, last_activity, city, distance_km FROM (
+                SELECT u.id, u.username, COALESCE(u.primary_photo_url, u.avatar_url) AS avatar,
+                       {ACTIVITY_SQL} AS last_activity, u.city,
+                       {haversine_sql('u.latitude', 'u.longitude')} AS distance_km
+                FROM users u
+                {PRESENCE_JOIN_SQL}
+                WHERE u.id <> %s AND u.is_banned IS NOT TRUE AND {radius_sql}
+            ) AS nearby
+            {cursor_sql}
+            ORDER BY distance_km, id
+            LIMIT %s
+        """, [lat, lat, lon, user_id] + query_args + [limit + 1])
+        rows = cur.fetchall()
+        # Внутри радиуса найдены все пользователи, поэтому если их хватает — это и есть ближайшие
+        if len(rows) > limit:
+            break
+    
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    
+    cur.close()
+    conn.close()
+    
+    presence = presence_from_activity({row[0]: row[3] for row in rows})
+    users = []
+    for row in rows:
+        nearby_id, username, avatar, last_activity, city, distance_km = row
+        users.append({
+            'id': nearby_id,
+            'username': username,
+            'avatar': avatar or f'https://api.dicebear.com/7.x/avataaars/svg?seed={username}',
+            'city': city or '',
+            'distance_km': round(distance_km, 2),
+            'status': presence[nearby_id]['status'],
+            'last_seen': presence[nearby_id]['last_seen']
+        })
+    
+    next_cursor = encode_distance_cursor(rows[-1][5], rows[-1][0]) if has_more else None
+    
+    return {
+        'statusCode': 200,
+        'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+        'body': json.dumps({'users': users, 'next_cursor': next_cursor, 'has_more': has_more}),
+        'isBase64Encoded': False
+    }
@@ -0,0 +1,72 @@
+import json
+from typing import Dict, Any
+from db_utils import get_connection
+from presence_utils import presence_for
+
+MAX_IDS = 200
+
+def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
+    '''
+    Business: Online status and last seen time for many users in one call
+    Args: event with httpMethod, queryStringParameters (ids as comma-separated user ids)
+    Returns: HTTP response with presence list in the requested order
+    '''
+    method: str = event.get('httpMethod', 'GET')
+    
+    if method == 'OPTIONS':
+        return {
+            'statusCode': 200,
+            'headers': {
+                'Access-Control-Allow-Origin': '*',
+                'Access-Control-Allow-Methods': 'GET, OPTIONS',
+                'Access-Control-Allow-Headers': 'Content-Type, X-User-Id, Authorization',
+                'Access-Control-Max-Age': '86400'
+            },
+            'body': '',
+            'isBase64Encoded': False
+        }
+    
+    if method != 'GET':
+        return {
+            'statusCode': 405,
+            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+            'body': json.dumps({'error': 'Method not allowed'}),
+            'isBase64Encoded': False
+        }
+    
+    params = event.get('queryStringParameters') or {}
+    try:
+        user_ids = list(dict.fromkeys(
+            int(part) for part in (params.get('ids') or '').split(',') if part.strip()
+        ))
+    except ValueError as e:
+        return {
+            'statusCode': 400,
+            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+            'body': json.dumps({'error': f'Invalid ids: {e}'}),
+            'isBase64Encoded': False
+        }
+    
+    if not user_ids or len(user_ids) > MAX_IDS:
+        return {
+            'statusCode': 400,
+            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+            'body': json.dumps({'error': f'ids query param required (1-{MAX_IDS} user ids)'}),
+            'isBase64Encoded': False
+        }
+    
+    conn = get_connection()
+    try:
+        presence = presence_for(conn, user_ids)
+        conn.rollback()
+    finally:
+        conn.close()
+    
+    return {
+        'statusCode': 200,
+        'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+        'body': json.dumps({
+            'presence': [{'userId': uid, **presence[uid]} for uid in user_ids]
+        }),
+        'isBase64Encoded': False
+    }
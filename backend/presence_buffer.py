@@ -0,0 +1,160 @@
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Any, Dict, Iterable, Optional
+
+from psycopg2 import extensions
+
+import db_utils
+
+# Отложенная запись last_activity: heartbeat'ы (update-activity, кадры WebSocket,
+# отправка личного сообщения) только отмечают время в памяти шлюза, а фоновый поток
+# раз в PRESENCE_FLUSH_INTERVAL секунд пишет всех отметившихся в user_presence одним
+# INSERT ... ON CONFLICT из unnest(...). Сколько бы раз пользователь ни отметился
+# за интервал, его строка обновляется один раз. Буфер включает шлюз (start()); вне шлюза
+# touch() возвращает False и функции пишут в базу сами, как раньше
+PRESENCE_FLUSH_INTERVAL = float(os.environ.get('PRESENCE_FLUSH_INTERVAL', '2'))
+# Сколько секунд шлюз помнит последнюю активность пользователя (карта присутствия
+# для эндпоинта presence) — дольше порога «онлайн», дальше достаточно user_presence
+PRESENCE_MEMORY_TTL = float(os.environ.get('PRESENCE_MEMORY_TTL', '300'))
+
+
+class PresenceBuffer:
+    def __init__(self, interval: float = PRESENCE_FLUSH_INTERVAL, memory_ttl: float = PRESENCE_MEMORY_TTL):
+        self.interval = interval
+        self.memory_ttl = memory_ttl
+        self._pending: Dict[int, datetime] = {}
+        # Последняя активность, в том числе уже записанная — чтение присутствия без базы
+        self._seen: Dict[int, datetime] = {}
+        self._pruned_at = 0.0
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._stats = {'touches': 0, 'flushes': 0, 'rows_written': 0, 'failures': 0, 'last_flush_ms': 0.0}
+
+    @property
+    def enabled(self) -> bool:
+        return self._thread is not None and self.interval > 0
+
+    def touch(self, user_id: int, at: Optional[datetime] = None) -> bool:
+        """
+        Record activity for user_id. Returns False when buffering is off — write directly then
+        """
+        if not self.enabled:
+            return False
+        at = at or datetime.utcnow()
+        with self._lock:
+            previous = self._pending.get(user_id)
+            if previous is None or previous < at:
+                self._pending[user_id] = at
+            seen = self._seen.get(user_id)
+            if seen is None or seen < at:
+                self._seen[user_id] = at
+            self._stats['touches'] += 1
+        return True
+
+    def pending(self, user_ids: Iterable[int]) -> Dict[int, datetime]:
+        """
+        Activity not yet flushed (fresher than user_presence) for the given users
+        """
+        with self._lock:
+            return {uid: self._pending[uid] for uid in user_ids if uid in self._pending}
+
+    def last_seen(self, user_ids: Iterable[int]) -> Dict[int, datetime]:
+        """
+        Latest activity this gateway saw for the given users (flushed or not)
+        """
+        with self._lock:
+            return {uid: self._seen[uid] for uid in user_ids if uid in self._seen}
+
+    def _prune_seen(self) -> None:
+        # Забываем давно неактивных не чаще раза в memory_ttl / 10 — проход по всей карте
+        now = time.monotonic()
+        if now - self._pruned_at < self.memory_ttl / 10:
+            return
+        self._pruned_at = now
+        cutoff = datetime.utcnow() - timedelta(seconds=self.memory_ttl)
+        with self._lock:
+            self._seen = {uid: at for uid, at in self._seen.items() if at >= cutoff}
+
+    def flush(self, conn: Any) -> int:
+        self._prune_seen()
+        with self._lock:
+            batch, self._pending = self._pending, {}
+        if not batch:
+            return 0
+        # Сортировка по id — одинаковый порядок блокировок строк у параллельных flush
+        ids = sorted(batch)
+        started = time.perf_counter()
+        try:
+            cur = conn.cursor(cursor_factory=extensions.cursor)
+            # JOIN users: отметка несуществующего id не должна ронять весь пакет на внешнем ключе
+            cur.execute("""
+                INSERT INTO user_presence AS p (user_id, last_activity)
+                SELECT u.id, v.at
+                FROM unnest(%s::int[], %s::timestamp[]) AS v(id, at)
+                JOIN users u ON u.id = v.id
+                ON CONFLICT (user_id) DO UPDATE
+                SET last_activity = EXCLUDED.last_activity
+                WHERE p.last_activity < EXCLUDED.last_activity
+            """, (ids, [batch[uid] for uid in ids]))
+            written = cur.rowcount
+            cur.close()
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            # Возвращаем отметки в буфер (новые, пришедшие за время flush, не перетираем)
+            with self._lock:
+                for uid, at in batch.items():
+                    if uid not in self._pending or self._pending[uid] < at:
+                        self._pending[uid] = at
+                self._stats['failures'] += 1
+            raise
+        with self._lock:
+            self._stats['flushes'] += 1
+            self._stats['rows_written'] += written
+            self._stats['last_flush_ms'] = round((time.perf_counter() - started) * 1000, 2)
+        return written
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            self._flush_once()
+
+    def _flush_once(self) -> None:
+        try:
+            with db_utils.connection() as conn:
+                self.flush(conn)
+        except Exception as e:
+            print(f'[PRESENCE] Flush failed: {e}')
+
+    def start(self) -> None:
+        """Start the background flusher (gateway startup)"""
+        if self._thread is None and self.interval > 0:
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name='presence-flush', daemon=True)
+            self._thread.start()
+
+    def stop(self) -> None:
+        """Stop the flusher and write what is left (gateway shutdown)"""
+        thread, self._thread = self._thread, None
+        if thread is not None:
+            self._stop.set()
+            thread.join(timeout=self.interval + 5)
+            self._flush_once()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            touches = self._stats['touches']
+            return {
+                'enabled': self.enabled,
+                'interval': self.interval,
+                'pending': len(self._pending),
+                'seen': len(self._seen),
+                # Во сколько раз меньше записей в users, чем heartbeat'ов
+                'coalescing_ratio': round(touches / self._stats['rows_written'], 2) if self._stats['rows_written'] else 0.0,
+                **self._stats,
+            }
+
+
+presence_buffer = PresenceBuffer()
@@ -0,0 +1,89 @@
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from psycopg2 import extensions
+
+from presence_buffer import presence_buffer
+
+# Присутствие пользователя: онлайн, если активность была меньше 15 секунд назад
+# (как в WhatsApp). Источник — карта активности шлюза (heartbeat'ы, presence_buffer),
+# а для тех, кого шлюз недавно не видел, — user_presence (V0050). Пустая после сбоя
+# UNLOGGED-таблица подменяется замороженным при миграции users.last_activity
+ACTIVITY_SQL = 'COALESCE(p.last_activity, u.last_activity)'
+PRESENCE_JOIN_SQL = 'LEFT JOIN user_presence p ON p.user_id = u.id'
+ONLINE_THRESHOLD = timedelta(seconds=15)
+
+
+def _as_utc(value: Any) -> Optional[datetime]:
+    if value is None:
+        return None
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value.replace('Z', '+00:00'))
+    if value.tzinfo is None:
+        # База и буфер хранят наивное время в UTC
+        value = value.replace(tzinfo=timezone.utc)
+    return value
+
+
+def presence_entry(last_activity: Any, now: Optional[datetime] = None) -> Dict[str, Any]:
+    """
+    {'status': 'online'|'offline', 'last_seen': iso or None} for a last activity time
+    """
+    last_activity = _as_utc(last_activity)
+    if last_activity is None:
+        return {'status': 'offline', 'last_seen': None}
+    now = now or datetime.now(timezone.utc)
+    return {
+        'status': 'online' if now - last_activity < ONLINE_THRESHOLD else 'offline',
+        'last_seen': last_activity.isoformat()
+    }
+
+
+def _merge_activity(seen: Dict[int, datetime], activity: Iterable[Tuple[int, Any]]) -> None:
+    for uid, last_activity in activity:
+        last_activity = _as_utc(last_activity)
+        if last_activity is not None and (uid not in seen or seen[uid] < last_activity):
+            seen[uid] = last_activity
+
+
+def presence_from_activity(activity: Dict[int, Any]) -> Dict[int, Dict[str, Any]]:
+    """
+    Presence for users whose activity was already read from the database
+    (ACTIVITY_SQL in the caller's own query), refreshed from the gateway map
+    """
+    seen = {uid: _as_utc(at) for uid, at in presence_buffer.last_seen(activity).items()}
+    _merge_activity(seen, activity.items())
+    now = datetime.now(timezone.utc)
+    return {uid: presence_entry(seen.get(uid), now) for uid in activity}
+
+
+def presence_for(conn: Any, user_ids: List[int]) -> Dict[int, Dict[str, Any]]:
+    """
+    Presence of many users at once. Users this gateway saw within the online
+    threshold are answered from memory; the rest take one users query
+    """
+    now = datetime.now(timezone.utc)
+    seen = {uid: _as_utc(at) for uid, at in presence_buffer.last_seen(user_ids).items()}
+    stale = [uid for uid in user_ids if uid not in seen or now - seen[uid] >= ONLINE_THRESHOLD]
+    if stale:
+        cur = conn.cursor(cursor_factory=extensions.cursor)
+        cur.execute(f"SELECT u.id, {ACTIVITY_SQL} FROM users u {PRESENCE_JOIN_SQL} WHERE u.id = ANY(%s)", (stale,))
+        _merge_activity(seen, cur.fetchall())
+        cur.close()
+    return {uid: presence_entry(seen.get(uid), now) for uid in user_ids}
+
+
+def record_activity(cur: Any, user_id: Any) -> Optional[int]:
+    """
+    Mark the user active now: in the gateway the buffer batches it, elsewhere
+    it is written to user_presence at once. Returns rows written (None if buffered)
+    """
+    user_id = int(user_id)
+    if presence_buffer.touch(user_id):
+        return None
+    cur.execute("""
+        INSERT INTO user_presence (user_id, last_activity)
+        SELECT id, CURRENT_TIMESTAMP AT TIME ZONE 'UTC' FROM users WHERE id = %s
+        ON CONFLICT (user_id) DO UPDATE SET last_activity = EXCLUDED.last_activity
+    """, (user_id,))
+    return cur.rowcount
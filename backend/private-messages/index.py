@@ -1,13 +1,86 @@
 '''
 Business: Send and receive private messages between users
-Args: event with httpMethod, headers (X-User-Id), body with receiverId/text, query params
+Args: event with httpMethod, headers (X-User-Id), body with receiverId/text,
+      query params (otherUserId, limit, cursor | before_id | after_id for GET, or otherUserIds, perPeer
+      for a batch of chats; messageId for DELETE)
 Returns: HTTP response with messages or send confirmation
 '''
 
 import json
-import os
-import psycopg2
-from typing import Dict, Any
+from datetime import timezone
+from typing import Dict, Any, List
+from db_utils import get_connection
+from event_bus import bus
+from block_cache import block_cache
+from presence_utils import record_activity
+from cursor_utils import parse_page_params, keyset_clause, encode_cursor
+from conversation_utils import (
+    find_conversation, get_or_create_conversation, record_message, forget_message, mark_conversation_read
+)
+
+# Пакетный режим (?otherUserIds=1,2,3): последние perPeer сообщений по каждому диалогу
+BATCH_MAX_PEERS = 50
+BATCH_DEFAULT_PER_PEER = 20
+BATCH_MAX_PER_PEER = 100
+
+# Колонки сообщения в порядке, который ждёт message_to_dict. isRead считается
+# по водяному знаку прочтения получателя (conversation_summaries.last_read_message_id)
+def message_select_sql(image_col: str) -> str:
+    return f"""
+        SELECT pm.id, pm.sender_id, pm.receiver_id, pm.text,
+               pm.id <= COALESCE(r.last_read_message_id, 0) AS is_read, pm.created_at,
+               u.username, NULL as avatar_url, pm.voice_url, pm.voice_duration, {image_col} as image_url
+        FROM private_messages pm
+        JOIN users u ON u.id = pm.sender_id
+        LEFT JOIN conversation_summaries r ON r.user_id = pm.receiver_id AND r.peer_id = pm.sender_id
+    """
+
+def message_to_dict(row: Any) -> Dict[str, Any]:
+    created_at = row[5]
+    if hasattr(created_at, 'isoformat'):
+        # Добавляем UTC timezone к времени
+        if created_at.tzinfo is None:
+            created_at = created_at.replace(tzinfo=timezone.utc)
+        # Всегда используем Z вместо +00:00 для JS совместимости
+        created_at_str = created_at.isoformat().replace('+00:00', 'Z')
+    else:
+        created_at_str = str(created_at) + 'Z'
+    
+    return {
+        'id': row[0],
+        'senderId': row[1],
+        'receiverId': row[2],
+        'text': row[3],
+        'isRead': row[4],
+        'createdAt': created_at_str,
+        'sender': {'username': row[6] if row[6] else '', 'avatarUrl': row[7] if row[7] else None},
+        'voiceUrl': row[8] if row[8] else None,
+        'voiceDuration': row[9] if row[9] else None,
+        'imageUrl': row[10] if row[10] else None
+    }
+
+def recent_messages_batch(cur: Any, user_id: int, peer_ids: List[int], per_peer: int, image_col: str) -> Dict[int, List[Dict[str, Any]]]:
+    """
+    Latest per_peer messages of each conversation with peer_ids in one query:
+    LATERAL runs the per-conversation index range scan for every peer
+    """
+    cur.execute(f"""
+        SELECT peers.peer_id, m.*
+        FROM unnest(%s::int[]) AS peers(peer_id)
+        JOIN conversations c
+          ON c.user_low_id = LEAST(%s, peers.peer_id) AND c.user_high_id = GREATEST(%s, peers.peer_id)
+        CROSS JOIN LATERAL (
+            {message_select_sql(image_col)}
+            WHERE pm.conversation_id = c.id
+            ORDER BY pm.created_at DESC, pm.id DESC
+            LIMIT %s
+        ) m
+        ORDER BY peers.peer_id, m.created_at ASC, m.id ASC
+    """, (peer_ids, user_id, user_id, per_peer))
+    result: Dict[int, List[Dict[str, Any]]] = {peer_id: [] for peer_id in peer_ids}
+    for row in cur.fetchall():
+        result[row[0]].append(message_to_dict(row[1:]))
+    return result
 
 def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     print(f'=== HANDLER START ===')
@@ -42,22 +115,46 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
         
         user_id = int(user_id_str)
         print(f'User ID: {user_id}')
-        dsn = os.environ.get('TIMEWEB_DB_URL')
-        if dsn and '?' in dsn:
-            dsn += '&sslmode=require'
-        elif dsn:
-            dsn += '?sslmode=require'
-        print(f'Connecting to DB with DSN: {dsn[:30]}...')
-        
-        conn = psycopg2.connect(dsn)
+        conn = get_connection()
         cur = conn.cursor()
-        print(f'DB connected successfully')
         
         if method == 'GET':
             query_params = event.get('queryStringParameters', {}) or {}
             other_user_id_str = query_params.get('otherUserId')
             limit_str = query_params.get('limit', '100')
             
+            if query_params.get('otherUserIds') and not other_user_id_str:
+                # Предзагрузка нескольких чатов одним запросом; сообщения не отмечаются прочитанными
+                try:
+                    peer_ids = list(dict.fromkeys(
+                        int(part) for part in query_params['otherUserIds'].split(',') if part.strip()
+                    ))[:BATCH_MAX_PEERS]
+                    per_peer = max(1, min(int(query_params.get('perPeer', BATCH_DEFAULT_PER_PEER)), BATCH_MAX_PER_PEER))
+                except ValueError as e:
+                    cur.close()
+                    conn.close()
+                    return {
+                        'statusCode': 400,
+                        'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                        'body': json.dumps({'error': f'Invalid parameters: {e}'}),
+                        'isBase64Encoded': False
+                    }
+                
+                # image_url есть с V0027 — проверка колонки ниже нужна только одиночному режиму
+                batch = recent_messages_batch(cur, user_id, peer_ids, per_peer, 'pm.image_url')
+                conn.rollback()
+                cur.close()
+                conn.close()
+                
+                return {
+                    'statusCode': 200,
+                    'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                    'body': json.dumps({
+                        'conversations': [{'userId': peer_id, 'messages': batch[peer_id]} for peer_id in peer_ids]
+                    }),
+                    'isBase64Encoded': False
+                }
+            
             if not other_user_id_str:
                 cur.close()
                 conn.close()
@@ -70,6 +167,19 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             
             other_user_id = int(other_user_id_str)
             limit = int(limit_str)
+            
+            try:
+                page = parse_page_params(query_params)
+            except ValueError as e:
+                cur.close()
+                conn.close()
+                return {
+                    'statusCode': 400,
+                    'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                    'body': json.dumps({'error': str(e)}),
+                    'isBase64Encoded': False
+                }
+            
             print(f'Other user ID: {other_user_id}')
             print(f'Limit: {limit}')
             
@@ -88,86 +198,90 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                 except Exception as e:
                     print(f'Could not create image_url column: {e}')
             
-            if has_image_url:
-                # Используем подзапрос: берём последние N сообщений (DESC) и переворачиваем обратно (ASC)
-                query = f"""
-                    SELECT * FROM (
-                        SELECT pm.id, pm.sender_id, pm.receiver_id, pm.text, pm.is_read, pm.created_at,
-                               u.username, NULL as avatar_url, pm.voice_url, pm.voice_duration, pm.image_url
-                        FROM private_messages pm
-                        JOIN users u ON u.id = pm.sender_id
-                        WHERE (pm.sender_id = {user_id} AND pm.receiver_id = {other_user_id}) 
-                           OR (pm.sender_id = {other_user_id} AND pm.receiver_id = {user_id})
-                        ORDER BY pm.created_at DESC
-                        LIMIT {limit}
-                    ) AS last_messages
-                    ORDER BY created_at ASC
-                """
-            else:
-                # Fallback without image_url if column doesn't exist
-                query = f"""
+            image_col = 'pm.image_url' if has_image_url else 'NULL'
+            
+            # История пары — один диапазон индекса (conversation_id, created_at, id).
+            # before_id — более старая страница, after_id — дельта для открытого чата:
+            # только сообщения новее последнего показанного (обычно 0–1 строка)
+            direction = page[0] if page else 'before'
+            order = 'ASC' if direction == 'after' else 'DESC'
+            conversation_id = find_conversation(cur, user_id, other_user_id)
+            rows = []
+            if conversation_id is not None:
+                conditions = ['pm.conversation_id = %s']
+                query_args = [conversation_id]
+                if page and page[1] is None:
+                    # Позицию before_id/after_id ищем только внутри этого диалога
+                    cur.execute(
+                        "SELECT created_at FROM private_messages WHERE id = %s AND conversation_id = %s",
+                        (page[2], conversation_id)
+                    )
+                    position = cur.fetchone()
+                    if position:
+                        page = (direction, position[0], page[2])
+                if page and page[1] is None:
+                    # Сообщение уже удалено — сравниваем по id, он растёт вместе с created_at
+                    conditions.append(f"pm.id {'>' if direction == 'after' else '<'} %s")
+                    query_args.append(page[2])
+                elif page:
+                    page_sql, page_args = keyset_clause(page, 'pm', 'private_messages')
+                    conditions.append(page_sql)
+                    query_args += page_args
+                # Берём на одну строку больше, чтобы понять, есть ли ещё сообщения
+                query_args.append(limit + 1)
+                
+                print(f'Executing query...')
+                cur.execute(f"""
                     SELECT * FROM (
-                        SELECT pm.id, pm.sender_id, pm.receiver_id, pm.text, pm.is_read, pm.created_at,
-                               u.username, NULL as avatar_url, pm.voice_url, pm.voice_duration, NULL as image_url
-                        FROM private_messages pm
-                        JOIN users u ON u.id = pm.sender_id
-                        WHERE (pm.sender_id = {user_id} AND pm.receiver_id = {other_user_id}) 
-                           OR (pm.sender_id = {other_user_id} AND pm.receiver_id = {user_id})
-                        ORDER BY pm.created_at DESC
-                        LIMIT {limit}
-                    ) AS last_messages
-                    ORDER BY created_at ASC
-                """
-            print(f'Executing query...')
-            cur.execute(query)
-            print(f'Query executed')
+                        {message_select_sql(image_col)}
+                        WHERE {' AND '.join(conditions)}
+                        ORDER BY pm.created_at {order}, pm.id {order}
+                        LIMIT %s
+                    ) AS page_messages
+                    ORDER BY created_at ASC, id ASC
+                """, query_args)
+                print(f'Query executed')
+                rows = cur.fetchall()
             
-            rows = cur.fetchall()
+            # Ответ всегда от старых к новым; лишняя строка — самая дальняя от курсора
+            has_more = len(rows) > limit
+            if has_more:
+                rows = rows[:-1] if direction == 'after' else rows[1:]
+            if rows and (has_more or direction == 'after'):
+                edge = rows[-1] if direction == 'after' else rows[0]
+                next_cursor = encode_cursor(direction, edge[5], edge[0])
+            else:
+                # При опросе after-курсором без новых сообщений клиент продолжает с той же позиции
+                next_cursor = query_params.get('cursor') if direction == 'after' else None
             print(f'Fetched {len(rows)} rows')
             
-            messages = []
-            for row in rows:
-                created_at = row[5]
-                if hasattr(created_at, 'isoformat'):
-                    # Добавляем UTC timezone к времени
-                    if created_at.tzinfo is None:
-                        from datetime import timezone
-                        created_at = created_at.replace(tzinfo=timezone.utc)
-                    # Всегда используем Z вместо +00:00 для JS совместимости
-                    created_at_str = created_at.isoformat().replace('+00:00', 'Z')
-                else:
-                    created_at_str = str(created_at) + 'Z'
-                
-                messages.append({
-                    'id': row[0],
-                    'senderId': row[1],
-                    'receiverId': row[2],
-                    'text': row[3],
-                    'isRead': row[4],
-                    'createdAt': created_at_str,
-                    'sender': {'username': row[6] if row[6] else '', 'avatarUrl': row[7] if row[7] else None},
-                    'voiceUrl': row[8] if row[8] else None,
-                    'voiceDuration': row[9] if row[9] else None,
-                    'imageUrl': row[10] if row[10] else None
-                })
+            messages = [message_to_dict(row) for row in rows]
             
             print(f'Prepared {len(messages)} messages for response')
             
-            update_query = f"""
-                UPDATE private_messages 
-                SET is_read = TRUE 
-                WHERE receiver_id = {user_id} AND sender_id = {other_user_id} AND is_read = FALSE
-            """
-            cur.execute(update_query)
+            # Прочитано всё, что показали: сдвигаем водяной знак диалога одной строкой
+            # вместо UPDATE is_read по каждому непрочитанному сообщению
+            last_read_message_id = max((row[0] for row in rows), default=None)
+            advanced = False
+            if last_read_message_id is not None:
+                advanced = mark_conversation_read(cur, user_id, other_user_id, last_read_message_id)
             conn.commit()
             
+            # Собеседник видит «прочитано» сразу, без опроса
+            if advanced:
+                bus.emit([other_user_id], {
+                    'type': 'messages_read',
+                    'readerId': user_id,
+                    'lastReadMessageId': last_read_message_id
+                })
+            
             cur.close()
             conn.close()
             
             return {
                 'statusCode': 200,
                 'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                'body': json.dumps({'messages': messages}),
+                'body': json.dumps({'messages': messages, 'hasMore': has_more, 'nextCursor': next_cursor}),
                 'isBase64Encoded': False
             }
         
@@ -189,14 +303,8 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                     'isBase64Encoded': False
                 }
             
-            # Проверяем блокировку в обе стороны
-            block_check_query = f"""
-                SELECT COUNT(*) FROM blacklist
-                WHERE (user_id = {user_id} AND blocked_user_id = {receiver_id})
-                   OR (user_id = {receiver_id} AND blocked_user_id = {user_id})
-            """
-            cur.execute(block_check_query)
-            is_blocked = cur.fetchone()[0] > 0
+            # Проверяем блокировку в обе стороны — через кэш, обычно без запроса к blacklist
+            is_blocked = block_cache.is_blocked(conn, user_id, receiver_id)
             
             if is_blocked:
                 cur.close()
@@ -208,14 +316,16 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                     'isBase64Encoded': False
                 }
             
+            conversation_id = get_or_create_conversation(cur, user_id, receiver_id)
+            
             if image_url:
                 escaped_image_url = image_url.replace("'", "''")
                 escaped_text = text.replace("'", "''") if text else ''
                 insert_query = f"""
                     INSERT INTO private_messages 
-                    (sender_id, receiver_id, text, image_url) 
-                    VALUES ({user_id}, {receiver_id}, '{escaped_text}', '{escaped_image_url}') 
-                    RETURNING id
+                    (sender_id, receiver_id, conversation_id, text, image_url) 
+                    VALUES ({user_id}, {receiver_id}, {conversation_id}, '{escaped_text}', '{escaped_image_url}') 
+                    RETURNING id, created_at
                 """
             elif voice_url:
                 escaped_voice_url = voice_url.replace("'", "''")
@@ -223,38 +333,57 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                     escaped_text = text.replace("'", "''")
                     insert_query = f"""
                         INSERT INTO private_messages 
-                        (sender_id, receiver_id, text, voice_url, voice_duration) 
-                        VALUES ({user_id}, {receiver_id}, '{escaped_text}', '{escaped_voice_url}', {voice_duration if voice_duration else 'NULL'}) 
-                        RETURNING id
+                        (sender_id, receiver_id, conversation_id, text, voice_url, voice_duration) 
+                        VALUES ({user_id}, {receiver_id}, {conversation_id}, '{escaped_text}', '{escaped_voice_url}', {voice_duration if voice_duration else 'NULL'}) 
+                        RETURNING id, created_at
                     """
                 else:
                     insert_query = f"""
                         INSERT INTO private_messages 
-                        (sender_id, receiver_id, text, voice_url, voice_duration) 
-                        VALUES ({user_id}, {receiver_id}, '', '{escaped_voice_url}', {voice_duration if voice_duration else 'NULL'}) 
-                        RETURNING id
+                        (sender_id, receiver_id, conversation_id, text, voice_url, voice_duration) 
+                        VALUES ({user_id}, {receiver_id}, {conversation_id}, '', '{escaped_voice_url}', {voice_duration if voice_duration else 'NULL'}) 
+                        RETURNING id, created_at
                     """
             else:
                 escaped_text = text.replace("'", "''")
                 insert_query = f"""
                     INSERT INTO private_messages 
-                    (sender_id, receiver_id, text) 
-                    VALUES ({user_id}, {receiver_id}, '{escaped_text}') 
-                    RETURNING id
+                    (sender_id, receiver_id, conversation_id, text) 
+                    VALUES ({user_id}, {receiver_id}, {conversation_id}, '{escaped_text}') 
+                    RETURNING id, created_at
                 """
             cur.execute(insert_query)
-            message_id = cur.fetchone()[0]
+            message_id, created_at = cur.fetchone()
+            record_message(cur, conversation_id, user_id, receiver_id, message_id, text, created_at)
             
-            # Обновляем last_activity отправителя (UTC)
-            safe_user_id_update = str(user_id).replace("'", "''")
-            cur.execute(
-                f"UPDATE users SET last_activity = (CURRENT_TIMESTAMP AT TIME ZONE 'UTC') WHERE id = '{safe_user_id_update}'"
-            )
+            # Обновляем активность отправителя (UTC): в шлюзе — через буфер heartbeat'ов
+            record_activity(cur, user_id)
+            cur.execute("SELECT username FROM users WHERE id = %s", (user_id,))
+            sender = cur.fetchone()
             
             conn.commit()
             cur.close()
             conn.close()
             
+            # Доставляем сообщение получателю (и другим вкладкам отправителя) по WebSocket
+            if created_at.tzinfo is None:
+                created_at = created_at.replace(tzinfo=timezone.utc)
+            bus.emit([int(receiver_id), user_id], {
+                'type': 'private_message',
+                'message': {
+                    'id': message_id,
+                    'senderId': user_id,
+                    'receiverId': int(receiver_id),
+                    'text': text,
+                    'isRead': False,
+                    'createdAt': created_at.isoformat().replace('+00:00', 'Z'),
+                    'sender': {'username': sender[0] if sender and sender[0] else '', 'avatarUrl': None},
+                    'voiceUrl': voice_url or None,
+                    'voiceDuration': voice_duration if voice_url and voice_duration else None,
+                    'imageUrl': image_url or None
+                }
+            })
+            
             return {
                 'statusCode': 200,
                 'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
@@ -279,7 +408,7 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             message_id = int(message_id_str)
             
             # Проверяем, что сообщение принадлежит текущему пользователю
-            cur.execute(f"SELECT sender_id FROM private_messages WHERE id = {message_id}")
+            cur.execute(f"SELECT sender_id, receiver_id, conversation_id FROM private_messages WHERE id = {message_id}")
             result = cur.fetchone()
             
             if not result:
@@ -306,10 +435,18 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             
             # Удаляем сообщение
             cur.execute(f"DELETE FROM private_messages WHERE id = {message_id}")
+            forget_message(cur, result[2], result[1], sender_id, message_id)
             conn.commit()
             cur.close()
             conn.close()
             
+            bus.emit([sender_id, result[1]], {
+                'type': 'private_message_deleted',
+                'messageId': message_id,
+                'senderId': sender_id,
+                'receiverId': result[1]
+            })
+            
             return {
                 'statusCode': 200,
                 'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
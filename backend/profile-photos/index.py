@@ -5,9 +5,28 @@ Returns: HTTP response with photos list or operation status
 '''
 
 import json
-import os
-import psycopg2
 from typing import Dict, Any
+from db_utils import get_connection
+from timeline_cache import timeline
+
+def refresh_primary_photo(cur, user_id: int) -> None:
+    '''
+    Sync users.primary_photo_url with the first photo of the gallery (same order as the list below)
+    '''
+    cur.execute(f"""
+        UPDATE users SET primary_photo_url = (
+            SELECT photo_url FROM user_photos
+            WHERE user_id = {user_id}
+            ORDER BY display_order ASC, created_at DESC
+            LIMIT 1
+        )
+        WHERE id = {user_id}
+        RETURNING primary_photo_url
+    """)
+    row = cur.fetchone()
+    # Вызывающий код сразу делает commit — обновляем аватар и в горячей ленте
+    if row:
+        timeline.update_author(user_id, photo_url=row[0])
 
 def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     method: str = event.get('httpMethod', 'GET')
@@ -43,9 +62,7 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
         }
     
     user_id = int(user_id_str)
-    dsn = os.environ.get('TIMEWEB_DB_URL')
-    
-    conn = psycopg2.connect(dsn)
+    conn = get_connection()
     cur = conn.cursor()
     
     if method == 'GET':
@@ -83,6 +100,7 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                 f"INSERT INTO user_photos (user_id, photo_url) VALUES ({user_id}, '{photo_url_escaped}') RETURNING id"
             )
             photo_id = cur.fetchone()[0]
+            refresh_primary_photo(cur, user_id)
             conn.commit()
             cur.close()
             conn.close()
@@ -151,6 +169,7 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             f"INSERT INTO user_photos (user_id, photo_url) VALUES ({post_user_id}, '{photo_url_escaped}') RETURNING id"
         )
         photo_id = cur.fetchone()[0]
+        refresh_primary_photo(cur, post_user_id)
         conn.commit()
         cur.close()
         conn.close()
@@ -184,6 +203,7 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
         cur.execute(
             f"UPDATE user_photos SET display_order = 0 WHERE id = {photo_id} AND user_id = {user_id}"
         )
+        refresh_primary_photo(cur, user_id)
         
         conn.commit()
         cur.close()
@@ -216,6 +236,8 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             f"DELETE FROM user_photos WHERE id = {photo_id} AND user_id = {user_id}"
         )
         affected = cur.rowcount
+        if affected:
+            refresh_primary_photo(cur, user_id)
         conn.commit()
         cur.close()
         conn.close()
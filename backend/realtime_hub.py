@@ -0,0 +1,147 @@
+import asyncio
+import json
+from typing import Any, Dict, Iterable, List, Optional, Set
+
+from event_bus import bus
+
+# WebSocket-хаб шлюза: реестр живых соединений по пользователям. Функции (в потоках
+# пулов) шлют адресные события через event_bus.emit, хаб переносит их в event loop
+# и раскладывает по сокетам получателей. Присутствие (online/offline) считается по
+# наличию хотя бы одного соединения и рассылается тем, кто на пользователя подписан.
+# Хаб не зависит от FastAPI: от сокета нужны только send_text() и close()
+
+# Очередь исходящих на соединение: медленный клиент не держит остальных,
+# а переполнение означает, что клиент не читает — такое соединение закрываем
+SEND_QUEUE_SIZE = 256
+# Сколько пользователей одно соединение может отслеживать (столько же, сколько
+# принимает за запрос эндпоинт presence) — кадр watch_presence не должен стоить O(n) без предела
+MAX_WATCHED_USERS = 200
+
+
+class Connection:
+    def __init__(self, hub: 'RealtimeHub', websocket: Any, user_id: int):
+        self.hub = hub
+        self.websocket = websocket
+        self.user_id = user_id
+        self.watching: Set[int] = set()
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=SEND_QUEUE_SIZE)
+        self.sender: Optional[asyncio.Task] = None
+
+    def send(self, text: str) -> None:
+        try:
+            self.queue.put_nowait(text)
+        except asyncio.QueueFull:
+            print(f'[WS] Send queue full for user {self.user_id}, closing')
+            self.hub.stats['dropped'] += 1
+            asyncio.ensure_future(self.websocket.close(code=1013))
+
+    async def run_sender(self) -> None:
+        while True:
+            text = await self.queue.get()
+            try:
+                await self.websocket.send_text(text)
+            except Exception:
+                return
+
+
+class RealtimeHub:
+    """
+    Per-user registry of live WebSocket connections. All methods except
+    dispatch() run on the event loop thread, so no locking is needed
+    """
+
+    def __init__(self):
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self._connections: Dict[int, Set[Connection]] = {}
+        # user_id -> соединения, подписанные на его присутствие
+        self._watchers: Dict[int, Set[Connection]] = {}
+        self.stats = {'connects': 0, 'disconnects': 0, 'events': 0, 'delivered': 0, 'dropped': 0}
+
+    def attach(self, loop: asyncio.AbstractEventLoop) -> None:
+        """Start receiving event_bus.emit() events (call once on gateway startup)"""
+        if self.loop is None:
+            bus.add_listener(self.dispatch)
+        self.loop = loop
+
+    def dispatch(self, user_ids: List[int], event: Dict[str, Any]) -> None:
+        # Вызывается из потоков пулов — в event loop передаём уже сериализованный текст
+        if self.loop is None or self.loop.is_closed():
+            return
+        self.loop.call_soon_threadsafe(self.send_to_users, user_ids, json.dumps(event))
+
+    def send_to_users(self, user_ids: Iterable[int], text: str) -> None:
+        self.stats['events'] += 1
+        for user_id in user_ids:
+            for connection in self._connections.get(user_id, ()):
+                connection.send(text)
+                self.stats['delivered'] += 1
+
+    def is_online(self, user_id: int) -> bool:
+        return bool(self._connections.get(user_id))
+
+    def connect(self, websocket: Any, user_id: int) -> Connection:
+        connection = Connection(self, websocket, user_id)
+        connection.sender = asyncio.ensure_future(connection.run_sender())
+        first = not self._connections.get(user_id)
+        self._connections.setdefault(user_id, set()).add(connection)
+        self.stats['connects'] += 1
+        if first:
+            self._notify_presence(user_id, 'online')
+        return connection
+
+    def disconnect(self, connection: Connection) -> None:
+        user_id = connection.user_id
+        connections = self._connections.get(user_id, set())
+        connections.discard(connection)
+        for target in connection.watching:
+            watchers = self._watchers.get(target)
+            if watchers:
+                watchers.discard(connection)
+                if not watchers:
+                    del self._watchers[target]
+        if connection.sender:
+            connection.sender.cancel()
+        self.stats['disconnects'] += 1
+        if not connections:
+            self._connections.pop(user_id, None)
+            self._notify_presence(user_id, 'offline')
+
+    def watch_presence(self, connection: Connection, user_ids: Any) -> Dict[int, str]:
+        """
+        Subscribe the connection to presence changes of user_ids (replaces the previous set).
+        Only integer ids count, at most MAX_WATCHED_USERS of them. Returns the current status of each
+        """
+        targets = set()
+        if isinstance(user_ids, (list, tuple)):
+            for uid in user_ids[:MAX_WATCHED_USERS]:
+                if isinstance(uid, int) and not isinstance(uid, bool):
+                    targets.add(uid)
+        for target in connection.watching - targets:
+            watchers = self._watchers.get(target)
+            if watchers:
+                watchers.discard(connection)
+                if not watchers:
+                    del self._watchers[target]
+        for target in targets:
+            self._watchers.setdefault(target, set()).add(connection)
+        connection.watching = targets
+        return {target: 'online' if self.is_online(target) else 'offline' for target in targets}
+
+    def _notify_presence(self, user_id: int, status: str) -> None:
+        watchers = self._watchers.get(user_id)
+        if not watchers:
+            return
+        text = json.dumps({'type': 'presence', 'userId': user_id, 'status': status})
+        for connection in list(watchers):
+            connection.send(text)
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            'users_online': len(self._connections),
+            'connections': sum(len(c) for c in self._connections.values()),
+            'presence_watched': len(self._watchers),
+            **self.stats,
+        }
+
+
+hub = RealtimeHub()
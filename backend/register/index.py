@@ -1,10 +1,11 @@
 import json
 import os
-import psycopg2
 import hashlib
 import jwt
 from datetime import datetime, timedelta
 from typing import Dict, Any
+from db_utils import get_connection
+from geo_utils import geohash_encode
 
 def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     '''
@@ -61,12 +62,7 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             'isBase64Encoded': False
         }
     
-    dsn = os.environ.get('TIMEWEB_DB_URL')
-    if dsn and '?' in dsn:
-        dsn += '&sslmode=require'
-    elif dsn:
-        dsn += '?sslmode=require'
-    conn = psycopg2.connect(dsn)
+    conn = get_connection()
     cur = conn.cursor()
     
     safe_phone = phone.replace("'", "''")
@@ -92,8 +88,9 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     # Формируем SQL с учётом геолокации
     if latitude is not None and longitude is not None:
         cur.execute(
-            f"INSERT INTO users (phone, username, avatar_url, password_hash, latitude, longitude) "
-            f"VALUES ('{safe_phone}', '{safe_username}', '{safe_avatar}', '{safe_password_hash}', {latitude}, {longitude}) "
+            f"INSERT INTO users (phone, username, avatar_url, password_hash, latitude, longitude, geohash) "
+            f"VALUES ('{safe_phone}', '{safe_username}', '{safe_avatar}', '{safe_password_hash}', {latitude}, {longitude}, "
+            f"'{geohash_encode(float(latitude), float(longitude))}') "
             f"RETURNING id"
         )
     else:
@@ -1,8 +1,8 @@
 import json
-import os
-import psycopg2
 from typing import Dict, Any
 import hashlib
+from db_utils import get_connection
+from geo_utils import geohash_encode
 
 def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     '''
@@ -35,13 +35,7 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             'isBase64Encoded': False
         }
     
-    dsn = os.environ.get('TIMEWEB_DB_URL')
-    if dsn and '?' in dsn:
-        dsn += '&sslmode=require'
-    elif dsn:
-        dsn += '?sslmode=require'
-    
-    conn = psycopg2.connect(dsn)
+    conn = get_connection()
     cur = conn.cursor()
     
     password_hash = hashlib.sha256("test123".encode()).hexdigest()
@@ -119,8 +113,8 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                 # Пробуем создать с city, если не получается - без city
                 try:
                     cur.execute(f"""
-                        INSERT INTO users (phone, username, password_hash, avatar_url, energy, latitude, longitude, city, created_at)
-                        VALUES ('{user['phone']}', '{user['username']}', '{password_hash}', '{user['avatar']}', 1000, {user['latitude']}, {user['longitude']}, '{user['city']}', NOW())
+                        INSERT INTO users (phone, username, password_hash, avatar_url, energy, latitude, longitude, geohash, city, created_at)
+                        VALUES ('{user['phone']}', '{user['username']}', '{password_hash}', '{user['avatar']}', 1000, {user['latitude']}, {user['longitude']}, '{geohash_encode(user['latitude'], user['longitude'])}', '{user['city']}', NOW())
                         RETURNING id
                     """)
                     user_id = cur.fetchone()[0]
@@ -134,12 +128,12 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                     except:
                         pass
                     # Переподключаемся
-                    conn = psycopg2.connect(dsn)
+                    conn = get_connection()
                     cur = conn.cursor()
                     # Создаём без city
                     cur.execute(f"""
-                        INSERT INTO users (phone, username, password_hash, avatar_url, energy, latitude, longitude, created_at)
-                        VALUES ('{user['phone']}', '{user['username']}', '{password_hash}', '{user['avatar']}', 1000, {user['latitude']}, {user['longitude']}, NOW())
+                        INSERT INTO users (phone, username, password_hash, avatar_url, energy, latitude, longitude, geohash, created_at)
+                        VALUES ('{user['phone']}', '{user['username']}', '{password_hash}', '{user['avatar']}', 1000, {user['latitude']}, {user['longitude']}, '{geohash_encode(user['latitude'], user['longitude'])}', NOW())
                         RETURNING id
                     """)
                     user_id = cur.fetchone()[0]
@@ -1,7 +1,9 @@
 import json
-import os
-import psycopg2
 from typing import Dict, Any
+from db_utils import get_connection
+from timeline_cache import timeline
+from event_bus import bus
+from presence_utils import record_activity
 
 def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     '''
@@ -53,17 +55,12 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             'isBase64Encoded': False
         }
     
-    dsn = os.environ.get('TIMEWEB_DB_URL')
-    if dsn and '?' in dsn:
-        dsn += '&sslmode=require'
-    elif dsn:
-        dsn += '?sslmode=require'
-    conn = psycopg2.connect(dsn)
+    conn = get_connection()
     cur = conn.cursor()
     
     # Use simple query protocol
     safe_user_id = str(user_id).replace("'", "''")
-    cur.execute(f"SELECT energy, is_banned FROM users WHERE id = '{safe_user_id}'")
+    cur.execute(f"SELECT energy, is_banned, username, primary_photo_url, latitude, longitude FROM users WHERE id = '{safe_user_id}'")
     user_data = cur.fetchone()
     
     if not user_data:
@@ -100,8 +97,9 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
         }
     
     cur.execute(
-        f"UPDATE users SET energy = energy - 10, last_activity = (CURRENT_TIMESTAMP AT TIME ZONE 'UTC') WHERE id = '{safe_user_id}'"
+        f"UPDATE users SET energy = energy - 10 WHERE id = '{safe_user_id}'"
     )
+    record_activity(cur, user_id)
     
     # Escape single quotes in text
     safe_text = text.replace("'", "''")
@@ -114,6 +112,23 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     cur.close()
     conn.close()
     
+    # Сквозная запись в горячую ленту: следующий опрос get-messages увидит сообщение без похода в базу
+    username, photo_url, author_lat, author_lon = user_data[2:6]
+    timeline.add_message({
+        'id': message_id,
+        'text': text,
+        'created_at': created_at,
+        'voice_url': None,
+        'voice_duration': None,
+        'user_id': int(user_id),
+        'username': username,
+        'photo_url': photo_url,
+        'latitude': float(author_lat) if author_lat is not None else None,
+        'longitude': float(author_lon) if author_lon is not None else None,
+    })
+    # Будим long-poll запросы get-messages (since_id)
+    bus.publish('messages')
+    
     from datetime import timezone
     if hasattr(created_at, 'tzinfo') and created_at.tzinfo is None:
         created_at = created_at.replace(tzinfo=timezone.utc)
@@ -0,0 +1,305 @@
+import bisect
+import os
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from psycopg2 import extensions
+
+# Горячая лента: последние N публичных сообщений (с авторами, аватарами и счётчиками
+# реакций) в памяти процесса. Почти все запросы get-messages — опрос первой страницы,
+# и при попадании окна в буфер сообщения и реакции из базы не читаются.
+# send-message / add-reaction / смена аватара и локации пишут в буфер сквозной записью
+# после commit. Кэш живёт в процессе, поэтому сообщения из других процессов (второй
+# инстанс шлюза, main.py) подтягиваются дозапросом хвоста не чаще раза в SYNC_INTERVAL,
+# а раз в MAX_AGE буфер перечитывается целиком (реакции, удаления). TIMELINE_CACHE_SIZE=0 отключает кэш
+TIMELINE_CACHE_SIZE = int(os.environ.get('TIMELINE_CACHE_SIZE', '1000'))
+TIMELINE_CACHE_SYNC_INTERVAL = float(os.environ.get('TIMELINE_CACHE_SYNC_INTERVAL', '1'))
+TIMELINE_CACHE_MAX_AGE = float(os.environ.get('TIMELINE_CACHE_MAX_AGE', '60'))
+# created_at ставится в начале транзакции, а коммиты приходят не по порядку —
+# хвост перечитываем с запасом, дубли отсекаются по (created_at, id)
+SYNC_LOOKBACK = timedelta(seconds=5)
+
+
+def _key(entry: Dict[str, Any]) -> Tuple[datetime, int]:
+    return entry['created_at'], entry['id']
+
+
+class TimelineCache:
+    """
+    Ring buffer of the newest public messages ordered by (created_at, id).
+
+    The buffer holds *every* message newer than its oldest entry, so a page can be
+    answered from it whenever the page starts inside the buffer. `complete` means
+    the buffer also holds the whole history (the table had fewer than size rows),
+    so pages running past its oldest entry are still exact.
+    """
+
+    def __init__(
+        self,
+        size: int = TIMELINE_CACHE_SIZE,
+        sync_interval: float = TIMELINE_CACHE_SYNC_INTERVAL,
+        max_age: float = TIMELINE_CACHE_MAX_AGE
+    ):
+        self.size = max(0, size)
+        self.sync_interval = sync_interval
+        self.max_age = max_age
+        self._entries: List[Dict[str, Any]] = []
+        self._keys: List[Tuple[datetime, int]] = []
+        self._lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+        self.warm = False
+        self.complete = False
+        self._warmed_at = self._synced_at = 0.0
+        self._stats = {'hits': 0, 'misses': 0, 'warmups': 0, 'writes': 0, 'synced': 0, 'evicted': 0}
+
+    @property
+    def enabled(self) -> bool:
+        return self.size > 0
+
+    def _fetch(self, conn: Any, where_sql: str, args: list, order: str) -> List[Dict[str, Any]]:
+        # Обычный курсор (кортежи) — main.py отдаёт соединения с RealDictCursor
+        cur = conn.cursor(cursor_factory=extensions.cursor)
+        cur.execute(f"""
+            SELECT m.id, m.text, m.created_at, m.voice_url, m.voice_duration,
+                   u.id, u.username, u.primary_photo_url, u.latitude, u.longitude
+            FROM messages m
+            JOIN users u ON m.user_id = u.id
+            {where_sql}
+            ORDER BY m.created_at {order}, m.id {order}
+            LIMIT %s
+        """, args + [self.size])
+        rows = cur.fetchall()
+        reactions: Dict[int, Dict[str, int]] = {}
+        if rows:
+            cur.execute("""
+                SELECT message_id, emoji, count
+                FROM message_reaction_counts
+                WHERE message_id = ANY(%s) AND count > 0
+            """, ([row[0] for row in rows],))
+            for message_id, emoji, count in cur.fetchall():
+                reactions.setdefault(message_id, {})[emoji] = count
+        cur.close()
+        conn.rollback()
+
+        entries = []
+        for row in rows:
+            msg_id, text, created_at, voice_url, voice_duration, user_id, username, photo_url, lat, lon = row
+            entries.append({
+                'id': msg_id,
+                'text': text,
+                'created_at': created_at,
+                'voice_url': voice_url,
+                'voice_duration': voice_duration,
+                'user_id': user_id,
+                'username': username,
+                'photo_url': photo_url,
+                'latitude': float(lat) if lat is not None else None,
+                'longitude': float(lon) if lon is not None else None,
+                'reactions': reactions.get(msg_id, {}),
+            })
+        return entries
+
+    def warm_up(self, conn: Any) -> int:
+        """
+        Load the newest `size` messages with authors and reaction counts
+        """
+        if not self.enabled:
+            return 0
+        entries = self._fetch(conn, '', [], 'DESC')
+        entries.reverse()
+        with self._lock:
+            self._entries = entries
+            self._keys = [_key(e) for e in entries]
+            self.complete = len(entries) < self.size
+            self.warm = True
+            self._warmed_at = self._synced_at = time.monotonic()
+            self._stats['warmups'] += 1
+        print(f'[TIMELINE] Warmed up with {len(entries)} messages')
+        return len(entries)
+
+    def sync_tail(self, conn: Any) -> int:
+        """
+        Pull messages committed by other processes since the newest cached one
+        """
+        with self._lock:
+            newest = self._keys[-1][0] if self._keys else None
+        if newest is None:
+            entries = self._fetch(conn, '', [], 'ASC')
+        else:
+            entries = self._fetch(conn, 'WHERE m.created_at >= %s', [newest - SYNC_LOOKBACK], 'ASC')
+        if len(entries) >= self.size:
+            # Хвост не меньше буфера — проще перечитать целиком
+            return self.warm_up(conn)
+        added = sum(1 for entry in entries if self.add_message(entry, count_write=False))
+        with self._lock:
+            self._synced_at = time.monotonic()
+            self._stats['synced'] += added
+        return added
+
+    def refresh(self, conn: Any) -> None:
+        """
+        Called by readers before window(): warm up on first use, re-read the whole
+        buffer every max_age seconds and sync the tail every sync_interval seconds.
+        Only one thread refreshes at a time, the rest read the current buffer
+        """
+        if not self.enabled:
+            return
+        now = time.monotonic()
+        if self.warm and now - self._warmed_at < self.max_age and now - self._synced_at < self.sync_interval:
+            return
+        if not self._refresh_lock.acquire(blocking=not self.warm):
+            return
+        try:
+            now = time.monotonic()
+            if not self.warm or now - self._warmed_at >= self.max_age:
+                self.warm_up(conn)
+            elif now - self._synced_at >= self.sync_interval:
+                self.sync_tail(conn)
+        except Exception as e:
+            print(f'[TIMELINE] Refresh failed: {e}')
+        finally:
+            self._refresh_lock.release()
+
+    def add_message(self, entry: Dict[str, Any], count_write: bool = True) -> bool:
+        """
+        Write-through for a freshly committed message (keys as in _fetch).
+        Returns False if it was already cached or is older than the buffer
+        """
+        if not self.warm:
+            return False
+        entry = dict(entry, reactions=dict(entry.get('reactions') or {}))
+        with self._lock:
+            key = _key(entry)
+            if self._keys and key < self._keys[0] and not self.complete:
+                return False
+            pos = bisect.bisect_left(self._keys, key)
+            if pos < len(self._keys) and self._keys[pos] == key:
+                return False
+            self._keys.insert(pos, key)
+            self._entries.insert(pos, entry)
+            if count_write:
+                self._stats['writes'] += 1
+            if len(self._entries) > self.size:
+                del self._keys[0]
+                del self._entries[0]
+                self.complete = False
+                self._stats['evicted'] += 1
+            return True
+
+    def apply_reaction(self, message_id: int, emoji: str, delta: int) -> None:
+        with self._lock:
+            for entry in reversed(self._entries):
+                if entry['id'] == message_id:
+                    reactions = dict(entry['reactions'])
+                    count = reactions.get(emoji, 0) + delta
+                    if count > 0:
+                        reactions[emoji] = count
+                    else:
+                        reactions.pop(emoji, None)
+                    # Новый dict, а не правка на месте: выданные страницы не меняются под читателем
+                    entry['reactions'] = reactions
+                    self._stats['writes'] += 1
+                    return
+
+    def update_author(self, user_id: int, **fields: Any) -> None:
+        """
+        Propagate profile changes (photo_url, latitude, longitude) to cached messages of the author
+        """
+        with self._lock:
+            for entry in self._entries:
+                if entry['user_id'] == user_id:
+                    entry.update(fields)
+
+    def remove_author(self, user_id: int) -> None:
+        with self._lock:
+            kept = [e for e in self._entries if e['user_id'] != user_id]
+            if len(kept) != len(self._entries):
+                self._entries = kept
+                self._keys = [_key(e) for e in kept]
+
+    def window(
+        self,
+        page: Optional[Tuple[str, Optional[datetime], int]],
+        limit: int,
+        offset: int = 0,
+        predicate: Optional[Callable[[Dict[str, Any]], bool]] = None
+    ) -> Optional[List[Dict[str, Any]]]:
+        """
+        Up to limit + 1 entries for the page in query order (newest first for 'before',
+        oldest first for 'after'), exactly what the SQL path would return.
+        None means the window is not fully inside the buffer — read from the database
+        """
+        if not self.warm:
+            return None
+        with self._lock:
+            result = self._window(page, limit, offset, predicate)
+            self._stats['hits' if result is not None else 'misses'] += 1
+        if result is None:
+            return None
+        # Реакции по emoji (codepoint-порядок, как ORDER BY emoji COLLATE "C" в SQL-путях)
+        return [
+            dict(e, reactions=[{'emoji': k, 'count': v} for k, v in sorted(e['reactions'].items())])
+            for e in result
+        ]
+
+    def _window(self, page, limit, offset, predicate):
+        keys, entries = self._keys, self._entries
+        if not entries and not self.complete:
+            return None
+        direction = page[0] if page else 'before'
+
+        if page:
+            _, created_at, row_id = page
+            if created_at is None:
+                # before_id/after_id: позицию ищем в буфере
+                pos = next((i for i in range(len(entries) - 1, -1, -1) if entries[i]['id'] == row_id), None)
+                if pos is None:
+                    return None
+                key = keys[pos]
+            else:
+                if created_at.tzinfo is not None:
+                    created_at = created_at.astimezone(timezone.utc).replace(tzinfo=None)
+                key = (created_at, row_id)
+            if keys and key < keys[0] and not self.complete:
+                return None
+            if direction == 'after':
+                indexes = range(bisect.bisect_right(keys, key), len(entries))
+            else:
+                indexes = range(bisect.bisect_left(keys, key) - 1, -1, -1)
+            offset = 0
+        else:
+            indexes = range(len(entries) - 1, -1, -1)
+
+        result = []
+        skipped = 0
+        for i in indexes:
+            entry = entries[i]
+            if predicate is not None and not predicate(entry):
+                continue
+            if skipped < offset:
+                skipped += 1
+                continue
+            result.append(entry)
+            if len(result) > limit:
+                return result
+        # Страница дошла до начала буфера: точна, только если за ним нет более старых сообщений
+        if direction == 'after' or self.complete:
+            return result
+        return None
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self._stats['hits'] + self._stats['misses']
+            return {
+                'size': len(self._entries),
+                'capacity': self.size,
+                'warm': self.warm,
+                'complete': self.complete,
+                'hit_rate': round(self._stats['hits'] / lookups, 4) if lookups else 0.0,
+                **self._stats,
+            }
+
+
+timeline = TimelineCache()
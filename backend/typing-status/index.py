@@ -1,11 +1,12 @@
 import json
-import os
 from typing import Dict, Any
-from datetime import datetime, timedelta
+from event_bus import bus
+from ephemeral_store import ephemeral
 
-# Временное хранилище статусов печати (в памяти)
-# Структура: {user_id: {'typing_to': receiver_id, 'timestamp': datetime}}
-typing_statuses: Dict[int, Dict[str, Any]] = {}
+# Статус печати: ключ — кто печатает, значение — кому. Хранилище выбирается
+# EPHEMERAL_STORE (память процесса или общая для воркеров таблица в Postgres)
+TYPING_NAMESPACE = 'typing'
+TYPING_TTL_SECONDS = 3
 
 def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     '''
@@ -40,15 +41,6 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
         }
     
     user_id = int(user_id_str)
-    now = datetime.now()
-    
-    # Очищаем устаревшие статусы (старше 5 секунд)
-    expired_users = []
-    for uid, data in typing_statuses.items():
-        if now - data['timestamp'] > timedelta(seconds=5):
-            expired_users.append(uid)
-    for uid in expired_users:
-        del typing_statuses[uid]
     
     if method == 'GET':
         # Проверяем печатает ли указанный пользователь нам
@@ -64,19 +56,16 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             }
         
         check_user_id = int(check_user_id)
-        typing_data = typing_statuses.get(check_user_id, {})
-        
-        is_typing = (
-            typing_data.get('typing_to') == user_id and
-            now - typing_data.get('timestamp', datetime.min) < timedelta(seconds=3)
-        )
+        # Просроченный статус хранилище не отдаёт
+        typing_to = ephemeral.get(TYPING_NAMESPACE, check_user_id)
+        is_typing = typing_to == user_id
         
         return {
             'statusCode': 200,
             'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
             'body': json.dumps({
                 'is_typing': is_typing,
-                'typing_to': typing_data.get('typing_to') if is_typing else None
+                'typing_to': typing_to if is_typing else None
             }),
             'isBase64Encoded': False
         }
@@ -94,10 +83,9 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             }
         
         typing_to = int(typing_to)
-        typing_statuses[user_id] = {
-            'typing_to': typing_to,
-            'timestamp': now
-        }
+        ephemeral.set(TYPING_NAMESPACE, user_id, typing_to, TYPING_TTL_SECONDS)
+        # Получателю с открытым WebSocket статус приходит сразу, без опроса GET
+        bus.emit([typing_to], {'type': 'typing', 'userId': user_id})
         
         return {
             'statusCode': 200,
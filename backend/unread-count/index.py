@@ -0,0 +1,69 @@
+import json
+from typing import Dict, Any
+from db_utils import get_connection
+from jwt_utils import get_user_id_from_request
+
+def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
+    '''
+    Business: Total unread private messages for the badge, read from the maintained counter
+    Args: event with httpMethod, headers (Authorization or X-User-Id)
+    Returns: HTTP response with unreadCount
+    '''
+    method: str = event.get('httpMethod', 'GET')
+    
+    if method == 'OPTIONS':
+        return {
+            'statusCode': 200,
+            'headers': {
+                'Access-Control-Allow-Origin': '*',
+                'Access-Control-Allow-Methods': 'GET, OPTIONS',
+                'Access-Control-Allow-Headers': 'Content-Type, X-User-Id, Authorization',
+                'Access-Control-Max-Age': '86400'
+            },
+            'body': '',
+            'isBase64Encoded': False
+        }
+    
+    if method != 'GET':
+        return {
+            'statusCode': 405,
+            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+            'body': json.dumps({'error': 'Method not allowed'}),
+            'isBase64Encoded': False
+        }
+    
+    user_id_str = get_user_id_from_request(event)
+    if not user_id_str:
+        return {
+            'statusCode': 401,
+            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+            'body': json.dumps({'error': 'Unauthorized'}),
+            'isBase64Encoded': False
+        }
+    
+    try:
+        user_id = int(user_id_str)
+    except ValueError:
+        return {
+            'statusCode': 400,
+            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+            'body': json.dumps({'error': 'Invalid user id'}),
+            'isBase64Encoded': False
+        }
+    
+    conn = get_connection()
+    cur = conn.cursor()
+    
+    # Одна строка по первичному ключу — private_messages не читаем
+    cur.execute("SELECT unread_count FROM user_unread_counters WHERE user_id = %s", (user_id,))
+    row = cur.fetchone()
+    
+    cur.close()
+    conn.close()
+    
+    return {
+        'statusCode': 200,
+        'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+        'body': json.dumps({'unreadCount': row[0] if row else 0}),
+        'isBase64Encoded': False
+    }
@@ -5,9 +5,10 @@ Returns: HTTP response with success status
 '''
 
 import json
-import os
-import psycopg2
 from typing import Dict, Any
+from db_utils import get_connection
+from presence_buffer import presence_buffer
+from presence_utils import record_activity
 
 def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     method: str = event.get('httpMethod', 'POST')
@@ -82,27 +83,20 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     user_id = int(user_id_str)
     print(f'[UPDATE-ACTIVITY] Starting for user_id={user_id}')
     
-    dsn = os.environ.get('TIMEWEB_DB_URL')
-    # Показываем только host и database name (без пароля)
-    dsn_safe = dsn.split('@')[1] if dsn and '@' in dsn else 'NO_DSN'
-    print(f'[UPDATE-ACTIVITY] DSN exists: {bool(dsn)}, connecting to: {dsn_safe}')
-    
-    if dsn and '?' in dsn:
-        dsn += '&sslmode=require'
-    elif dsn:
-        dsn += '?sslmode=require'
+    # В шлюзе heartbeat только отмечается в памяти — в user_presence его запишет пакетный flush
+    if presence_buffer.touch(user_id):
+        return {
+            'statusCode': 200,
+            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+            'body': json.dumps({'success': True}),
+            'isBase64Encoded': False
+        }
     
-    conn = psycopg2.connect(dsn)
+    conn = get_connection()
     cur = conn.cursor()
-    print(f'[UPDATE-ACTIVITY] Connected to DB')
-    
-    safe_user_id = str(user_id).replace("'", "''")
-    # Use CURRENT_TIMESTAMP AT TIME ZONE 'UTC' to ensure consistent timezone
-    query = f"UPDATE users SET last_activity = (CURRENT_TIMESTAMP AT TIME ZONE 'UTC') WHERE id = '{safe_user_id}'"
-    print(f'[UPDATE-ACTIVITY] Executing: {query}')
     
-    cur.execute(query)
-    rows_affected = cur.rowcount
+    # Активность хранится в узкой user_presence (V0050), а не в горячей строке users
+    rows_affected = record_activity(cur, user_id)
     print(f'[UPDATE-ACTIVITY] Rows affected: {rows_affected}')
     
     conn.commit()
@@ -110,7 +104,6 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     
     cur.close()
     conn.close()
-    print(f'[UPDATE-ACTIVITY] Connection closed')
     
     return {
         'statusCode': 200,
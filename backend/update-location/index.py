@@ -1,7 +1,8 @@
 import json
-import os
-import psycopg2
 from typing import Dict, Any
+from db_utils import get_connection
+from geo_utils import geohash_encode
+from timeline_cache import timeline
 
 def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     '''
@@ -59,13 +60,10 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
         }
     
     user_id = int(user_id_str)
+    # Geohash ячейки для поиска соседей по префиксу (idx_users_geohash)
+    geohash = geohash_encode(float(latitude), float(longitude))
     
-    dsn = os.environ.get('TIMEWEB_DB_URL')
-    if dsn and '?' in dsn:
-        dsn += '&sslmode=require'
-    elif dsn:
-        dsn += '?sslmode=require'
-    conn = psycopg2.connect(dsn)
+    conn = get_connection()
     cur = conn.cursor()
     
     safe_city = city.replace("'", "''") if city else ''
@@ -74,7 +72,7 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     try:
         cur.execute(f"""
             UPDATE users 
-            SET latitude = {latitude}, longitude = {longitude}, city = '{safe_city}'
+            SET latitude = {latitude}, longitude = {longitude}, geohash = '{geohash}', city = '{safe_city}'
             WHERE id = {user_id}
         """)
         affected = cur.rowcount
@@ -91,11 +89,11 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
         except:
             pass
         # Reconnect
-        conn = psycopg2.connect(dsn)
+        conn = get_connection()
         cur = conn.cursor()
         cur.execute(f"""
             UPDATE users 
-            SET latitude = {latitude}, longitude = {longitude}
+            SET latitude = {latitude}, longitude = {longitude}, geohash = '{geohash}'
             WHERE id = {user_id}
         """)
         affected = cur.rowcount
@@ -104,6 +102,9 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
         cur.close()
         conn.close()
     
+    # Расстояния в горячей ленте считаются по текущим координатам автора
+    timeline.update_author(user_id, latitude=float(latitude), longitude=float(longitude))
+    
     return {
         'statusCode': 200,
         'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
@@ -0,0 +1,170 @@
+import asyncio
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional
+
+# Классы обработчиков: у каждого свой пул потоков, чтобы медленные загрузки
+# в S3 не занимали потоки, нужные для чтения чата и heartbeat'ов
+HANDLER_CLASSES: Dict[str, set] = {
+    'chat': {
+        'get-messages', 'send-message', 'add-reaction',
+        'private-messages', 'get-conversations', 'get-user',
+    },
+    'uploads': {
+        'upload-photo', 'upload-photo-http', 'upload-photo-swift',
+        'upload-profile-photo', 'generate-upload-url', 'generate-presigned-url',
+    },
+    'heartbeat': {
+        'update-activity', 'typing-status', 'update-location', 'unread-count', 'presence',
+    },
+    # Long-poll запросы (get-messages?since_id=...) большую часть времени спят в ожидании
+    # события — свой большой пул, чтобы они не занимали потоки chat. Выбирается шлюзом явно
+    'longpoll': set(),
+}
+
+DEFAULT_POOL_SIZES = {'chat': 32, 'uploads': 8, 'heartbeat': 16, 'longpoll': 256, 'default': 16}
+DEFAULT_QUEUE_LIMITS = {'chat': 256, 'uploads': 32, 'heartbeat': 512, 'longpoll': 1024, 'default': 128}
+# Потоки long-poll ждут события без соединения с базой и берут его лишь на повторное
+# чтение (чаще его отдаёт timeline_cache) — в расчёт пула соединений они не входят
+DB_FREE_CLASSES = {'longpoll'}
+
+
+class PoolSaturated(Exception):
+    """Raised when a pool's running + queued calls reached its limit"""
+
+
+class WorkerPool:
+    """
+    Bounded thread pool for synchronous handlers.
+    At most `size` calls run concurrently and at most `queue_limit` more wait;
+    anything beyond that is rejected immediately with PoolSaturated.
+    """
+
+    def __init__(self, name: str, size: int, queue_limit: int):
+        self.name = name
+        self.size = max(1, size)
+        self.queue_limit = max(0, queue_limit)
+        self._executor = ThreadPoolExecutor(max_workers=self.size, thread_name_prefix=f'handler-{name}')
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        self._running = 0
+        self._stats = {
+            'submitted': 0,
+            'completed': 0,
+            'failed': 0,
+            'rejected': 0,
+            'max_queue_depth': 0,
+            'total_wait_ms': 0.0,
+            'total_run_ms': 0.0,
+            'max_wait_ms': 0.0,
+        }
+
+    async def run(self, fn: Callable, *args: Any) -> Any:
+        with self._lock:
+            if self._in_flight >= self.size + self.queue_limit:
+                self._stats['rejected'] += 1
+                raise PoolSaturated(f'worker pool "{self.name}" is saturated')
+            self._in_flight += 1
+            self._stats['submitted'] += 1
+            queued = self._in_flight - self._running
+            if queued > self._stats['max_queue_depth']:
+                self._stats['max_queue_depth'] = queued
+
+        submitted_at = time.perf_counter()
+
+        def call() -> Any:
+            started_at = time.perf_counter()
+            wait_ms = (started_at - submitted_at) * 1000
+            with self._lock:
+                self._running += 1
+                self._stats['total_wait_ms'] += wait_ms
+                if wait_ms > self._stats['max_wait_ms']:
+                    self._stats['max_wait_ms'] = wait_ms
+            ok = False
+            try:
+                result = fn(*args)
+                ok = True
+                return result
+            finally:
+                with self._lock:
+                    self._running -= 1
+                    self._stats['total_run_ms'] += (time.perf_counter() - started_at) * 1000
+                    self._stats['completed' if ok else 'failed'] += 1
+
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._executor, call)
+        finally:
+            with self._lock:
+                self._in_flight -= 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            finished = self._stats['completed'] + self._stats['failed']
+            return {
+                'size': self.size,
+                'queue_limit': self.queue_limit,
+                'running': self._running,
+                'queued': self._in_flight - self._running,
+                'avg_wait_ms': round(self._stats['total_wait_ms'] / finished, 2) if finished else 0.0,
+                'avg_run_ms': round(self._stats['total_run_ms'] / finished, 2) if finished else 0.0,
+                **{k: round(v, 2) if isinstance(v, float) else v for k, v in self._stats.items()
+                   if k not in ('total_wait_ms', 'total_run_ms')},
+            }
+
+    def shutdown(self) -> None:
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+def _env_int(name: str, default: int) -> int:
+    try:
+        return int(os.environ.get(name, default))
+    except ValueError:
+        return default
+
+
+class WorkerPools:
+    """
+    Routes handler calls to the pool of their class.
+    Sizes come from WORKER_POOL_<CLASS>_SIZE / WORKER_POOL_<CLASS>_QUEUE
+    """
+
+    def __init__(self, handler_classes: Optional[Dict[str, set]] = None):
+        self.handler_classes = handler_classes or HANDLER_CLASSES
+        self._class_by_func = {
+            func_name: class_name
+            for class_name, func_names in self.handler_classes.items()
+            for func_name in func_names
+        }
+        self.pools: Dict[str, WorkerPool] = {}
+        for class_name in list(self.handler_classes) + ['default']:
+            prefix = f'WORKER_POOL_{class_name.upper()}'
+            self.pools[class_name] = WorkerPool(
+                class_name,
+                _env_int(f'{prefix}_SIZE', DEFAULT_POOL_SIZES.get(class_name, DEFAULT_POOL_SIZES['default'])),
+                _env_int(f'{prefix}_QUEUE', DEFAULT_QUEUE_LIMITS.get(class_name, DEFAULT_QUEUE_LIMITS['default'])),
+            )
+
+    def pool_for(self, func_name: str, pool_class: Optional[str] = None) -> WorkerPool:
+        if pool_class in self.pools:
+            return self.pools[pool_class]
+        return self.pools[self._class_by_func.get(func_name, 'default')]
+
+    async def run(self, func_name: str, fn: Callable, *args: Any, pool_class: Optional[str] = None) -> Any:
+        return await self.pool_for(func_name, pool_class).run(fn, *args)
+
+    def db_connection_demand(self) -> int:
+        """
+        How many handler threads can ask for a database connection at once.
+        The db_utils pool does not grow to it: threads beyond its cap wait for a connection
+        """
+        return sum(pool.size for name, pool in self.pools.items() if name not in DB_FREE_CLASSES)
+
+    def stats(self) -> Dict[str, Any]:
+        return {name: pool.stats() for name, pool in self.pools.items()}
+
+    def shutdown(self) -> None:
+        for pool in self.pools.values():
+            pool.shutdown()
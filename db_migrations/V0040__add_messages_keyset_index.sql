@@ -0,0 +1,2 @@
+-- Индекс для keyset-пагинации ленты: (created_at, id) < (cursor) вместо OFFSET
+CREATE INDEX IF NOT EXISTS idx_messages_created_at_id ON messages(created_at, id);
@@ -0,0 +1,16 @@
+-- Пространственный индекс для фильтра по радиусу в get-messages.
+-- Если расширения cube/earthdistance доступны — GiST-индекс по ll_to_earth,
+-- иначе остаётся B-tree idx_users_location (latitude, longitude) для bounding box
+CREATE INDEX IF NOT EXISTS idx_users_location ON users(latitude, longitude);
+
+DO $$
+BEGIN
+    CREATE EXTENSION IF NOT EXISTS cube;
+    CREATE EXTENSION IF NOT EXISTS earthdistance;
+    CREATE INDEX IF NOT EXISTS idx_users_location_earth
+        ON users USING gist (ll_to_earth(latitude::float8, longitude::float8))
+        WHERE latitude IS NOT NULL AND longitude IS NOT NULL;
+EXCEPTION WHEN OTHERS THEN
+    RAISE NOTICE 'earthdistance is not available, using idx_users_location: %', SQLERRM;
+END
+$$;
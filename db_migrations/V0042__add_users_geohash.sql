@@ -0,0 +1,44 @@
+-- Geohash ячейки пользователя для индексированного поиска соседей по префиксу.
+-- Колонку поддерживают update-location и register (geo_utils.geohash_encode, 9 символов)
+ALTER TABLE users ADD COLUMN IF NOT EXISTS geohash VARCHAR(12);
+
+CREATE INDEX IF NOT EXISTS idx_users_geohash ON users (geohash varchar_pattern_ops);
+
+-- Заполняем geohash для уже сохранённых координат (та же кодировка, что и в geo_utils.py)
+CREATE OR REPLACE FUNCTION pg_temp.geohash_encode(lat DOUBLE PRECISION, lon DOUBLE PRECISION, geohash_length INTEGER)
+RETURNS TEXT AS $$
+DECLARE
+    base32 TEXT := '0123456789bcdefghjkmnpqrstuvwxyz';
+    lat_min DOUBLE PRECISION := -90;
+    lat_max DOUBLE PRECISION := 90;
+    lon_min DOUBLE PRECISION := -180;
+    lon_max DOUBLE PRECISION := 180;
+    mid DOUBLE PRECISION;
+    ch INTEGER := 0;
+    bit INTEGER := 0;
+    even BOOLEAN := TRUE;
+    result TEXT := '';
+BEGIN
+    WHILE length(result) < geohash_length LOOP
+        IF even THEN
+            mid := (lon_min + lon_max) / 2;
+            IF lon >= mid THEN ch := ch * 2 + 1; lon_min := mid; ELSE ch := ch * 2; lon_max := mid; END IF;
+        ELSE
+            mid := (lat_min + lat_max) / 2;
+            IF lat >= mid THEN ch := ch * 2 + 1; lat_min := mid; ELSE ch := ch * 2; lat_max := mid; END IF;
+        END IF;
+        even := NOT even;
+        bit := bit + 1;
+        IF bit = 5 THEN
+            result := result || substr(base32, ch + 1, 1);
+            bit := 0;
+            ch := 0;
+        END IF;
+    END LOOP;
+    RETURN result;
+END
+$$ LANGUAGE plpgsql IMMUTABLE;
+
+UPDATE users
+SET geohash = pg_temp.geohash_encode(latitude::float8, longitude::float8, 9)
+WHERE latitude IS NOT NULL AND longitude IS NOT NULL AND geohash IS NULL;
@@ -0,0 +1,15 @@
+-- Денормализованные счётчики реакций: лента читает готовые числа вместо GROUP BY по message_reactions.
+-- Поддерживаются add-reaction в той же транзакции; пересчёт — scripts/rebuild_reaction_counts.py
+CREATE TABLE IF NOT EXISTS message_reaction_counts (
+    message_id INTEGER NOT NULL,
+    emoji VARCHAR(10) NOT NULL,
+    count INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (message_id, emoji)
+);
+
+INSERT INTO message_reaction_counts (message_id, emoji, count)
+SELECT message_id, emoji, COUNT(*)
+FROM message_reactions
+WHERE message_id IS NOT NULL
+GROUP BY message_id, emoji
+ON CONFLICT (message_id, emoji) DO UPDATE SET count = EXCLUDED.count;
@@ -0,0 +1,13 @@
+-- Главное фото пользователя прямо в users: лента, диалоги и профиль читают аватар
+-- из уже присоединённой строки users без DISTINCT ON по user_photos.
+-- Поддерживается profile-photos при добавлении, удалении и смене главного фото
+ALTER TABLE users ADD COLUMN IF NOT EXISTS primary_photo_url TEXT;
+
+UPDATE users u
+SET primary_photo_url = p.photo_url
+FROM (
+    SELECT DISTINCT ON (user_id) user_id, photo_url
+    FROM user_photos
+    ORDER BY user_id, display_order ASC, created_at DESC
+) p
+WHERE p.user_id = u.id;
@@ -0,0 +1,32 @@
+-- Диалог = упорядоченная пара пользователей (user_low_id <= user_high_id). История переписки
+-- читается одним диапазоном индекса (conversation_id, created_at, id) вместо OR по двум
+-- направлениям sender/receiver. Новые сообщения получают conversation_id в private-messages
+CREATE TABLE IF NOT EXISTS conversations (
+    id SERIAL PRIMARY KEY,
+    user_low_id INTEGER NOT NULL,
+    user_high_id INTEGER NOT NULL,
+    created_at TIMESTAMP DEFAULT (CURRENT_TIMESTAMP AT TIME ZONE 'UTC'),
+    UNIQUE (user_low_id, user_high_id),
+    CHECK (user_low_id <= user_high_id)
+);
+
+CREATE INDEX IF NOT EXISTS idx_conversations_user_high ON conversations(user_high_id);
+
+ALTER TABLE private_messages ADD COLUMN IF NOT EXISTS conversation_id INTEGER;
+
+INSERT INTO conversations (user_low_id, user_high_id, created_at)
+SELECT LEAST(sender_id, receiver_id), GREATEST(sender_id, receiver_id), MIN(created_at)
+FROM private_messages
+WHERE sender_id IS NOT NULL AND receiver_id IS NOT NULL
+GROUP BY LEAST(sender_id, receiver_id), GREATEST(sender_id, receiver_id)
+ON CONFLICT (user_low_id, user_high_id) DO NOTHING;
+
+UPDATE private_messages pm
+SET conversation_id = c.id
+FROM conversations c
+WHERE pm.conversation_id IS NULL
+  AND c.user_low_id = LEAST(pm.sender_id, pm.receiver_id)
+  AND c.user_high_id = GREATEST(pm.sender_id, pm.receiver_id);
+
+CREATE INDEX IF NOT EXISTS idx_private_messages_conversation_created
+    ON private_messages(conversation_id, created_at, id);
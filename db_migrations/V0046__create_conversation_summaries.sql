@@ -0,0 +1,34 @@
+-- Сводка диалогов для входящих: по строке на (пользователь, собеседник) с последним
+-- сообщением и числом непрочитанных. get-conversations читает только её, без оконной
+-- функции по всей переписке. Поддерживается private-messages (отправка, удаление,
+-- прочтение) в той же транзакции; пересчёт — scripts/rebuild_conversation_summaries.py
+CREATE TABLE IF NOT EXISTS conversation_summaries (
+    user_id INTEGER NOT NULL,
+    peer_id INTEGER NOT NULL,
+    conversation_id INTEGER,
+    last_message_id INTEGER,
+    last_message TEXT,
+    last_message_at TIMESTAMP,
+    unread_count INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (user_id, peer_id)
+);
+
+CREATE INDEX IF NOT EXISTS idx_conversation_summaries_inbox
+    ON conversation_summaries(user_id, last_message_at DESC);
+CREATE INDEX IF NOT EXISTS idx_conversation_summaries_conversation
+    ON conversation_summaries(conversation_id);
+
+INSERT INTO conversation_summaries
+    (user_id, peer_id, conversation_id, last_message_id, last_message, last_message_at, unread_count)
+SELECT s.user_id, s.peer_id, s.conversation_id, s.id, s.text, s.created_at,
+       (SELECT COUNT(*) FROM private_messages u
+        WHERE u.receiver_id = s.user_id AND u.sender_id = s.peer_id AND u.is_read = FALSE)
+FROM (
+    SELECT DISTINCT ON (side.user_id, side.peer_id)
+           side.user_id, side.peer_id, pm.conversation_id, pm.id, pm.text, pm.created_at
+    FROM private_messages pm
+    CROSS JOIN LATERAL (VALUES (pm.sender_id, pm.receiver_id), (pm.receiver_id, pm.sender_id)) AS side(user_id, peer_id)
+    WHERE pm.sender_id IS NOT NULL AND pm.receiver_id IS NOT NULL
+    ORDER BY side.user_id, side.peer_id, pm.created_at DESC, pm.id DESC
+) s
+ON CONFLICT (user_id, peer_id) DO NOTHING;
@@ -0,0 +1,16 @@
+-- Счётчик непрочитанных личных сообщений на пользователя: значок «N новых» читает одну
+-- строку по первичному ключу вместо COUNT(*) по private_messages. Поддерживается
+-- private-messages (отправка, удаление, прочтение) в той же транзакции;
+-- сверка с перепиской — scripts/reconcile_unread_counters.py
+CREATE TABLE IF NOT EXISTS user_unread_counters (
+    user_id INTEGER PRIMARY KEY,
+    unread_count INTEGER NOT NULL DEFAULT 0,
+    updated_at TIMESTAMP DEFAULT (CURRENT_TIMESTAMP AT TIME ZONE 'UTC')
+);
+
+INSERT INTO user_unread_counters (user_id, unread_count)
+SELECT receiver_id, COUNT(*)
+FROM private_messages
+WHERE is_read = FALSE AND receiver_id IS NOT NULL
+GROUP BY receiver_id
+ON CONFLICT (user_id) DO UPDATE SET unread_count = EXCLUDED.unread_count;
@@ -0,0 +1,27 @@
+-- Прочтение — водяной знак на диалог: сообщения собеседника с id <= last_read_message_id
+-- прочитаны. Открытие чата меняет одну строку сводки вместо UPDATE is_read по каждому
+-- сообщению; private_messages.is_read больше не пишется и не читается
+ALTER TABLE conversation_summaries ADD COLUMN IF NOT EXISTS last_read_message_id INTEGER;
+
+-- Знак ставим перед первым непрочитанным сообщением собеседника, а если таких нет —
+-- на последнее сообщение диалога
+UPDATE conversation_summaries cs
+SET last_read_message_id = COALESCE(
+    (SELECT MIN(pm.id) - 1 FROM private_messages pm
+     WHERE pm.receiver_id = cs.user_id AND pm.sender_id = cs.peer_id AND pm.is_read = FALSE),
+    (SELECT MAX(pm.id) FROM private_messages pm WHERE pm.conversation_id = cs.conversation_id)
+)
+WHERE cs.last_read_message_id IS NULL;
+
+UPDATE conversation_summaries cs
+SET unread_count = (
+    SELECT COUNT(*) FROM private_messages pm
+    WHERE pm.receiver_id = cs.user_id AND pm.sender_id = cs.peer_id
+      AND pm.id > COALESCE(cs.last_read_message_id, 0)
+);
+
+INSERT INTO user_unread_counters (user_id, unread_count)
+SELECT user_id, SUM(unread_count)
+FROM conversation_summaries
+GROUP BY user_id
+ON CONFLICT (user_id) DO UPDATE SET unread_count = EXCLUDED.unread_count;
@@ -0,0 +1,12 @@
+-- Короткоживущее состояние («печатает...» и т.п.), общее для всех процессов шлюза.
+-- UNLOGGED: не пишется в WAL и очищается после сбоя — для данных со сроком жизни
+-- в секунды это не потеря. Используется ephemeral_store при EPHEMERAL_STORE=postgres
+CREATE UNLOGGED TABLE IF NOT EXISTS ephemeral_state (
+    namespace VARCHAR(32) NOT NULL,
+    key VARCHAR(64) NOT NULL,
+    value TEXT NOT NULL,
+    expires_at TIMESTAMPTZ NOT NULL,
+    PRIMARY KEY (namespace, key)
+) WITH (fillfactor = 70);
+
+CREATE INDEX IF NOT EXISTS idx_ephemeral_state_expires ON ephemeral_state(expires_at);
@@ -0,0 +1,18 @@
+-- Присутствие пользователей отдельно от users: last_activity обновлялся каждым
+-- heartbeat'ом и отправкой сообщения, и самая читаемая таблица (логин, лента,
+-- профили) копила мёртвые версии строк и блокировки. Узкая таблица из двух колонок:
+-- fillfactor 50 оставляет на странице место, и обновления идут как HOT (индекса
+-- на last_activity нет). UNLOGGED — без WAL; после сбоя таблица пуста, и читатели
+-- берут users.last_activity (значение на момент миграции) до первого heartbeat'а
+CREATE UNLOGGED TABLE IF NOT EXISTS user_presence (
+    user_id INTEGER PRIMARY KEY REFERENCES users(id) ON DELETE CASCADE,
+    last_activity TIMESTAMP NOT NULL
+) WITH (
+    fillfactor = 50,
+    autovacuum_vacuum_scale_factor = 0.05,
+    autovacuum_analyze_scale_factor = 0.1
+);
+
+INSERT INTO user_presence (user_id, last_activity)
+SELECT id, last_activity FROM users WHERE last_activity IS NOT NULL
+ON CONFLICT (user_id) DO NOTHING;
@@ -1,26 +1,41 @@
 from flask import Flask, request, jsonify
 from flask_cors import CORS
-import psycopg2
 from psycopg2.extras import RealDictCursor
 import os
+import sys
 import hashlib
+import threading
 from datetime import datetime
 
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'backend'))
+from db_utils import ConnectionPool
+from cursor_utils import encode_cursor, parse_page_params, keyset_clause
+from timeline_cache import timeline
+
 app = Flask(__name__)
 CORS(app)
 
+_db_pool = None
+_db_pool_lock = threading.Lock()
+
 def get_db():
-    db_host = os.environ.get('DB_HOST')
-    db_port = os.environ.get('DB_PORT', '5432')
-    db_name = os.environ.get('DB_NAME')
-    db_user = os.environ.get('DB_USER')
-    db_pass = os.environ.get('DB_PASSWORD')
-    
-    if not all([db_host, db_name, db_user, db_pass]):
-        raise Exception("DB config missing")
-    
-    dsn = f"postgresql://{db_user}:{db_pass}@{db_host}:{db_port}/{db_name}"
-    return psycopg2.connect(dsn, cursor_factory=RealDictCursor)
+    global _db_pool
+    if _db_pool is None:
+        db_host = os.environ.get('DB_HOST')
+        db_port = os.environ.get('DB_PORT', '5432')
+        db_name = os.environ.get('DB_NAME')
+        db_user = os.environ.get('DB_USER')
+        db_pass = os.environ.get('DB_PASSWORD')
+        
+        if not all([db_host, db_name, db_user, db_pass]):
+            raise Exception("DB config missing")
+        
+        dsn = f"postgresql://{db_user}:{db_pass}@{db_host}:{db_port}/{db_name}"
+        with _db_pool_lock:
+            if _db_pool is None:
+                _db_pool = ConnectionPool(dsn, connect_kwargs={'cursor_factory': RealDictCursor})
+    # conn.close() возвращает соединение в пул
+    return _db_pool.getconn()
 
 def hash_password(password: str) -> str:
     return hashlib.sha256(password.encode()).hexdigest()
@@ -56,55 +71,77 @@ def get_messages():
     limit = int(request.args.get('limit', 20))
     offset = int(request.args.get('offset', 0))
     
+    try:
+        page = parse_page_params(request.args)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    
+    direction = page[0] if page else 'before'
+    order = 'ASC' if direction == 'after' else 'DESC'
+    where_sql = ''
+    query_args = []
+    if page:
+        where_sql, query_args = keyset_clause(page, 'm', 'messages')
+        where_sql = 'WHERE ' + where_sql
+    query_args += [limit + 1, 0 if page else offset]
+    
     conn = get_db()
     cur = conn.cursor()
     
-    cur.execute("""
-        SELECT 
-            m.id, m.text, m.created_at, m.voice_url, m.voice_duration,
-            u.id as user_id, u.username
-        FROM messages m
-        JOIN users u ON m.user_id = u.id
-        ORDER BY m.created_at DESC
-        LIMIT %s OFFSET %s
-    """, (limit, offset))
-    
-    rows = cur.fetchall()
+    # Горячая лента в памяти процесса; при промахе — обычный запрос
+    timeline.refresh(conn)
+    cached = timeline.window(page, limit, offset)
+    if cached is not None:
+        rows = [dict(e, primary_photo_url=e['photo_url']) for e in cached]
+        reactions_map = {e['id']: e['reactions'] for e in cached}
+    else:
+        cur.execute(f"""
+            SELECT 
+                m.id, m.text, m.created_at, m.voice_url, m.voice_duration,
+                u.id as user_id, u.username, u.primary_photo_url
+            FROM messages m
+            JOIN users u ON m.user_id = u.id
+            {where_sql}
+            ORDER BY m.created_at {order}, m.id {order}
+            LIMIT %s OFFSET %s
+        """, query_args)
+        
+        rows = cur.fetchall()
+        reactions_map = None
+    
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    
+    if rows:
+        next_cursor = encode_cursor(direction, rows[-1]['created_at'], rows[-1]['id']) if has_more or direction == 'after' else None
+    else:
+        next_cursor = request.args.get('cursor') if direction == 'after' else None
     
     if not rows:
         cur.close()
         conn.close()
-        return jsonify({"messages": []})
-    
-    message_ids = [row['id'] for row in rows]
-    user_ids = list(set([row['user_id'] for row in rows]))
-    
-    cur.execute("""
-        SELECT message_id, emoji, COUNT(*) as count
-        FROM message_reactions
-        WHERE message_id = ANY(%s)
-        GROUP BY message_id, emoji
-    """, (message_ids,))
-    
-    reactions_map = {}
-    for r in cur.fetchall():
-        msg_id = r['message_id']
-        if msg_id not in reactions_map:
-            reactions_map[msg_id] = []
-        reactions_map[msg_id].append({'emoji': r['emoji'], 'count': r['count']})
-    
-    cur.execute("""
-        SELECT DISTINCT ON (user_id) user_id, photo_url
-        FROM user_photos
-        WHERE user_id = ANY(%s)
-        ORDER BY user_id, display_order ASC, created_at DESC
-    """, (user_ids,))
-    
-    avatars_map = {row['user_id']: row['photo_url'] for row in cur.fetchall()}
+        return jsonify({"messages": [], "next_cursor": next_cursor, "has_more": False})
+    
+    if reactions_map is None:
+        message_ids = [row['id'] for row in rows]
+        
+        cur.execute("""
+            SELECT message_id, emoji, count
+            FROM message_reaction_counts
+            WHERE message_id = ANY(%s) AND count > 0
+            ORDER BY message_id, emoji COLLATE "C"
+        """, (message_ids,))
+        
+        reactions_map = {}
+        for r in cur.fetchall():
+            msg_id = r['message_id']
+            if msg_id not in reactions_map:
+                reactions_map[msg_id] = []
+            reactions_map[msg_id].append({'emoji': r['emoji'], 'count': r['count']})
     
     messages = []
     for row in rows:
-        user_avatar = avatars_map.get(row['user_id'], f"https://api.dicebear.com/7.x/avataaars/svg?seed={row['username']}")
+        user_avatar = row['primary_photo_url'] or f"https://api.dicebear.com/7.x/avataaars/svg?seed={row['username']}"
         messages.append({
             'id': row['id'],
             'text': row['text'],
@@ -119,12 +156,13 @@ def get_messages():
             'reactions': reactions_map.get(row['id'], [])
         })
     
-    messages.reverse()
+    if direction != 'after':
+        messages.reverse()
     
     cur.close()
     conn.close()
     
-    return jsonify({"messages": messages})
+    return jsonify({"messages": messages, "next_cursor": next_cursor, "has_more": has_more})
 
 @app.route('/login', methods=['POST', 'OPTIONS'])
 def login():
@@ -167,13 +205,15 @@ def get_unread_count():
     conn = get_db()
     cur = conn.cursor()
     
+    # Поддерживаемый счётчик (V0047) — значок не сканирует private_messages
     cur.execute("""
-        SELECT COUNT(*) as count
-        FROM private_messages
-        WHERE receiver_id = %s AND is_read = FALSE
+        SELECT unread_count
+        FROM user_unread_counters
+        WHERE user_id = %s
     """, (int(user_id),))
     
-    count = cur.fetchone()['count']
+    row = cur.fetchone()
+    count = row['unread_count'] if row else 0
     
     cur.close()
     conn.close()
@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+"""
+Бенчмарк get-messages: построчный движок (engine=rows, несколько запросов + сборка
+ответа в Python) против engine=json (весь ответ собирается в Postgres одним запросом)
+
+--rtt-ms добавляет искусственную задержку на каждый запрос к базе, чтобы
+на локальной базе смоделировать round trip до managed-БД в другом регионе
+
+Запуск: TIMEWEB_DB_URL=postgresql://... python3 scripts/bench_feed.py [--requests 200] [--limit 20] [--rtt-ms 5]
+"""
+import argparse
+import importlib.util
+import json
+import os
+import statistics
+import sys
+import time
+
+# Горячая лента в памяти отдала бы обоим движкам одну и ту же страницу —
+# сравниваем сами движки (TIMELINE_CACHE_SIZE=... включает кэш обратно)
+os.environ.setdefault('TIMELINE_CACHE_SIZE', '0')
+
+BACKEND_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'backend')
+sys.path.insert(0, BACKEND_DIR)
+import db_utils
+
+
+class Counter:
+    queries = 0
+    rtt = 0.0
+
+
+class TimedCursor:
+    """Считает execute() и добавляет --rtt-ms к каждому"""
+
+    def __init__(self, cur):
+        self._cur = cur
+
+    def __getattr__(self, name):
+        return getattr(self._cur, name)
+
+    def execute(self, *args, **kwargs):
+        Counter.queries += 1
+        if Counter.rtt:
+            time.sleep(Counter.rtt)
+        return self._cur.execute(*args, **kwargs)
+
+
+def load_handler():
+    spec = importlib.util.spec_from_file_location('get_messages', os.path.join(BACKEND_DIR, 'get-messages', 'index.py'))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    get_connection = db_utils.get_connection
+
+    def timed_connection():
+        conn = get_connection()
+        cursor = conn.cursor
+        conn.__dict__['cursor'] = lambda *a, **kw: TimedCursor(cursor(*a, **kw))
+        return conn
+
+    module.get_connection = timed_connection
+    return module.handler
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--requests', type=int, default=200)
+    parser.add_argument('--limit', type=int, default=20)
+    parser.add_argument('--radius', default='100')
+    parser.add_argument('--user-id', default='1')
+    parser.add_argument('--rtt-ms', type=float, default=0.0)
+    args = parser.parse_args()
+
+    Counter.rtt = args.rtt_ms / 1000
+    handler = load_handler()
+
+    def request(engine):
+        event = {
+            'httpMethod': 'GET',
+            'headers': {'X-User-Id': args.user_id},
+            'queryStringParameters': {'limit': str(args.limit), 'radius': args.radius, 'engine': engine},
+        }
+        return handler(event, None)
+
+    # Оба движка должны отдавать одинаковый ответ. Дробные числа сравниваем текстом:
+    # 12.30 и 12.3 равны как float, но клиент получает разные байты
+    rows_body = json.loads(request('rows')['body'], parse_float=str)
+    json_body = json.loads(request('json')['body'], parse_float=str)
+    assert rows_body == json_body, 'engines returned different payloads'
+
+    print(f"{'engine':<8} {'queries/req':>11} {'mean ms':>9} {'p50 ms':>8} {'p95 ms':>8} {'req/s':>8}")
+    for engine in ('rows', 'json'):
+        for _ in range(10):
+            request(engine)
+        Counter.queries = 0
+        timings = []
+        for _ in range(args.requests):
+            started = time.perf_counter()
+            request(engine)
+            timings.append((time.perf_counter() - started) * 1000)
+        timings.sort()
+        mean = statistics.mean(timings)
+        print(f'{engine:<8} {Counter.queries / args.requests:>11.1f} {mean:>9.2f} '
+              f'{timings[len(timings) // 2]:>8.2f} {timings[int(len(timings) * 0.95)]:>8.2f} {1000 / mean:>8.0f}')
+
+    db_utils.close_pool()
+
+
+if __name__ == '__main__':
+    main()
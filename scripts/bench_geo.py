@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+"""
+Микробенчмарк расчёта расстояний: скалярный гаверсинус (как раньше в get-messages)
+против батчевого haversine_batch из backend/geo_utils.py (NumPy и чистый Python)
+
+Запуск: python3 scripts/bench_geo.py [--sizes 10000,100000,1000000]
+"""
+import argparse
+import os
+import random
+import sys
+import time
+from math import radians, cos, sin, asin, sqrt
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'backend'))
+import geo_utils
+
+
+def calculate_distance(lat1, lon1, lat2, lon2):
+    """Старая скалярная версия из get-messages"""
+    if not all([lat1, lon1, lat2, lon2]):
+        return float('inf')
+    lat1, lon1, lat2, lon2 = map(float, [lat1, lon1, lat2, lon2])
+    lat1, lon1, lat2, lon2 = map(radians, [lat1, lon1, lat2, lon2])
+    dlat = lat2 - lat1
+    dlon = lon2 - lon1
+    a = sin(dlat/2)**2 + cos(lat1) * cos(lat2) * sin(dlon/2)**2
+    return 6371 * 2 * asin(sqrt(a))
+
+
+def timed(fn):
+    start = time.perf_counter()
+    result = fn()
+    return time.perf_counter() - start, result
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--sizes', default='10000,100000,1000000')
+    args = parser.parse_args()
+
+    origin_lat, origin_lon = 61.6167, 72.1667  # Лянтор
+    random.seed(42)
+    print(f"{'points':>10} {'variant':<22} {'seconds':>9} {'Mpts/s':>8} {'speedup':>8}")
+    for n in [int(x) for x in args.sizes.split(',')]:
+        lats = [random.uniform(41.0, 70.0) for _ in range(n)]
+        lons = [random.uniform(20.0, 180.0) for _ in range(n)]
+
+        variants = [
+            ('scalar (old)', lambda: [calculate_distance(origin_lat, origin_lon, a, b) for a, b in zip(lats, lons)]),
+            ('batch pure python', lambda: geo_utils.haversine_batch(origin_lat, origin_lon, lats, lons, use_numpy=False)),
+        ]
+        if geo_utils.np is not None:
+            lat_arr = geo_utils.np.array(lats)
+            lon_arr = geo_utils.np.array(lons)
+            variants += [
+                ('batch numpy (lists)', lambda: geo_utils.haversine_batch(origin_lat, origin_lon, lats, lons, use_numpy=True)),
+                ('batch numpy (arrays)', lambda: geo_utils.haversine_batch_arrays(origin_lat, origin_lon, lat_arr, lon_arr)),
+            ]
+
+        baseline = None
+        reference = None
+        for name, fn in variants:
+            seconds, result = timed(fn)
+            baseline = baseline or seconds
+            if reference is None:
+                reference = result
+            else:
+                assert abs(float(result[n // 2]) - reference[n // 2]) < 1e-6, name
+            print(f'{n:>10} {name:<22} {seconds:>9.4f} {n / seconds / 1e6:>8.2f} {baseline / seconds:>7.1f}x')
+        print()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+"""
+Бенчмарк записи активности: UPDATE users SET last_activity (как было до V0050)
+против upsert в узкую user_presence (UNLOGGED, fillfactor 50)
+
+Обе схемы воспроизводятся на временных копиях (bench_users со всеми индексами users
+и bench_presence по определению из V0050), рабочие таблицы не меняются. Каждый
+heartbeat — отдельная транзакция, как update-activity вне шлюза. Автоочистка на
+копиях выключена, чтобы прирост размера показывал накопленные мёртвые версии строк.
+Для каждой схемы печатаются обновлений в секунду, доля HOT-обновлений, мёртвые
+строки и рост размера users (таблица + индексы)
+
+Запуск: TIMEWEB_DB_URL=postgresql://... python3 scripts/bench_presence.py [--updates 20000] [--workers 4]
+"""
+import argparse
+import os
+import random
+import sys
+import threading
+import time
+
+import psycopg2
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'backend'))
+import db_utils
+
+NOW_SQL = "CURRENT_TIMESTAMP AT TIME ZONE 'UTC'"
+
+SCHEMES = {
+    # До V0050: heartbeat обновляет строку users целиком
+    'users': (
+        'bench_users',
+        f"UPDATE bench_users SET last_activity = {NOW_SQL} WHERE id = %s",
+    ),
+    # После V0050: узкая строка в user_presence, users не трогается
+    'presence': (
+        'bench_presence',
+        f"""
+        INSERT INTO bench_presence (user_id, last_activity) VALUES (%s, {NOW_SQL})
+        ON CONFLICT (user_id) DO UPDATE SET last_activity = EXCLUDED.last_activity
+        """,
+    ),
+}
+
+
+def connect():
+    conn = psycopg2.connect(db_utils.build_dsn())
+    conn.autocommit = True
+    return conn
+
+
+def setup(cur):
+    cur.execute("DROP TABLE IF EXISTS bench_presence, bench_users")
+    cur.execute("CREATE TABLE bench_users (LIKE users INCLUDING ALL) WITH (autovacuum_enabled = false)")
+    cur.execute("INSERT INTO bench_users SELECT * FROM users")
+    cur.execute("""
+        CREATE UNLOGGED TABLE bench_presence (
+            user_id INTEGER PRIMARY KEY REFERENCES bench_users(id) ON DELETE CASCADE,
+            last_activity TIMESTAMP NOT NULL
+        ) WITH (fillfactor = 50, autovacuum_enabled = false)
+    """)
+    cur.execute("""
+        INSERT INTO bench_presence (user_id, last_activity)
+        SELECT id, COALESCE(last_activity, CURRENT_TIMESTAMP) FROM bench_users
+    """)
+    cur.execute("VACUUM ANALYZE bench_users")
+    cur.execute("VACUUM ANALYZE bench_presence")
+    cur.execute("SELECT id FROM bench_users")
+    return [row[0] for row in cur.fetchall()]
+
+
+def table_stats(cur, table):
+    # Статистика пишется при закрытии соединений воркеров; сбрасываем снимок этого сеанса
+    cur.execute("SELECT pg_stat_clear_snapshot()")
+    cur.execute("""
+        SELECT pg_relation_size(c.oid), pg_total_relation_size(c.oid),
+               COALESCE(s.n_tup_upd, 0), COALESCE(s.n_tup_hot_upd, 0), COALESCE(s.n_dead_tup, 0)
+        FROM pg_class c
+        LEFT JOIN pg_stat_user_tables s ON s.relid = c.oid
+        WHERE c.oid = %s::regclass
+    """, (table,))
+    heap, total, updated, hot, dead = cur.fetchone()
+    return {'heap': heap, 'total': total, 'updated': updated, 'hot': hot, 'dead': dead}
+
+
+def run_scheme(sql, user_ids, updates, workers):
+    def worker(count, seed):
+        rng = random.Random(seed)
+        conn = connect()
+        cur = conn.cursor()
+        for _ in range(count):
+            cur.execute(sql, (rng.choice(user_ids),))
+        cur.close()
+        conn.close()
+
+    per_worker = updates // workers
+    threads = [threading.Thread(target=worker, args=(per_worker, seed)) for seed in range(workers)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return per_worker * workers / (time.perf_counter() - started)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--updates', type=int, default=20000)
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--keep', action='store_true', help='не удалять bench_* таблицы')
+    args = parser.parse_args()
+
+    conn = connect()
+    cur = conn.cursor()
+    user_ids = setup(cur)
+    if not user_ids:
+        sys.exit('users is empty: nothing to benchmark')
+    print(f'{len(user_ids)} users, {args.updates} heartbeats, {args.workers} workers\n')
+
+    print(f"{'scheme':<9} {'upd/s':>8} {'hot %':>6} {'dead':>7} {'table KB':>15} {'users KB':>15}")
+    try:
+        for scheme, (table, sql) in SCHEMES.items():
+            users_before = table_stats(cur, 'bench_users')
+            before = table_stats(cur, table)
+            rate = run_scheme(sql, user_ids, args.updates, args.workers)
+            time.sleep(0.5)
+            after = table_stats(cur, table)
+            users_after = table_stats(cur, 'bench_users')
+            updated = after['updated'] - before['updated']
+            hot = (after['hot'] - before['hot']) / updated * 100 if updated else 0.0
+            print(f"{scheme:<9} {rate:>8.0f} {hot:>6.1f} {after['dead']:>7} "
+                  f"{before['total'] // 1024:>6} → {after['total'] // 1024:<6} "
+                  f"{users_before['total'] // 1024:>6} → {users_after['total'] // 1024:<6}")
+    finally:
+        if not args.keep:
+            cur.execute("DROP TABLE IF EXISTS bench_presence, bench_users")
+        cur.close()
+        conn.close()
+
+
+if __name__ == '__main__':
+    main()
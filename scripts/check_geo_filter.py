@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+"""
+Проверка предфильтров радиуса из backend/geo_utils.py: рамка bounding_box и покрытие
+covering_geohashes должны содержать каждую точку, которая по точному гаверсинусу
+лежит в радиусе (иначе radius_filter_sql теряет пользователей и сообщения).
+Точки берутся у самой окружности, центры — в том числе на больших широтах
+
+Запуск: python3 scripts/check_geo_filter.py [--origins 400] [--points 400] [--seed 1]
+Код выхода 1, если хоть одна точка в радиусе не попала в предфильтр
+"""
+import argparse
+import os
+import random
+import sys
+from math import asin, atan2, cos, degrees, radians, sin
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'backend'))
+import geo_utils
+
+# Радиусы интерфейса (get-messages) и шаги расширения nearby-users
+RADII_KM = [1, 5, 10, 50, 100, 500, 1000, 2000, 5000, 10000]
+
+
+def destination(lat, lon, bearing, distance_km):
+    """Точка на расстоянии distance_km по азимуту bearing (сфера радиуса EARTH_RADIUS_KM)"""
+    angle = distance_km / geo_utils.EARTH_RADIUS_KM
+    lat1, lon1, bearing = radians(lat), radians(lon), radians(bearing)
+    lat2 = asin(sin(lat1) * cos(angle) + cos(lat1) * sin(angle) * cos(bearing))
+    lon2 = lon1 + atan2(sin(bearing) * sin(angle) * cos(lat1), cos(angle) - sin(lat1) * sin(lat2))
+    return degrees(lat2), (degrees(lon2) + 540.0) % 360.0 - 180.0
+
+
+def check(origins, points, rng):
+    box_misses = geohash_misses = checked = 0
+    for _ in range(origins):
+        lat = rng.choice([rng.uniform(-85.0, 85.0), rng.uniform(50.0, 75.0), rng.uniform(-75.0, -50.0)])
+        lon = rng.uniform(-179.0, 179.0)
+        for radius in RADII_KM:
+            min_lat, max_lat, min_lon, max_lon = geo_utils.bounding_box(lat, lon, radius)
+            prefixes = geo_utils.covering_geohashes(lat, lon, radius)
+            for _ in range(points // len(RADII_KM)):
+                # Большая часть точек — у самой окружности, где рамка теряла их раньше
+                p_lat, p_lon = destination(lat, lon, rng.uniform(0.0, 360.0), radius * rng.uniform(0.98, 1.0))
+                if geo_utils.haversine_km(lat, lon, p_lat, p_lon) > radius:
+                    continue
+                checked += 1
+                in_box = min_lat <= p_lat <= max_lat and (min_lon is None or min_lon <= p_lon <= max_lon)
+                if not in_box:
+                    box_misses += 1
+                    if box_misses <= 5:
+                        print(f'box miss: origin ({lat:.3f}, {lon:.3f}) r={radius} point ({p_lat:.4f}, {p_lon:.4f})')
+                if not any(geo_utils.geohash_encode(p_lat, p_lon).startswith(p) for p in prefixes):
+                    geohash_misses += 1
+                    if geohash_misses <= 5:
+                        print(f'geohash miss: origin ({lat:.3f}, {lon:.3f}) r={radius} point ({p_lat:.4f}, {p_lon:.4f})')
+    return checked, box_misses, geohash_misses
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--origins', type=int, default=400)
+    parser.add_argument('--points', type=int, default=400)
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    checked, box_misses, geohash_misses = check(args.origins, args.points, random.Random(args.seed))
+    print(f'{checked} points inside the radius: {box_misses} outside the box, {geohash_misses} outside the geohash cover')
+    sys.exit(1 if box_misses or geohash_misses else 0)
+
+
+if __name__ == '__main__':
+    main()
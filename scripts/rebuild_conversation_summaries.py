@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+"""
+Пересчёт conversation_summaries из private_messages (бэкфилл или исправление рассинхрона)
+и, в той же транзакции, счётчиков user_unread_counters по пересчитанным сводкам
+
+Запуск: TIMEWEB_DB_URL=postgresql://... python3 scripts/rebuild_conversation_summaries.py [--user-id 123]
+"""
+import argparse
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'backend'))
+from db_utils import get_connection, close_pool
+from reconcile_unread_counters import reconcile_counters
+
+
+def rebuild(user_id=None):
+    conn = get_connection()
+    cur = conn.cursor()
+    scope_sql = 'AND side.user_id = %s' if user_id else ''
+    scope_args = [user_id] if user_id else []
+
+    # Всё в одной транзакции: входящие видят либо старую, либо пересчитанную сводку.
+    # Строки не удаляются целиком — в них хранится водяной знак прочтения (V0048).
+    # record_message/mark_conversation_read меняют сводки в своих транзакциях — без
+    # блокировки их +1 или новый водяной знак перетёрлись бы пересчитанным значением.
+    # Порядок тот же, что у них: сводки, затем счётчики (reconcile_counters)
+    cur.execute("LOCK TABLE conversation_summaries IN SHARE ROW EXCLUSIVE MODE")
+    cur.execute(f"""
+        CREATE TEMP TABLE actual_summaries ON COMMIT DROP AS
+        SELECT DISTINCT ON (side.user_id, side.peer_id)
+               side.user_id, side.peer_id, pm.conversation_id, pm.id, pm.text, pm.created_at
+        FROM private_messages pm
+        CROSS JOIN LATERAL (VALUES (pm.sender_id, pm.receiver_id), (pm.receiver_id, pm.sender_id))
+            AS side(user_id, peer_id)
+        WHERE pm.sender_id IS NOT NULL AND pm.receiver_id IS NOT NULL {scope_sql}
+        ORDER BY side.user_id, side.peer_id, pm.created_at DESC, pm.id DESC
+    """, scope_args)
+    cur.execute(f"""
+        DELETE FROM conversation_summaries cs
+        WHERE {'cs.user_id = %s AND' if user_id else ''} NOT EXISTS (
+            SELECT 1 FROM actual_summaries a WHERE a.user_id = cs.user_id AND a.peer_id = cs.peer_id
+        )
+    """, scope_args)
+    deleted = cur.rowcount
+    cur.execute("""
+        INSERT INTO conversation_summaries
+            (user_id, peer_id, conversation_id, last_message_id, last_message, last_message_at)
+        SELECT user_id, peer_id, conversation_id, id, text, created_at FROM actual_summaries
+        ON CONFLICT (user_id, peer_id) DO UPDATE SET
+            conversation_id = EXCLUDED.conversation_id,
+            last_message_id = EXCLUDED.last_message_id,
+            last_message = EXCLUDED.last_message,
+            last_message_at = EXCLUDED.last_message_at
+    """)
+    written = cur.rowcount
+    cur.execute("""
+        UPDATE conversation_summaries cs
+        SET unread_count = (
+            SELECT COUNT(*) FROM private_messages pm
+            WHERE pm.conversation_id = cs.conversation_id
+              AND pm.sender_id = cs.peer_id AND pm.receiver_id = cs.user_id
+              AND pm.id > COALESCE(cs.last_read_message_id, 0)
+        )
+        FROM actual_summaries a
+        WHERE a.user_id = cs.user_id AND a.peer_id = cs.peer_id
+    """)
+    # Значок считается по тем же водяным знакам — сверяем его до коммита
+    drifted = reconcile_counters(cur)
+    conn.commit()
+    cur.close()
+    conn.close()
+    return deleted, written, len(drifted)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--user-id', type=int, help='rebuild the inbox of one user only')
+    args = parser.parse_args()
+
+    deleted, written, drifted = rebuild(args.user_id)
+    print(f'✅ conversation_summaries rebuilt: {deleted} rows removed, {written} rows written, '
+          f'{drifted} unread counters fixed')
+    close_pool()
+
+
+if __name__ == '__main__':
+    main()
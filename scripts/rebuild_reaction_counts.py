@@ -0,0 +1,53 @@
+#!/usr/bin/env python3
+"""
+Пересчёт message_reaction_counts из message_reactions (бэкфилл или исправление рассинхрона)
+
+Запуск: TIMEWEB_DB_URL=postgresql://... python3 scripts/rebuild_reaction_counts.py [--message-id 123]
+"""
+import argparse
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'backend'))
+from db_utils import get_connection, close_pool
+
+
+def rebuild(message_id=None):
+    conn = get_connection()
+    cur = conn.cursor()
+    scope_sql = 'WHERE message_id = %s' if message_id else ''
+    scope_args = [message_id] if message_id else []
+
+    # Всё в одной транзакции: читатели видят либо старые, либо пересчитанные счётчики.
+    # Запись счётчиков (add-reaction, admin-users) ждёт конца пересчёта: иначе параллельный
+    # INSERT ... ON CONFLICT упал бы на уникальности или его +1 перетёрся бы пересчётом.
+    # Чтение ленты (SELECT) блокировка не задерживает
+    cur.execute("LOCK TABLE message_reaction_counts IN SHARE ROW EXCLUSIVE MODE")
+    cur.execute(f"DELETE FROM message_reaction_counts {scope_sql}", scope_args)
+    deleted = cur.rowcount
+    cur.execute(f"""
+        INSERT INTO message_reaction_counts (message_id, emoji, count)
+        SELECT message_id, emoji, COUNT(*)
+        FROM message_reactions
+        {scope_sql or 'WHERE message_id IS NOT NULL'}
+        GROUP BY message_id, emoji
+    """, scope_args)
+    inserted = cur.rowcount
+    conn.commit()
+    cur.close()
+    conn.close()
+    return deleted, inserted
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--message-id', type=int, help='rebuild counters of one message only')
+    args = parser.parse_args()
+
+    deleted, inserted = rebuild(args.message_id)
+    print(f'✅ message_reaction_counts rebuilt: {deleted} rows removed, {inserted} rows written')
+    close_pool()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+"""
+Сверка user_unread_counters с private_messages: исправляет только разошедшиеся счётчики.
+Можно запускать по расписанию (cron) — пишет только строки с расхождением
+
+Запуск: TIMEWEB_DB_URL=postgresql://... python3 scripts/reconcile_unread_counters.py [--dry-run]
+"""
+import argparse
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'backend'))
+from db_utils import get_connection, close_pool
+
+# Непрочитанные — сообщения собеседника после водяного знака диалога (V0048)
+ACTUAL_SQL = """
+    SELECT pm.receiver_id AS user_id, COUNT(*) AS unread
+    FROM private_messages pm
+    LEFT JOIN conversation_summaries cs ON cs.user_id = pm.receiver_id AND cs.peer_id = pm.sender_id
+    WHERE pm.receiver_id IS NOT NULL AND pm.receiver_id <> pm.sender_id
+      AND pm.id > COALESCE(cs.last_read_message_id, 0)
+    GROUP BY pm.receiver_id
+"""
+
+
+def reconcile_counters(cur, dry_run=False):
+    """
+    Rewrite drifted counters in the caller's transaction (not committed).
+    Also used by rebuild_conversation_summaries.py after it rebuilds the watermarks
+    """
+    # Блокируем запись счётчиков на время сверки: private-messages меняет их в своей
+    # транзакции, и без блокировки параллельный +1 перетёрся бы пересчитанным значением.
+    # Чтение значка (SELECT) блокировка не задерживает
+    cur.execute("LOCK TABLE user_unread_counters IN SHARE ROW EXCLUSIVE MODE")
+    cur.execute(f"""
+        WITH actual AS ({ACTUAL_SQL})
+        SELECT COALESCE(a.user_id, c.user_id), COALESCE(c.unread_count, 0), COALESCE(a.unread, 0)
+        FROM actual a
+        FULL JOIN user_unread_counters c ON c.user_id = a.user_id
+        WHERE COALESCE(c.unread_count, 0) <> COALESCE(a.unread, 0)
+    """)
+    drifted = cur.fetchall()
+
+    if drifted and not dry_run:
+        cur.execute("""
+            INSERT INTO user_unread_counters AS c (user_id, unread_count)
+            SELECT * FROM unnest(%s::int[], %s::int[])
+            ON CONFLICT (user_id) DO UPDATE SET
+                unread_count = EXCLUDED.unread_count,
+                updated_at = (CURRENT_TIMESTAMP AT TIME ZONE 'UTC')
+        """, ([row[0] for row in drifted], [row[2] for row in drifted]))
+    return drifted
+
+
+def reconcile(dry_run=False):
+    conn = get_connection()
+    cur = conn.cursor()
+    drifted = reconcile_counters(cur, dry_run)
+    if drifted and not dry_run:
+        conn.commit()
+    else:
+        conn.rollback()
+    cur.close()
+    conn.close()
+    return drifted
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--dry-run', action='store_true', help='only report drifted counters')
+    args = parser.parse_args()
+
+    drifted = reconcile(args.dry_run)
+    for user_id, stored, actual in drifted[:20]:
+        print(f'  user {user_id}: counter {stored}, actual {actual}')
+    action = 'found' if args.dry_run else 'fixed'
+    print(f'✅ user_unread_counters reconciled: {len(drifted)} drifted counters {action}')
+    close_pool()
+
+
+if __name__ == '__main__':
+    main()
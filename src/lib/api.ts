@@ -69,6 +69,16 @@ export const api = {
     return res.json();
   },
 
+  async getUsers(userIds: number[], fields?: string[]) {
+    // Profile cards of a whole list in one request; fields skips what the view doesn't show
+    if (userIds.length === 0) return {};
+    const params = new URLSearchParams({ ids: userIds.join(',') });
+    if (fields) params.set('fields', fields.join(','));
+    const res = await fetch(`${FUNCTIONS['get-user']}?${params}`);
+    const data = await res.json();
+    return (data.users || {}) as Record<string, { id: number; [key: string]: any }>;
+  },
+
   async updateActivity(userId: string) {
     const res = await fetch(FUNCTIONS['update-activity'], {
       method: 'POST',
@@ -139,6 +149,14 @@ export const api = {
     return res.json();
   },
 
+  async getRecentMessagesBatch(peerIds: number[], userId: string, perPeer = 20) {
+    // One request for several chats: { conversations: [{ userId, messages }] }
+    const res = await fetch(`${FUNCTIONS['private-messages']}?otherUserIds=${peerIds.join(',')}&perPeer=${perPeer}`, {
+      headers: this.headers(userId),
+    });
+    return res.json();
+  },
+
   async deleteMessage(messageId: number, userId: string) {
     const res = await fetch(`${FUNCTIONS['private-messages']}?messageId=${messageId}`, {
       method: 'DELETE',
@@ -152,13 +170,20 @@ export const api = {
   },
 
   async getUnreadCount(userId: string) {
-    // Use get-conversations which includes unread counts
-    const res = await fetch(FUNCTIONS['get-conversations'], {
+    // unread-count reads the maintained per-user counter (no scan of conversations)
+    const res = await fetch(FUNCTIONS['unread-count'], {
       headers: this.headers(userId),
     });
     const data = await res.json();
-    const total = data.conversations?.reduce((sum: number, conv: any) => sum + (conv.unreadCount || 0), 0) || 0;
-    return { unreadCount: total };
+    return { unreadCount: data.unreadCount || 0 };
+  },
+
+  async getPresence(userIds: number[]) {
+    // One request for the status dots of a whole list instead of get-user per avatar
+    if (userIds.length === 0) return [];
+    const res = await fetch(`${FUNCTIONS['presence']}?ids=${userIds.join(',')}`);
+    const data = await res.json();
+    return (data.presence || []) as { userId: number; status: 'online' | 'offline'; last_seen: string | null }[];
   },
 
   // Subscriptions
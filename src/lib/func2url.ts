@@ -1,5 +1,5 @@
 // API Gateway Configuration - proxies all backend functions
-const API_GATEWAY = 'https://auxchat.ru/api';
+export const API_GATEWAY = 'https://auxchat.ru/api';
 
 // Function names that are proxied through API Gateway
 const FUNCTION_NAMES = [
@@ -28,6 +28,8 @@ const FUNCTION_NAMES = [
   'geocode',
   'update-location',
   'typing-status',
+  'unread-count',
+  'presence',
 ];
 
 // Generate FUNCTIONS object with API Gateway URLs
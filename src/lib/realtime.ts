@@ -0,0 +1,135 @@
+// Realtime - одно WebSocket-соединение со шлюзом вместо опроса private-messages,
+// typing-status и update-activity. Пока сокет не открыт, страницы опрашивают HTTP как раньше
+import { API_GATEWAY } from './func2url';
+
+export type RealtimeEvent = { type: string; [key: string]: any };
+type Listener = (event: RealtimeEvent) => void;
+
+const HEARTBEAT_INTERVAL = 10000;
+const MAX_RECONNECT_DELAY = 30000;
+
+class RealtimeClient {
+  private socket: WebSocket | null = null;
+  private listeners = new Set<Listener>();
+  private reconnectDelay = 1000;
+  private reconnectTimer: ReturnType<typeof setTimeout> | null = null;
+  private heartbeatTimer: ReturnType<typeof setInterval> | null = null;
+  private watchedUserIds: number[] = [];
+  private users = 0;
+
+  private url(token: string) {
+    return `${API_GATEWAY.replace(/^http/, 'ws')}/ws?token=${encodeURIComponent(token)}`;
+  }
+
+  // Каждая страница вызывает connect() при монтировании и disconnect() при размонтировании
+  connect() {
+    this.users += 1;
+    this.open();
+  }
+
+  disconnect() {
+    this.users = Math.max(0, this.users - 1);
+    if (this.users === 0) {
+      this.close();
+    }
+  }
+
+  isOpen() {
+    return this.socket !== null && this.socket.readyState === WebSocket.OPEN;
+  }
+
+  subscribe(listener: Listener) {
+    this.listeners.add(listener);
+    return () => {
+      this.listeners.delete(listener);
+    };
+  }
+
+  send(frame: RealtimeEvent) {
+    if (this.isOpen()) {
+      this.socket!.send(JSON.stringify(frame));
+      return true;
+    }
+    return false;
+  }
+
+  watchPresence(userIds: number[]) {
+    this.watchedUserIds = userIds;
+    this.send({ type: 'watch_presence', userIds });
+  }
+
+  private open() {
+    const token = localStorage.getItem('auxchat_token');
+    if (!token || this.socket || typeof WebSocket === 'undefined') {
+      return;
+    }
+    const socket = new WebSocket(this.url(token));
+    this.socket = socket;
+
+    socket.onopen = () => {
+      this.reconnectDelay = 1000;
+      if (this.watchedUserIds.length > 0) {
+        this.send({ type: 'watch_presence', userIds: this.watchedUserIds });
+      }
+      this.heartbeatTimer = setInterval(() => {
+        if (!document.hidden) {
+          this.send({ type: 'heartbeat' });
+        }
+      }, HEARTBEAT_INTERVAL);
+      this.emit({ type: 'open' });
+    };
+
+    socket.onmessage = (message) => {
+      try {
+        this.emit(JSON.parse(message.data));
+      } catch (error) {
+        console.error('[REALTIME] Bad frame:', error);
+      }
+    };
+
+    socket.onclose = () => {
+      // Сокет закрыт нами через close() — новый мог уже открыться
+      if (this.socket !== socket) {
+        return;
+      }
+      this.socket = null;
+      this.stopHeartbeat();
+      this.emit({ type: 'close' });
+      // Переподключаемся с экспоненциальной паузой, пока сокет кому-то нужен
+      if (this.users > 0 && !this.reconnectTimer) {
+        this.reconnectTimer = setTimeout(() => {
+          this.reconnectTimer = null;
+          this.open();
+        }, this.reconnectDelay);
+        this.reconnectDelay = Math.min(this.reconnectDelay * 2, MAX_RECONNECT_DELAY);
+      }
+    };
+  }
+
+  private stopHeartbeat() {
+    if (this.heartbeatTimer) {
+      clearInterval(this.heartbeatTimer);
+      this.heartbeatTimer = null;
+    }
+  }
+
+  private close() {
+    this.stopHeartbeat();
+    if (this.reconnectTimer) {
+      clearTimeout(this.reconnectTimer);
+      this.reconnectTimer = null;
+    }
+    if (this.socket) {
+      const socket = this.socket;
+      this.socket = null;
+      socket.close();
+      this.emit({ type: 'close' });
+    }
+  }
+
+  private emit(event: RealtimeEvent) {
+    this.listeners.forEach((listener) => listener(event));
+  }
+}
+
+export const realtime = new RealtimeClient();
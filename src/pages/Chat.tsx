@@ -7,6 +7,7 @@ import MessageList from '@/components/chat/MessageList';
 import MessageInput from '@/components/chat/MessageInput';
 import { FUNCTIONS } from '@/lib/func2url';
 import { api } from '@/lib/api';
+import { realtime, RealtimeEvent } from '@/lib/realtime';
 
 interface Message {
   id: number;
@@ -41,7 +42,13 @@ export default function Chat() {
   const [isBlocked, setIsBlocked] = useState(false);
   const [checkingBlock, setCheckingBlock] = useState(false);
   const [menuOpen, setMenuOpen] = useState(false);
-  const [messageLimit, setMessageLimit] = useState(50);
+  // Сколько сообщений держим в ленте (растёт при «Загрузить ещё») и id последнего
+  // показанного — refs, а не state, чтобы их видели колбэки интервалов и WebSocket
+  const messageLimitRef = useRef(50);
+  const newestMessageIdRef = useRef<number | null>(null);
+  // Профиль собеседника для уведомлений: подписка на WebSocket создаётся один раз на чат
+  // и через замыкание видела бы профиль на момент подписки (обычно ещё null)
+  const profileRef = useRef<UserProfile | null>(null);
   const [hasMoreMessages, setHasMoreMessages] = useState(false);
   const [loadingMore, setLoadingMore] = useState(false);
   const [isTyping, setIsTyping] = useState(false);
@@ -49,6 +56,10 @@ export default function Chat() {
 
   const currentUserId = localStorage.getItem('auxchat_user_id');
 
+  useEffect(() => {
+    profileRef.current = profile;
+  }, [profile]);
+
   const updateActivity = async () => {
     console.log('[UPDATE-ACTIVITY] Called, hidden:', document.hidden, 'userId:', currentUserId);
     // НЕ обновляем активность если вкладка неактивна или пользователь не залогинен
@@ -80,10 +91,45 @@ export default function Chat() {
     loadCurrentUserProfile();
     loadMessages();
     checkBlockStatus();
-    const messagesInterval = setInterval(loadMessages, 3000);
-    const profileInterval = setInterval(loadProfile, 2000);
-    const typingInterval = setInterval(checkTypingStatus, 2000);
-    const activityInterval = setInterval(updateActivity, 10000);
+    
+    // Пока WebSocket открыт, события приходят по нему, а опрос ниже пропускается
+    const peerId = Number(userId);
+    let typingResetTimer: ReturnType<typeof setTimeout> | null = null;
+    realtime.connect();
+    realtime.watchPresence([peerId]);
+    const unsubscribe = realtime.subscribe((event: RealtimeEvent) => {
+      if (event.type === 'private_message' || event.type === 'private_message_deleted') {
+        const { senderId, receiverId } = event.message || event;
+        if (senderId === peerId || receiverId === peerId) {
+          if (event.type === 'private_message') {
+            pollNewMessages();
+          } else {
+            loadMessages();
+          }
+        }
+      } else if (event.type === 'messages_read' && event.readerId === peerId) {
+        loadMessages();
+      } else if (event.type === 'typing' && event.userId === peerId) {
+        setIsTyping(true);
+        if (typingResetTimer) clearTimeout(typingResetTimer);
+        typingResetTimer = setTimeout(() => setIsTyping(false), 3000);
+      } else if (event.type === 'presence' && event.userId === peerId) {
+        setProfile((prev) => (prev ? { ...prev, status: event.status } : prev));
+      } else if (event.type === 'open') {
+        // Могли пропустить события, пока сокет переподключался
+        loadMessages();
+      }
+    });
+    
+    // Без сокета раз в 3 с забираем только новые сообщения (after_id), а прочтения
+    // и удаления подтягиваем полной перезагрузкой раз в 30 с
+    const messagesInterval = setInterval(() => { if (!realtime.isOpen()) pollNewMessages(); }, 3000);
+    const messagesFullInterval = setInterval(() => { if (!realtime.isOpen()) loadMessages(); }, 30000);
+    const profileInterval = setInterval(() => { if (!realtime.isOpen()) loadProfile(); }, 2000);
+    const typingInterval = setInterval(() => { if (!realtime.isOpen()) checkTypingStatus(); }, 2000);
+    const activityInterval = setInterval(() => { if (!realtime.isOpen()) updateActivity(); }, 10000);
+    // Профиль (аватар, статус собеседников без WebSocket) при открытом сокете обновляем редко
+    const profileSlowInterval = setInterval(() => { if (realtime.isOpen()) loadProfile(); }, 30000);
     
     // Отслеживаем когда пользователь переключается между вкладками
     const handleVisibilityChange = () => {
@@ -96,9 +142,14 @@ export default function Chat() {
     
     return () => {
       clearInterval(messagesInterval);
+      clearInterval(messagesFullInterval);
       clearInterval(profileInterval);
       clearInterval(typingInterval);
       clearInterval(activityInterval);
+      clearInterval(profileSlowInterval);
+      if (typingResetTimer) clearTimeout(typingResetTimer);
+      unsubscribe();
+      realtime.disconnect();
       document.removeEventListener('visibilitychange', handleVisibilityChange);
     };
   }, [userId]);
@@ -174,7 +225,7 @@ export default function Chat() {
 
   const loadMessages = async (customLimit?: number, isLoadingMore = false) => {
     try {
-      const limit = customLimit || messageLimit;
+      const limit = customLimit || messageLimitRef.current;
       // FUNCTION: private-messages - Получение истории личных сообщений с пользователем (GET)
       const response = await fetch(
         `${FUNCTIONS["private-messages"]}?otherUserId=${userId}&limit=${limit}`,
@@ -190,7 +241,8 @@ export default function Chat() {
       console.log('[CHAT] Loaded messages:', newMessages.length, 'limit:', limit, 'isLoadingMore:', isLoadingMore);
       
       // Проверяем, есть ли ещё сообщения
-      setHasMoreMessages(newMessages.length === limit);
+      setHasMoreMessages(data.hasMore ?? newMessages.length === limit);
+      newestMessageIdRef.current = newMessages.length > 0 ? newMessages[newMessages.length - 1].id : null;
       
       if (lastMessageCountRef.current === 0) {
         lastMessageCountRef.current = newMessages.length;
@@ -199,7 +251,7 @@ export default function Chat() {
         const latestMessage = newMessages[newMessages.length - 1];
         if (String(latestMessage.senderId) !== String(currentUserId)) {
           playNotificationSound();
-          toast.info(`Новое сообщение от ${profile?.username || 'пользователя'}`, {
+          toast.info(`Новое сообщение от ${profileRef.current?.username || 'пользователя'}`, {
             description: latestMessage.text.slice(0, 50) + (latestMessage.text.length > 50 ? '...' : '')
           });
         }
@@ -215,11 +267,72 @@ export default function Chat() {
     }
   };
 
-  const loadMoreMessages = () => {
+  // Дельта для открытого чата: только сообщения новее последнего показанного
+  const pollNewMessages = async () => {
+    if (newestMessageIdRef.current === null) {
+      return loadMessages();
+    }
+    try {
+      // FUNCTION: private-messages - Новые личные сообщения после after_id (GET)
+      const response = await fetch(
+        `${FUNCTIONS["private-messages"]}?otherUserId=${userId}&after_id=${newestMessageIdRef.current}&limit=50`,
+        {
+          headers: {
+            'X-User-Id': currentUserId || '0'
+          }
+        }
+      );
+      const data = await response.json();
+      const newMessages: Message[] = data.messages || [];
+      if (data.hasMore) {
+        // Пропустили слишком много — проще перечитать ленту целиком
+        return loadMessages();
+      }
+      if (newMessages.length === 0) {
+        return;
+      }
+      
+      newestMessageIdRef.current = newMessages[newMessages.length - 1].id;
+      messageLimitRef.current += newMessages.length;
+      lastMessageCountRef.current += newMessages.length;
+      const incoming = newMessages.filter((m) => String(m.senderId) !== String(currentUserId));
+      if (incoming.length > 0) {
+        const latestMessage = incoming[incoming.length - 1];
+        playNotificationSound();
+        toast.info(`Новое сообщение от ${profileRef.current?.username || 'пользователя'}`, {
+          description: latestMessage.text.slice(0, 50) + (latestMessage.text.length > 50 ? '...' : '')
+        });
+      }
+      setMessages((prev) => [...prev, ...newMessages.filter((m) => !prev.some((p) => p.id === m.id))]);
+    } catch (error) {
+      console.error('Error polling new messages:', error);
+    }
+  };
+
+  const loadMoreMessages = async () => {
+    if (messages.length === 0) return;
     setLoadingMore(true);
-    const newLimit = messageLimit + 50;
-    setMessageLimit(newLimit);
-    loadMessages(newLimit, true); // Передаём флаг isLoadingMore
+    try {
+      // FUNCTION: private-messages - Более старая страница истории до before_id (GET)
+      const response = await fetch(
+        `${FUNCTIONS["private-messages"]}?otherUserId=${userId}&before_id=${messages[0].id}&limit=50`,
+        {
+          headers: {
+            'X-User-Id': currentUserId || '0'
+          }
+        }
+      );
+      const data = await response.json();
+      const olderMessages: Message[] = data.messages || [];
+      messageLimitRef.current += olderMessages.length;
+      lastMessageCountRef.current += olderMessages.length;
+      setHasMoreMessages(Boolean(data.hasMore));
+      setMessages((prev) => [...olderMessages.filter((m) => !prev.some((p) => p.id === m.id)), ...prev]);
+    } catch (error) {
+      console.error('Error loading older messages:', error);
+    } finally {
+      setLoadingMore(false);
+    }
   };
 
   const checkBlockStatus = async () => {
@@ -313,6 +426,9 @@ export default function Chat() {
 
   // Отправка статуса "печатает"
   const sendTypingStatus = async () => {
+    if (realtime.send({ type: 'typing', to: Number(userId) })) {
+      return;
+    }
     try {
       await fetch(FUNCTIONS["typing-status"], {
         method: 'POST',
@@ -413,7 +529,7 @@ export default function Chat() {
           <MessageInput
             currentUserId={currentUserId}
             receiverId={Number(userId)}
-            onMessageSent={loadMessages}
+            onMessageSent={pollNewMessages}
             onTyping={handleTyping}
           />
         </div>
@@ -99,7 +99,7 @@ const Index = () => {
   const loadUnreadCount = async () => {
     if (!userId) return;
     try {
-      // FUNCTION: get-conversations - Получение количества непрочитанных личных сообщений
+      // FUNCTION: unread-count - Получение количества непрочитанных личных сообщений
       const data = await api.getUnreadCount(userId.toString());
       const total = data.unreadCount || 0;
 
@@ -5,6 +5,7 @@ import { Card } from '@/components/ui/card';
 import { Avatar, AvatarFallback, AvatarImage } from '@/components/ui/avatar';
 import Icon from '@/components/ui/icon';
 import { FUNCTIONS } from '@/lib/func2url';
+import { api } from '@/lib/api';
 
 interface SubscribedUser {
   id: number;
@@ -37,14 +38,13 @@ export default function Subscriptions() {
         }
       );
       const data = await response.json();
-      const userIds = data.subscribedUserIds || [];
+      const userIds: number[] = data.subscribedUserIds || [];
       
-      const usersPromises = userIds.map(async (id: number) => {
-        // FUNCTION: get-user - Получение данных пользователя
-        const userResponse = await fetch(
-          `${FUNCTIONS["get-user"]}?user_id=${id}`
-        );
-        const userData = await userResponse.json();
+      // FUNCTION: get-user - Имена всех подписок одним запросом (ids + fields)
+      const cards = await api.getUsers(userIds, ['username']);
+      
+      const usersPromises = userIds.filter((id) => cards[id]).map(async (id: number) => {
+        const userData = cards[id];
         
         // FUNCTION: profile-photos - Получение фотографий для аватара
         const photosResponse = await fetch(